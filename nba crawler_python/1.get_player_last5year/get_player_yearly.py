@@ -25,6 +25,13 @@ SEASONS_DIR = "seasons"
 LOG_DIR = "logs"
 CACHE_DIR = "cache"  # 新增快取目錄
 
+# 球員個人資料存儲：以 PERSON_ID 為鍵，所有賽季共用，CommonPlayerInfo 每名球員只請求一次
+PERSON_STORE_FILE = os.path.join(PROGRESS_DIR, "person_store.pkl")
+
+# extract_player_ids 產生的賽季相關欄位（不存入球員存儲）
+BASIC_INFO_KEYS = ['id', 'full_name', 'team_id', 'team_abbreviation', 'age', 'gp', 'min',
+                   'pts', 'reb', 'ast', 'season', 'games_started', 'player_position']
+
 # 設置日誌系統
 def setup_logging():
     """設置日誌系統"""
@@ -310,90 +317,87 @@ def get_player_detailed_info(player_id, max_retries=3, retry_delay=2):
                     logger.error(f"已達最大重試次數 {max_retries}，返回空字典")
                     return {}
 
-def load_progress(season):
+def load_person_store():
     """
-    加載處理進度
+    加載球員個人資料存儲（以 PERSON_ID 為鍵，跨賽季共用）
     
-    參數:
-    season (str): 賽季，用於識別進度文件
+    存儲不存在時，以舊的各賽季進度文件中已獲取的詳細資料初始化，避免重新請求
     
     返回:
-    dict: 包含處理進度的字典
+    dict: {'persons': {球員ID: CommonPlayerInfo 資料}, 'failed_players': 失敗的球員ID集合}
     """
-    progress_file = os.path.join(PROGRESS_DIR, f"player_season_data_progress_{season}.pkl")
+    if os.path.exists(PERSON_STORE_FILE):
+        try:
+            with open(PERSON_STORE_FILE, 'rb') as f:
+                store = pickle.load(f)
+            logger.info(f"從球員存儲中恢復 {len(store['persons'])} 名球員的詳細資料")
+            return store
+        except Exception as e:
+            logger.error(f"讀取球員存儲時出錯: {e}")
+    
+    store = {'persons': {}, 'failed_players': set()}
     
-    if os.path.exists(progress_file):
+    # 匯入舊的各賽季進度文件
+    for season in SEASONS:
+        progress_file = os.path.join(PROGRESS_DIR, f"player_season_data_progress_{season}.pkl")
+        if not os.path.exists(progress_file):
+            continue
         try:
             with open(progress_file, 'rb') as f:
                 progress = pickle.load(f)
-            logger.info(f"從進度文件中恢復，{season} 賽季已處理 {len(progress.get('processed_players', []))} 名球員")
-            return progress
+            for player in progress.get('players', []):
+                person = {k: v for k, v in player.items() if k not in BASIC_INFO_KEYS}
+                store['persons'].setdefault(player['id'], person)
         except Exception as e:
-            logger.error(f"讀取進度文件時出錯: {e}")
+            logger.warning(f"匯入 {season} 賽季進度文件時出錯: {e}")
     
-    # 如果沒有進度文件或加載失敗，創建新的進度記錄
-    return {
-        'processed_players': set(),  # 已處理的球員ID集合
-        'failed_players': set(),     # 處理失敗的球員ID集合
-        'players': []                # 已處理球員的詳細資料
-    }
-
-def save_progress(progress, season):
-    """
-    保存處理進度
-    
-    參數:
-    progress (dict): 包含處理進度的字典
-    season (str): 賽季，用於識別進度文件
-    """
-    progress_file = os.path.join(PROGRESS_DIR, f"player_season_data_progress_{season}.pkl")
+    if store['persons']:
+        logger.info(f"已從舊的進度文件匯入 {len(store['persons'])} 名球員的詳細資料")
     
+    return store
+
+def save_person_store(store):
+    """以原子方式保存球員存儲，並保存一個JSON摘要方便查看"""
     try:
-        with open(progress_file, 'wb') as f:
-            pickle.dump(progress, f)
+        tmp_file = PERSON_STORE_FILE + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(store, f)
+        os.replace(tmp_file, PERSON_STORE_FILE)
         
-        # 同時保存一個JSON版本，方便查看
         json_progress = {
-            'processed_players': list(progress['processed_players']),
-            'failed_players': list(progress['failed_players']),
-            'processed_count': len(progress['processed_players']),
-            'failed_count': len(progress['failed_players'])
+            'processed_players': list(store['persons']),
+            'failed_players': list(store['failed_players']),
+            'processed_count': len(store['persons']),
+            'failed_count': len(store['failed_players'])
         }
         
-        with open(os.path.join(PROGRESS_DIR, f"player_season_data_progress_{season}.json"), 'w', encoding='utf-8') as f:
+        with open(os.path.join(PROGRESS_DIR, "person_store_progress.json"), 'w', encoding='utf-8') as f:
             json.dump(json_progress, f, ensure_ascii=False, indent=4)
-            
-        logger.info(f"{season} 賽季進度已保存: 已處理 {len(progress['processed_players'])} 名球員，失敗 {len(progress['failed_players'])} 名球員")
+        
+        logger.info(f"球員存儲已保存: 已處理 {len(store['persons'])} 名球員，失敗 {len(store['failed_players'])} 名球員")
     except Exception as e:
-        logger.error(f"保存進度文件時出錯: {e}")
+        logger.error(f"保存球員存儲時出錯: {e}")
 
 # 使用並行處理獲取球員詳細資料
-def process_player_batch(players_batch, max_retries=3, retry_delay=2):
+def fetch_person_batch(person_ids, max_retries=3, retry_delay=2):
     """
-    並行處理一批球員的詳細資料
+    處理一批球員的詳細資料
     
     參數:
-    players_batch (list): 包含球員基本資料的列表
+    person_ids (list): 球員ID列表
     max_retries (int): 最大重試次數
     retry_delay (int): 重試間隔時間（秒）
     
     返回:
-    list: 包含(player_id, player_full_info)元組的列表，如果失敗則player_full_info為None
+    list: 包含(player_id, detailed_info)元組的列表，如果失敗則detailed_info為None
     """
     results = []
-    for player in players_batch:
-        player_id = player["id"]
+    for player_id in person_ids:
         try:
             # 獲取詳細資料
             detailed_info = get_player_detailed_info(player_id, max_retries, retry_delay)
+            results.append((player_id, detailed_info or None))
             
-            if detailed_info:
-                # 將基本資料和詳細資料合併
-                player_full_info = {**player, **detailed_info}
-                results.append((player_id, player_full_info))
-            else:
-                results.append((player_id, None))
-                
             # 短暫延遲避免API限制
             time.sleep(0.2)
             
@@ -403,147 +407,97 @@ def process_player_batch(players_batch, max_retries=3, retry_delay=2):
     
     return results
 
-def get_all_players_detailed_info(players, season, max_players=None, max_workers=3, batch_size=10, max_consecutive_errors=10):
+def fill_person_store(person_ids, store, max_workers=3, batch_size=10, max_consecutive_errors=10):
     """
-    獲取所有球員的詳細資料，使用並行處理
+    為存儲中尚未有資料的球員獲取 CommonPlayerInfo，每名球員只請求一次
     
     參數:
-    players (list): 包含球員基本資料的列表
-    season (str): 賽季，用於檔案命名和進度管理
-    max_players (int, optional): 最大處理球員數量，用於測試
+    person_ids (set): 所有賽季的球員ID聯集
+    store (dict): 球員存儲
     max_workers (int): 並行處理的最大線程數
     batch_size (int): 每批處理的球員數量
     max_consecutive_errors (int): 最大允許連續錯誤次數
-    
-    返回:
-    list: 包含所有球員詳細資料的列表
     """
-    # 過濾出特定賽季的球員
-    season_players = [p for p in players if p.get('season') == season]
-    
-    # 確定要處理的球員數量
-    players_to_process = season_players[:max_players] if max_players else season_players
-    total_players = len(players_to_process)
-    
-    logger.info(f"開始獲取 {season} 賽季 {total_players} 名球員的詳細資料...")
-    
-    # 加載進度
-    progress = load_progress(season)
-    detailed_players = progress.get('players', [])
-    processed_players = progress.get('processed_players', set())
-    failed_players = progress.get('failed_players', set())
+    # 之前失敗的球員不在 persons 中，會一併重試
+    missing_ids = sorted(pid for pid in person_ids if pid not in store['persons'])
+    logger.info(f"共 {len(person_ids)} 名球員，其中 {len(missing_ids)} 名需要獲取詳細資料")
     
-    # 過濾出未處理的球員
-    unprocessed_players = [p for p in players_to_process if p["id"] not in processed_players]
+    if not missing_ids:
+        return
     
-    # 添加之前失敗的球員進行重試
-    retry_players = [p for p in players_to_process if p["id"] in failed_players]
-    unprocessed_players.extend(retry_players)
+    batches = [missing_ids[i:i + batch_size] for i in range(0, len(missing_ids), batch_size)]
     
-    # 清空失敗球員集合，因為我們將重試所有失敗的球員
-    failed_players = set()
-    
-    logger.info(f"需要處理 {len(unprocessed_players)} 名球員（包括 {len(retry_players)} 名重試球員）")
-    
-    # 分批處理球員
-    batches = [unprocessed_players[i:i + batch_size] for i in range(0, len(unprocessed_players), batch_size)]
+    def record_batch(future):
+        """將一個批次的結果寫入存儲，返回成功獲取的球員數"""
+        success_count = 0
+        for player_id, detailed_info in future.result():
+            if detailed_info:
+                store['persons'][player_id] = detailed_info
+                store['failed_players'].discard(player_id)
+                success_count += 1
+            else:
+                store['failed_players'].add(player_id)
+        return success_count
     
     consecutive_errors = 0
+    recorded = set()
+    future_to_batch = {}
     try:
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            for batch_idx, batch in enumerate(batches):
-                logger.info(f"處理第 {batch_idx+1}/{len(batches)} 批球員（{len(batch)} 名球員）")
-                
-                # 提交批次處理任務
-                future = executor.submit(process_player_batch, batch)
-                
-                try:
-                    # 獲取結果
-                    results = future.result()
+            future_to_batch = {executor.submit(fetch_person_batch, batch): batch for batch in batches}
+            
+            try:
+                for batch_idx, future in enumerate(concurrent.futures.as_completed(future_to_batch)):
+                    batch = future_to_batch[future]
+                    recorded.add(future)
                     
-                    # 處理結果
-                    success_count = 0
-                    for player_id, player_info in results:
-                        if player_info:
-                            detailed_players.append(player_info)
-                            processed_players.add(player_id)
-                            if player_id in failed_players:
-                                failed_players.remove(player_id)
-                            success_count += 1
+                    try:
+                        success_count = record_batch(future)
+                        
+                        # 檢查批次成功率
+                        if success_count == 0:
+                            consecutive_errors += 1
+                            logger.warning(f"批次 {batch_idx+1}/{len(batches)} 完全失敗，連續失敗批次數: {consecutive_errors}")
                         else:
-                            failed_players.add(player_id)
+                            consecutive_errors = 0  # 重置連續錯誤計數
                     
-                    # 檢查批次成功率
-                    if success_count == 0 and len(batch) > 0:
+                    except Exception as e:
+                        logger.error(f"處理第 {batch_idx+1} 批球員時出錯: {e}")
+                        logger.error(traceback.format_exc())
+                        store['failed_players'].update(batch)
                         consecutive_errors += 1
-                        logger.warning(f"批次 {batch_idx+1} 完全失敗，連續失敗批次數: {consecutive_errors}")
-                    else:
-                        consecutive_errors = 0  # 重置連續錯誤計數
                     
                     # 檢查連續錯誤次數
                     if consecutive_errors >= max_consecutive_errors:
-                        error_msg = f"檢測到 {consecutive_errors} 次連續批次錯誤，中斷處理"
-                        logger.error(error_msg)
-                        raise Exception(error_msg)
-                    
-                    # 每處理3批，保存一次進度
-                    if (batch_idx + 1) % 3 == 0 or batch_idx == len(batches) - 1:
-                        # 更新進度
-                        progress['players'] = detailed_players
-                        progress['processed_players'] = processed_players
-                        progress['failed_players'] = failed_players
-                        
-                        # 保存進度
-                        save_progress(progress, season)
-                        
-                        # 保存CSV檔案
-                        csv_filename = os.path.join(SEASONS_DIR, season, f"nba_players_{season}_detailed_progress.csv")
-                        save_to_csv(detailed_players, csv_filename)
-                        
-                        # 保存JSON檔案
-                        json_filename = os.path.join(SEASONS_DIR, season, f"nba_players_{season}_detailed_progress.json")
-                        save_to_json(detailed_players, json_filename)
-                        
-                        logger.info(f"進度已保存: {len(processed_players)}/{total_players}，{season} 賽季資料已保存到檔案")
-                
-                except Exception as e:
-                    if "檢測到" in str(e) and "連續批次錯誤" in str(e):
-                        # 這是我們自己拋出的連續錯誤異常，直接向上傳播
-                        raise
+                        logger.error(f"檢測到 {consecutive_errors} 次連續批次錯誤，中斷處理")
+                        for pending in future_to_batch:
+                            pending.cancel()
+                        break
                     
-                    logger.error(f"處理第 {batch_idx+1} 批球員時出錯: {e}")
-                    logger.error(traceback.format_exc())
-                    consecutive_errors += 1
-                    
-                    # 檢查連續錯誤次數
-                    if consecutive_errors >= max_consecutive_errors:
-                        error_msg = f"檢測到 {consecutive_errors} 次連續批次錯誤，中斷處理"
-                        logger.error(error_msg)
-                        raise Exception(error_msg)
+                    # 每處理3批，保存一次存儲
+                    if (batch_idx + 1) % 3 == 0:
+                        save_person_store(store)
+            
+            except KeyboardInterrupt:
+                # 取消尚未開始的批次，離開 with 時只等待正在執行的批次
+                logger.warning("程序被中斷，取消尚未開始的批次...")
+                for pending in future_to_batch:
+                    pending.cancel()
+                raise
     
-    except (KeyboardInterrupt, Exception) as e:
-        if isinstance(e, KeyboardInterrupt):
-            logger.warning(f"程序被中斷，保存 {season} 賽季當前進度...")
-        else:
-            logger.error(f"處理球員詳細資料時發生錯誤: {e}")
-            logger.error(traceback.format_exc())
-        
-        # 更新進度
-        progress['players'] = detailed_players
-        progress['processed_players'] = processed_players
-        progress['failed_players'] = failed_players
-        
-        # 保存進度
-        save_progress(progress, season)
-        
-        # 保存中間結果
-        csv_filename = os.path.join(SEASONS_DIR, season, f"nba_players_{season}_detailed_progress.csv")
-        save_to_csv(detailed_players, csv_filename)
-        
-        json_filename = os.path.join(SEASONS_DIR, season, f"nba_players_{season}_detailed_progress.json")
-        save_to_json(detailed_players, json_filename)
+    except KeyboardInterrupt:
+        # 保留中斷時已完成但尚未寫入存儲的批次
+        for future in future_to_batch:
+            if future not in recorded and future.done() and not future.cancelled():
+                try:
+                    record_batch(future)
+                except Exception as e:
+                    logger.error(f"處理已完成批次時出錯: {e}")
+        logger.warning("保存當前球員存儲...")
+        raise
     
-    return detailed_players
+    finally:
+        save_person_store(store)
 
 def save_to_csv(data, filename):
     """
@@ -644,118 +598,153 @@ def combine_all_seasons_data():
         logger.warning("沒有找到任何賽季資料，無法合併")
         return False
 
-def process_season(season):
+def fetch_season_players(season):
     """
-    處理特定賽季的球員資料
+    獲取特定賽季的球員名單並保存原始賽季數據
     
     參數:
     season (str): 賽季，格式如 '2023-24'
     
     返回:
-    bool: 處理是否成功
+    list: 球員基本資訊列表；失敗時返回空列表
     """
     logger.info(f"開始處理 {season} 賽季資料")
     
-    try:
-        # 獲取特定賽季的球員數據
-        season_players_df = get_players_by_season(season)
-        
-        if season_players_df.empty:
-            logger.error(f"無法獲取 {season} 賽季的球員數據")
-            return False
-        
-        # 保存原始賽季數據
-        season_dir = os.path.join(SEASONS_DIR, season)
-        save_to_csv(season_players_df, os.path.join(season_dir, f"nba_players_{season}_stats.csv"))
-        save_to_json(season_players_df, os.path.join(season_dir, f"nba_players_{season}_stats.json"))
-        
-        # 提取球員ID和基本資訊
-        players_basic_info = extract_player_ids(season_players_df)
-        
-        if not players_basic_info:
-            logger.error(f"無法提取 {season} 賽季的球員基本資訊")
-            return False
-        
-        # 獲取所有球員的詳細資料，使用並行處理
-        detailed_players = get_all_players_detailed_info(
-            players_basic_info, 
-            season, 
-            max_workers=3,  # 並行處理的最大線程數
-            batch_size=10   # 每批處理的球員數量
-        )
-        
-        # 保存最終詳細資料
-        if detailed_players:
-            save_to_csv(detailed_players, os.path.join(season_dir, f"nba_players_{season}_detailed_final.csv"))
-            save_to_json(detailed_players, os.path.join(season_dir, f"nba_players_{season}_detailed_final.json"))
-            
-            # 分析資料中的一些關鍵信息
-            df = pd.DataFrame(detailed_players)
-            
-            # 輸出資料摘要
-            logger.info(f"{season} 賽季資料摘要：")
-            logger.info(f"- 總共獲取了 {len(detailed_players)} 名球員的詳細資料")
-            
-            # 如果有國籍信息，顯示國籍分布
-            if 'COUNTRY' in df.columns:
-                country_counts = df['COUNTRY'].value_counts()
-                logger.info("球員國籍分布（前10項）：")
-                for country, count in country_counts.head(10).items():
-                    logger.info(f"- {country}: {count} 名球員")
-            
-            # 如果有位置信息，顯示位置分布
-            if 'POSITION' in df.columns:
-                position_counts = df['POSITION'].value_counts()
-                logger.info("球員位置分布：")
-                for position, count in position_counts.items():
-                    logger.info(f"- {position}: {count} 名球員")
-            
-            return True
-        else:
-            logger.warning(f"{season} 賽季沒有獲取到球員詳細資料")
-            return False
+    # 獲取特定賽季的球員數據
+    season_players_df = get_players_by_season(season)
     
-    except Exception as e:
-        logger.error(f"處理 {season} 賽季資料時出錯: {e}")
-        logger.error(traceback.format_exc())
+    if season_players_df.empty:
+        logger.error(f"無法獲取 {season} 賽季的球員數據")
+        return []
+    
+    # 保存原始賽季數據
+    season_dir = os.path.join(SEASONS_DIR, season)
+    save_to_csv(season_players_df, os.path.join(season_dir, f"nba_players_{season}_stats.csv"))
+    save_to_json(season_players_df, os.path.join(season_dir, f"nba_players_{season}_stats.json"))
+    
+    # 提取球員ID和基本資訊
+    players_basic_info = extract_player_ids(season_players_df)
+    
+    if not players_basic_info:
+        logger.error(f"無法提取 {season} 賽季的球員基本資訊")
+    
+    return players_basic_info
+
+def save_season_detailed(season, players_basic_info, store):
+    """
+    將球員存儲中的詳細資料展開到特定賽季的球員名單，並保存最終詳細資料
+    
+    參數:
+    season (str): 賽季，格式如 '2023-24'
+    players_basic_info (list): 該賽季的球員基本資訊
+    store (dict): 球員存儲
+    
+    返回:
+    bool: 處理是否成功
+    """
+    # 將基本資料和詳細資料合併
+    detailed_players = [
+        {**player, **store['persons'][player['id']]}
+        for player in players_basic_info
+        if player['id'] in store['persons']
+    ]
+    
+    if not detailed_players:
+        logger.warning(f"{season} 賽季沒有獲取到球員詳細資料")
         return False
+    
+    # 保存最終詳細資料
+    season_dir = os.path.join(SEASONS_DIR, season)
+    save_to_csv(detailed_players, os.path.join(season_dir, f"nba_players_{season}_detailed_final.csv"))
+    save_to_json(detailed_players, os.path.join(season_dir, f"nba_players_{season}_detailed_final.json"))
+    
+    # 分析資料中的一些關鍵信息
+    df = pd.DataFrame(detailed_players)
+    
+    # 輸出資料摘要
+    logger.info(f"{season} 賽季資料摘要：")
+    logger.info(f"- 總共獲取了 {len(detailed_players)}/{len(players_basic_info)} 名球員的詳細資料")
+    
+    # 如果有國籍信息，顯示國籍分布
+    if 'COUNTRY' in df.columns:
+        country_counts = df['COUNTRY'].value_counts()
+        logger.info("球員國籍分布（前10項）：")
+        for country, count in country_counts.head(10).items():
+            logger.info(f"- {country}: {count} 名球員")
+    
+    # 如果有位置信息，顯示位置分布
+    if 'POSITION' in df.columns:
+        position_counts = df['POSITION'].value_counts()
+        logger.info("球員位置分布：")
+        for position, count in position_counts.items():
+            logger.info(f"- {position}: {count} 名球員")
+    
+    return True
 
-# 並行處理所有賽季
+# 處理所有賽季
 def process_all_seasons(max_workers=2):
     """
-    並行處理所有賽季的資料
+    處理所有賽季的資料
+    
+    1. 並行獲取各賽季的球員名單
+    2. 以所有賽季球員ID的聯集填充球員存儲，每名球員只請求一次 CommonPlayerInfo
+    3. 將存儲中的詳細資料展開到各賽季的 nba_players_{season}_detailed_final.json
     
     參數:
-    max_workers (int): 並行處理的最大賽季數
+    max_workers (int): 並行獲取名單的最大賽季數
     
     返回:
     tuple: (成功處理的賽季列表, 失敗處理的賽季列表)
     """
     successful_seasons = []
     failed_seasons = []
+    season_players = {}
     
-    logger.info(f"開始並行處理所有賽季，最大並行數: {max_workers}")
+    logger.info(f"開始並行獲取所有賽季的球員名單，最大並行數: {max_workers}")
     
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         # 創建賽季處理任務
-        future_to_season = {executor.submit(process_season, season): season for season in SEASONS}
+        future_to_season = {executor.submit(fetch_season_players, season): season for season in SEASONS}
         
         # 獲取結果
         for future in concurrent.futures.as_completed(future_to_season):
             season = future_to_season[future]
             try:
-                success = future.result()
-                if success:
-                    successful_seasons.append(season)
-                    logger.info(f"{season} 賽季資料處理成功")
+                players_basic_info = future.result()
+                if players_basic_info:
+                    season_players[season] = players_basic_info
                 else:
                     failed_seasons.append(season)
-                    logger.warning(f"{season} 賽季資料處理失敗")
+                    logger.warning(f"{season} 賽季球員名單獲取失敗")
             except Exception as e:
                 failed_seasons.append(season)
                 logger.error(f"{season} 賽季處理時發生異常: {e}")
                 logger.error(traceback.format_exc())
     
+    # 以所有賽季的球員ID聯集填充球員存儲
+    person_ids = {player['id'] for players in season_players.values() for player in players}
+    total_rows = sum(len(players) for players in season_players.values())
+    logger.info(f"{len(season_players)} 個賽季共 {total_rows} 筆球員記錄，對應 {len(person_ids)} 名不同球員")
+    
+    store = load_person_store()
+    fill_person_store(person_ids, store, max_workers=3, batch_size=10)
+    
+    # 展開到各賽季
+    for season in SEASONS:
+        if season not in season_players:
+            continue
+        try:
+            if save_season_detailed(season, season_players[season], store):
+                successful_seasons.append(season)
+                logger.info(f"{season} 賽季資料處理成功")
+            else:
+                failed_seasons.append(season)
+                logger.warning(f"{season} 賽季資料處理失敗")
+        except Exception as e:
+            failed_seasons.append(season)
+            logger.error(f"{season} 賽季處理時發生異常: {e}")
+            logger.error(traceback.format_exc())
+    
     return successful_seasons, failed_seasons
 
 def main():
@@ -766,8 +755,8 @@ def main():
         # 設置資料夾結構
         setup_directories()
         
-        # 並行處理所有賽季
-        logger.info("開始並行處理所有賽季資料...")
+        # 處理所有賽季
+        logger.info("開始處理所有賽季資料...")
         successful_seasons, failed_seasons = process_all_seasons(max_workers=2)
         
         # 合併所有賽季資料
@@ -12,9 +12,11 @@ from nba_api.stats.library.http import NBAStatsHTTP
 import logging
 import sys
 import concurrent.futures
+import multiprocessing
 import threading
 import random
 import hashlib
+import calendar
 
 # 設定logging使用UTF-8編碼
 logging.basicConfig(
@@ -36,6 +38,16 @@ request_lock = threading.Lock()
 last_request_time = time.time()
 min_request_interval = 0.6  # 最小請求間隔時間（秒）
 
+# 多進程模式下由 init_shared_rate_limit 設定，所有進程共用同一個請求時間戳
+shared_last_request_time = None
+
+# 傳球數據的時間粒度
+# game: 每場比賽一個請求（原始行為）
+# month: 每個有出賽的月份一個請求
+# season: 整個賽季一個請求
+# window: 自訂日期區間，每個區間一個請求
+GRANULARITIES = ('game', 'month', 'season', 'window')
+
 def setup_logging(log_dir):
     """設置日誌系統"""
     if not os.path.exists(log_dir):
@@ -75,14 +87,22 @@ def optimize_nba_api_headers():
         'Cache-Control': 'no-cache'
     }
 
+def init_shared_rate_limit(lock, shared_time):
+    """工作進程初始化：改用跨進程共享的鎖與時間戳，使所有進程共用同一個請求速率預算"""
+    global request_lock, shared_last_request_time
+    request_lock = lock
+    shared_last_request_time = shared_time
+    optimize_nba_api_headers()
+
 def rate_limited_request(func, *args, **kwargs):
     """控制請求速率的裝飾器函數"""
     global last_request_time
     
     with request_lock:
         # 計算自上次請求以來的時間
+        previous_time = shared_last_request_time.value if shared_last_request_time is not None else last_request_time
         current_time = time.time()
-        elapsed = current_time - last_request_time
+        elapsed = current_time - previous_time
         
         # 如果間隔時間不夠，則等待
         if elapsed < min_request_interval:
@@ -90,6 +110,8 @@ def rate_limited_request(func, *args, **kwargs):
         
         # 更新上次請求時間
         last_request_time = time.time()
+        if shared_last_request_time is not None:
+            shared_last_request_time.value = last_request_time
     
     # 執行實際請求
     return func(*args, **kwargs)
@@ -209,8 +231,9 @@ def get_player_games_in_season(player_id, season_year, season_type="Regular Seas
         logger.error(f"獲取球員ID {player_id} 在 {season_year} 賽季的 {season_type} 比賽記錄時出錯: {e}")
         return pd.DataFrame()
 
-def get_player_pass_data_for_game(player_id, game_date, season_year, season_type="Regular Season"):
-    """獲取指定球員在特定日期比賽的傳球數據"""
+def get_player_pass_data_for_window(player_id, date_from, date_to, season_year, season_type="Regular Season"):
+    """獲取指定球員在特定日期區間的傳球數據（date_from/date_to 為 None 表示整個賽季）"""
+    window_label = date_from if date_from == date_to else f"{date_from or '賽季初'} ~ {date_to or '賽季末'}"
     try:
         # 將年份格式轉換為NBA API需要的格式 (例如: 2023-24)
         season = f"{season_year}-{str(season_year + 1)[-2:]}"
@@ -222,8 +245,8 @@ def get_player_pass_data_for_game(player_id, game_date, season_year, season_type
                 team_id=0,
                 season=season,
                 season_type_all_star=season_type,
-                date_from_nullable=game_date,
-                date_to_nullable=game_date,
+                date_from_nullable=date_from or '',
+                date_to_nullable=date_to or '',
                 timeout=45
             )
             return player_pass.get_data_frames()
@@ -240,8 +263,8 @@ def get_player_pass_data_for_game(player_id, game_date, season_year, season_type
         pass_made_to_teammates = data_frames[0] if len(data_frames) > 0 else pd.DataFrame()
         
         if not pass_made_to_teammates.empty:
-            # 添加日期、賽季和比賽類型列
-            pass_made_to_teammates['GAME_DATE'] = game_date
+            # 添加日期、賽季和比賽類型列（區間數據以區間起始日作為GAME_DATE）
+            pass_made_to_teammates['GAME_DATE'] = date_from
             pass_made_to_teammates['SEASON'] = season
             pass_made_to_teammates['SEASON_TYPE'] = season_type
             pass_made_to_teammates['PLAYER_ID'] = player_id
@@ -256,13 +279,25 @@ def get_player_pass_data_for_game(player_id, game_date, season_year, season_type
         return pass_made_to_teammates
     
     except Exception as e:
-        logger.error(f"獲取球員ID {player_id} 在 {game_date} 的傳球數據時出錯: {e}")
+        logger.error(f"獲取球員ID {player_id} 在 {window_label} 的傳球數據時出錯: {e}")
         return pd.DataFrame()
 
-def get_player_pass_data_with_cache(player_id, game_date, season_year, season_type, cache_dir):
-    """帶緩存的球員傳球數據獲取"""
+def get_player_pass_data_for_game(player_id, game_date, season_year, season_type="Regular Season"):
+    """獲取指定球員在特定日期比賽的傳球數據"""
+    return get_player_pass_data_for_window(player_id, game_date, game_date, season_year, season_type)
+
+def get_player_pass_data_with_cache(player_id, game_date, season_year, season_type, cache_dir, date_to=None):
+    """帶緩存的球員傳球數據獲取
+
+    未指定 date_to 時視為單場比賽（date_to = game_date），緩存鍵與逐場模式相同；
+    區間請求以 "起始~結束" 作為緩存鍵，避免與逐場緩存衝突。
+    """
+    if date_to is None:
+        date_to = game_date
+    window_key = game_date if game_date == date_to else f"{game_date or ''}~{date_to or ''}"
+    
     # 生成緩存鍵和緩存文件路徑
-    cache_key = get_cache_key(player_id, game_date, season_year, season_type)
+    cache_key = get_cache_key(player_id, window_key, season_year, season_type)
     cache_file = os.path.join(cache_dir, f"{cache_key}.pkl")
     
     # 檢查緩存是否存在
@@ -270,13 +305,13 @@ def get_player_pass_data_with_cache(player_id, game_date, season_year, season_ty
         try:
             with open(cache_file, 'rb') as f:
                 data = pickle.load(f)
-                logger.info(f"從緩存讀取 {game_date} 的傳球數據")
+                logger.info(f"從緩存讀取 {window_key} 的傳球數據")
                 return data
         except Exception as e:
             logger.warning(f"讀取緩存文件 {cache_file} 失敗: {e}")
     
     # 如果緩存不存在或讀取失敗，則從API獲取數據
-    data = get_player_pass_data_for_game(player_id, game_date, season_year, season_type)
+    data = get_player_pass_data_for_window(player_id, game_date, date_to, season_year, season_type)
     
     # 保存到緩存
     if not data.empty:
@@ -289,7 +324,46 @@ def get_player_pass_data_with_cache(player_id, game_date, season_year, season_ty
     
     return data
 
-def process_player_concurrent(player, season_year, output_dir, season_dir, cache_dir, max_workers=3):
+def build_pass_windows(player_id, season_year, season_type, granularity='game', date_windows=None):
+    """依時間粒度建立請求區間列表，每個元素為 (date_from, date_to, game_id)
+
+    season 與 window 模式不需要比賽記錄，可省下每名球員的 PlayerGameLog 請求；
+    month 模式只對球員有出賽的月份發出請求。
+    """
+    if granularity == 'season':
+        return [(None, None, None)]
+    
+    if granularity == 'window':
+        return [(date_from, date_to, None) for date_from, date_to in (date_windows or [])]
+    
+    # game 與 month 模式需要比賽記錄
+    games_df = get_player_games_in_season(player_id, season_year, season_type)
+    if games_df.empty:
+        return []
+    
+    windows = []
+    months = set()
+    for i, game in games_df.iterrows():
+        try:
+            game_date = datetime.strptime(game['GAME_DATE'], '%b %d, %Y')
+        except Exception as e:
+            logger.error(f"處理比賽日期 {game['GAME_DATE']} 時出錯: {e}")
+            continue
+        
+        if granularity == 'game':
+            formatted_date = game_date.strftime('%Y-%m-%d')
+            windows.append((formatted_date, formatted_date, game['Game_ID']))
+        else:
+            months.add((game_date.year, game_date.month))
+    
+    for year, month in sorted(months):
+        last_day = calendar.monthrange(year, month)[1]
+        windows.append((f"{year}-{month:02d}-01", f"{year}-{month:02d}-{last_day:02d}", None))
+    
+    return windows
+
+def process_player_concurrent(player, season_year, output_dir, season_dir, cache_dir, max_workers=3,
+                              granularity='game', date_windows=None):
     """使用並行處理單個球員的所有傳球數據"""
     player_id = player['id']
     player_name = player['full_name'].replace(" ", "_")
@@ -302,52 +376,40 @@ def process_player_concurrent(player, season_year, output_dir, season_dir, cache
     for season_type in season_types:
         logger.info(f"處理 {season_type} 比賽...")
         
-        # 獲取該類型的所有比賽
-        games_df = get_player_games_in_season(player_id, season_year, season_type)
+        # 依時間粒度建立請求區間
+        windows = build_pass_windows(player_id, season_year, season_type, granularity, date_windows)
         
-        if games_df.empty:
+        if not windows:
             continue
         
-        # 創建任務列表
-        tasks = []
-        for i, game in games_df.iterrows():
-            try:
-                game_date_str = game['GAME_DATE']
-                game_date = datetime.strptime(game_date_str, '%b %d, %Y')
-                formatted_date = game_date.strftime('%Y-%m-%d')
-                
-                # 添加任務
-                tasks.append((player_id, formatted_date, season_year, season_type, game['Game_ID']))
-            except Exception as e:
-                logger.error(f"處理比賽日期 {game['GAME_DATE']} 時出錯: {e}")
-        
         # 使用線程池並行處理
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
             # 提交所有任務
             future_to_task = {}
-            for task in tasks:
+            for date_from, date_to, game_id in windows:
                 future = executor.submit(
                     get_player_pass_data_with_cache,
-                    task[0],  # player_id
-                    task[1],  # formatted_date
-                    task[2],  # season_year
-                    task[3],  # season_type
-                    cache_dir
+                    player_id,
+                    date_from,
+                    season_year,
+                    season_type,
+                    cache_dir,
+                    date_to
                 )
-                future_to_task[future] = task
+                future_to_task[future] = (date_from, date_to, game_id)
             
             # 處理結果
             for future in concurrent.futures.as_completed(future_to_task):
-                task = future_to_task[future]
+                date_from, date_to, game_id = future_to_task[future]
                 try:
                     pass_data = future.result()
                     if not pass_data.empty:
-                        # 添加比賽ID
-                        pass_data['GAME_ID'] = task[4]
+                        # 添加比賽ID（區間數據沒有對應的單場比賽）
+                        pass_data['GAME_ID'] = game_id
                         all_pass_data.append(pass_data)
-                        logger.info(f"成功獲取 {len(pass_data)} 條傳球記錄 (日期: {task[1]})")
+                        logger.info(f"成功獲取 {len(pass_data)} 條傳球記錄 (日期: {date_from or season_type})")
                 except Exception as e:
-                    logger.error(f"處理比賽日期 {task[1]} 時出錯: {e}")
+                    logger.error(f"處理日期 {date_from or season_type} 時出錯: {e}")
     
     # 合併所有數據
     if all_pass_data:
@@ -363,7 +425,8 @@ def process_player_concurrent(player, season_year, output_dir, season_dir, cache
         logger.warning(f"沒有找到球員 {player_name} (ID: {player_id}) 的任何傳球數據")
         return pd.DataFrame()
 
-def process_players_batch(players_batch, season_year, base_output_dir, season_dir, cache_dir, progress):
+def process_players_batch(players_batch, season_year, base_output_dir, season_dir, cache_dir, progress,
+                          granularity='game', date_windows=None):
     """批次處理多個球員"""
     with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
         # 提交所有任務
@@ -380,7 +443,9 @@ def process_players_batch(players_batch, season_year, base_output_dir, season_di
                 season_year, 
                 base_output_dir, 
                 season_dir,
-                cache_dir
+                cache_dir,
+                granularity=granularity,
+                date_windows=date_windows
             )
             future_to_player[future] = player
         
@@ -425,10 +490,31 @@ def merge_all_csv(season_dir, output_dir, season_year):
     except Exception as e:
         logger.error(f"合併CSV文件時出錯: {e}")
 
-def process_season(season_year, json_file_pattern, base_output_dir):
-    """處理單個賽季的所有球員數據"""
+def get_season_partition(season_year, granularity='game'):
+    """返回 (輸出子目錄名稱, 合併檔標籤)；非逐場模式使用獨立的輸出分區"""
+    season_str = f"{season_year}-{str(season_year + 1)[-2:]}"
+    if granularity == 'game':
+        return season_str, season_year
+    return f"{season_str}_{granularity}", f"{season_year}_{granularity}"
+
+def process_season(season_year, json_file_pattern, base_output_dir, granularity='game', date_windows=None,
+                   shard=None, merge=True):
+    """處理單個賽季的所有球員數據
+
+    granularity 決定每名球員的請求粒度（見 GRANULARITIES）；
+    granularity='window' 時需以 date_windows 提供 [(date_from, date_to), ...]（YYYY-MM-DD）。
+    非逐場模式的輸出、緩存與進度各自存放於帶粒度後綴的位置，不會覆蓋逐場數據。
+    shard=(index, count) 時只處理球員列表中的第 index 份（共 count 份），並使用獨立的進度文件；
+    分片模式下由呼叫端在所有分片完成後再合併 CSV。
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"未知的時間粒度: {granularity}，可用選項: {GRANULARITIES}")
+    if granularity == 'window' and not date_windows:
+        raise ValueError("granularity='window' 需要提供 date_windows")
+    
     # 設置賽季格式
     season_str = f"{season_year}-{str(season_year + 1)[-2:]}"
+    partition, merge_label = get_season_partition(season_year, granularity)
     
     # 構建JSON文件名
     json_file = json_file_pattern.format(season_str=season_str)
@@ -438,7 +524,7 @@ def process_season(season_year, json_file_pattern, base_output_dir):
         return False
     
     # 創建年份子目錄
-    season_dir = os.path.join(base_output_dir, season_str)
+    season_dir = os.path.join(base_output_dir, partition)
     if not os.path.exists(season_dir):
         os.makedirs(season_dir)
     
@@ -448,7 +534,10 @@ def process_season(season_year, json_file_pattern, base_output_dir):
         os.makedirs(cache_dir)
     
     # 進度文件路徑
-    progress_file = os.path.join(base_output_dir, f"progress_{season_year}.pkl")
+    progress_suffix = "" if granularity == 'game' else f"_{granularity}"
+    if shard is not None:
+        progress_suffix += f"_shard{shard[0]}of{shard[1]}"
+    progress_file = os.path.join(base_output_dir, f"progress_{season_year}{progress_suffix}.pkl")
     
     # 加載球員列表
     players = load_player_list(json_file, season_str)
@@ -456,6 +545,12 @@ def process_season(season_year, json_file_pattern, base_output_dir):
         logger.error(f"沒有找到符合條件的球員，跳過賽季 {season_str}")
         return False
     
+    # 分片模式只處理屬於本分片的球員
+    if shard is not None:
+        shard_index, shard_count = shard
+        players = players[shard_index::shard_count]
+        season_str = f"{season_str} (分片 {shard_index + 1}/{shard_count})"
+    
     # 加載處理進度
     progress = load_progress(progress_file)
     
@@ -466,13 +561,15 @@ def process_season(season_year, json_file_pattern, base_output_dir):
         logger.info(f"處理第 {i//batch_size + 1} 批球員 ({i+1} 到 {min(i+batch_size, len(players))})")
         
         # 處理這批球員
-        process_players_batch(batch, season_year, base_output_dir, season_dir, cache_dir, progress)
+        process_players_batch(batch, season_year, base_output_dir, season_dir, cache_dir, progress,
+                              granularity=granularity, date_windows=date_windows)
         
         # 保存進度
         save_progress(progress, progress_file)
     
     # 合併所有CSV
-    merge_all_csv(season_dir, base_output_dir, season_year)
+    if merge:
+        merge_all_csv(season_dir, base_output_dir, merge_label)
     
     # 最終保存進度
     save_progress(progress, progress_file)
@@ -489,7 +586,73 @@ def process_season(season_year, json_file_pattern, base_output_dir):
     
     return True
 
+def process_seasons_parallel(seasons, json_file_pattern, base_output_dir, processes, shards_per_season=1,
+                             granularity='game', date_windows=None):
+    """以多進程並行處理多個賽季（或賽季分片）
+
+    每個工作進程負責一個 (賽季, 分片)，各自擁有獨立的 GIL、進度文件與球員輸出文件；
+    所有進程透過共享鎖與時間戳共用同一個全局請求速率預算。
+    """
+    ctx = multiprocessing.get_context('spawn')
+    lock = ctx.Lock()
+    shared_time = ctx.Value('d', 0.0, lock=False)
+    
+    tasks = [(season_year, (k, shards_per_season) if shards_per_season > 1 else None)
+             for season_year in seasons for k in range(shards_per_season)]
+    pending_shards = {season_year: shards_per_season for season_year in seasons}
+    failed_seasons = set()
+    
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=ctx,
+        initializer=init_shared_rate_limit,
+        initargs=(lock, shared_time)
+    ) as executor:
+        future_to_task = {
+            executor.submit(process_season, season_year, json_file_pattern, base_output_dir,
+                            granularity, date_windows, shard, False): (season_year, shard)
+            for season_year, shard in tasks
+        }
+        
+        for future in concurrent.futures.as_completed(future_to_task):
+            season_year, shard = future_to_task[future]
+            season_str = f"{season_year}-{str(season_year + 1)[-2:]}"
+            try:
+                if not future.result():
+                    failed_seasons.add(season_year)
+            except Exception as e:
+                logger.error(f"賽季 {season_str} 分片 {shard} 執行失敗: {e}")
+                failed_seasons.add(season_year)
+            
+            # 賽季的所有分片完成後才合併CSV
+            pending_shards[season_year] -= 1
+            if pending_shards[season_year] == 0:
+                partition, merge_label = get_season_partition(season_year, granularity)
+                merge_all_csv(os.path.join(base_output_dir, partition), base_output_dir, merge_label)
+                logger.info(f"賽季 {season_str} 的所有分片已完成")
+    
+    for season_year in sorted(failed_seasons):
+        logger.warning(f"賽季 {season_year}-{str(season_year + 1)[-2:]} 處理中斷或部分分片失敗")
+    
+    return not failed_seasons
+
+def parse_args():
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description="抓取NBA球員傳球數據")
+    parser.add_argument('--granularity', choices=GRANULARITIES, default='game',
+                        help="請求粒度: game(逐場)、month(逐月)、season(整季)、window(自訂區間)")
+    parser.add_argument('--window', action='append', default=[], metavar='FROM:TO',
+                        help="自訂日期區間 (YYYY-MM-DD:YYYY-MM-DD)，可重複指定，僅用於 window 模式")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="工作進程數，大於1時每個賽季（或分片）在獨立進程中執行")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="多進程模式下每個賽季切分的分片數")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    date_windows = [tuple(w.split(':', 1)) for w in args.window]
+    
     # 優化NBA API的請求頭
     optimize_nba_api_headers()
     
@@ -506,10 +669,19 @@ def main():
     if not os.path.exists(base_output_dir):
         os.makedirs(base_output_dir)
     
+    # 多進程模式：賽季/分片在獨立進程中執行，共用全局請求速率
+    if args.processes > 1:
+        process_seasons_parallel(seasons, json_file_pattern, base_output_dir, args.processes,
+                                 shards_per_season=max(1, args.shards),
+                                 granularity=args.granularity, date_windows=date_windows)
+        logger.info("所有指定賽季處理完成!")
+        return
+    
     # 處理每個賽季
     for season_year in seasons:
         logger.info(f"開始處理賽季 {season_year}-{str(season_year + 1)[-2:]}")
-        success = process_season(season_year, json_file_pattern, base_output_dir)
+        success = process_season(season_year, json_file_pattern, base_output_dir,
+                                 granularity=args.granularity, date_windows=date_windows)
         
         if not success:
             logger.warning(f"賽季 {season_year}-{str(season_year + 1)[-2:]} 處理中斷，將繼續處理下一個賽季")
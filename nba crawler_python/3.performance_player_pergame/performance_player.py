@@ -1,4 +1,4 @@
-from nba_api.stats.endpoints import commonteamroster, playergamelog
+from nba_api.stats.endpoints import commonteamroster, playergamelog, leaguegamelog
 from nba_api.stats.static import teams
 from nba_api.stats.library.http import NBAStatsHTTP
 import pandas as pd
@@ -8,6 +8,9 @@ import json
 import random
 from datetime import datetime
 import logging
+import threading
+import itertools
+import concurrent.futures
 
 # 設置 NBA API 的 HTTP 頭部
 NBAStatsHTTP.headers = {
@@ -43,6 +46,30 @@ os.makedirs(base_dir, exist_ok=True)
 seasons = ['2024-25']
 season_types = ['Regular Season', 'Playoffs']
 
+# 抓取模式
+# bulk: 每個賽季類型以一次聯盟層級的 LeagueGameLog 請求取得所有球員的比賽數據
+# player: 逐隊抓取陣容，再逐一抓取每位球員的 PlayerGameLog
+fetch_mode = 'bulk'
+
+# 逐球員模式下同時處理的球隊數；所有請求共用同一個速率限制
+max_team_workers = 4
+min_request_interval = 0.6  # 全局最小請求間隔時間（秒）
+
+# 全局鎖，用於控制並行請求的速率
+request_lock = threading.Lock()
+last_request_time = 0.0
+
+# 進度鎖，保護 progress 字典的讀寫與保存
+progress_lock = threading.RLock()
+
+# 與 PlayerGameLog 逐球員輸出一致的欄位順序
+player_game_columns = [
+    'SEASON_ID', 'Player_ID', 'Game_ID', 'GAME_DATE', 'MATCHUP', 'WL', 'MIN',
+    'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT',
+    'OREB', 'DREB', 'REB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', 'PLUS_MINUS',
+    'VIDEO_AVAILABLE', 'PLAYER_ID', 'PLAYER_NAME', 'TEAM_ID', 'TEAM_NAME', 'SEASON', 'SEASON_TYPE'
+]
+
 # 獲取所有NBA球隊信息
 nba_teams = teams.get_teams()
 team_dict = {team['id']: team['full_name'] for team in nba_teams}
@@ -63,7 +90,7 @@ else:
     for season in seasons:
         progress['seasons'][season] = {
             'completed_teams': [],
-            'current_team': None,
+            'current_teams': [],
             'completed_players': [],
             'player_count': 0
         }
@@ -72,23 +99,115 @@ else:
     logger.info("已創建新的進度文件")
 
 def save_progress():
-    """保存當前進度"""
-    progress['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with open(progress_file, 'w') as f:
-        json.dump(progress, f, indent=4)
+    """保存當前進度（線程安全，先寫臨時文件再原子替換）"""
+    with progress_lock:
+        progress['last_update'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        tmp_file = progress_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(progress, f, indent=4, default=int)
+        os.replace(tmp_file, progress_file)
+
+def get_season_progress(season):
+    """返回賽季進度，不存在時初始化"""
+    with progress_lock:
+        season_progress = progress['seasons'].setdefault(season, {
+            'completed_teams': [],
+            'current_teams': [],
+            'completed_players': [],
+            'player_count': 0
+        })
+        # 兼容舊版進度文件的單一 current_team 欄位
+        legacy_team = season_progress.pop('current_team', None)
+        season_progress.setdefault('current_teams', [])
+        if legacy_team is not None and legacy_team not in season_progress['current_teams']:
+            season_progress['current_teams'].append(legacy_team)
+        return season_progress
+
+def is_player_completed(season, player_id):
+    """檢查球員是否已處理"""
+    with progress_lock:
+        return player_id in progress['seasons'][season]['completed_players']
+
+def mark_players_completed(season, player_ids):
+    """數據寫入分塊後，將球員標記為已完成並保存進度"""
+    with progress_lock:
+        progress['seasons'][season]['completed_players'].extend(player_ids)
+        progress['seasons'][season]['player_count'] += len(player_ids)
+        save_progress()
+
+def rate_limited_request(func, *args, **kwargs):
+    """控制請求速率：所有線程共用同一個最小請求間隔"""
+    global last_request_time
+    
+    with request_lock:
+        elapsed = time.time() - last_request_time
+        if elapsed < min_request_interval:
+            time.sleep(min_request_interval - elapsed)
+        last_request_time = time.time()
+    
+    return func(*args, **kwargs)
+
+# 分塊文件序號，避免並行寫入時文件名衝突
+chunk_counter = itertools.count()
+
+def get_season_chunk_dir(season):
+    """返回賽季數據分塊文件的目錄"""
+    return os.path.join(base_dir, f"{season}_chunks")
 
 def save_season_data(season, data_df):
-    """保存賽季數據到CSV文件"""
+    """以追加分塊的方式保存賽季數據，不讀取也不重寫已有數據
+
+    每次調用寫出一個新的分塊文件（先寫臨時文件再原子替換），
+    由 compact_season_data 在賽季結束或需要時合併為單一CSV。
+    """
+    chunk_dir = get_season_chunk_dir(season)
+    os.makedirs(chunk_dir, exist_ok=True)
+    
+    # 以納秒時間戳命名，文件名順序即寫入順序
+    chunk_file = os.path.join(chunk_dir, f"part_{time.time_ns()}_{os.getpid()}_{next(chunk_counter)}.csv")
+    tmp_file = chunk_file + '.tmp'
+    data_df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, chunk_file)
+    logger.info(f"已將 {len(data_df)} 條新數據寫入分塊 {chunk_file}")
+
+def compact_season_data(season):
+    """將賽季的所有分塊與已有的賽季CSV合併為單一文件
+
+    同一球員若出現在多個分塊（例如中斷後重新抓取），只保留最後寫入的那一份，
+    保證合併結果中沒有重複的球員數據。
+    """
     season_file = os.path.join(base_dir, f"{season}_player_game_data.csv")
+    chunk_dir = get_season_chunk_dir(season)
+    chunk_files = sorted(f for f in os.listdir(chunk_dir) if f.endswith('.csv')) if os.path.isdir(chunk_dir) else []
     
+    if not chunk_files:
+        logger.info(f"{season} 賽季沒有需要合併的分塊")
+        return
+    
+    frames = []
     if os.path.exists(season_file):
         existing_df = pd.read_csv(season_file)
-        combined_df = pd.concat([existing_df, data_df], ignore_index=True)
-        combined_df.to_csv(season_file, index=False)
-        logger.info(f"已將 {len(data_df)} 條新數據追加到 {season_file}")
-    else:
-        data_df.to_csv(season_file, index=False)
-        logger.info(f"已創建新文件 {season_file} 並保存 {len(data_df)} 條數據")
+        existing_df['_CHUNK'] = -1
+        frames.append(existing_df)
+    for chunk_index, chunk_name in enumerate(chunk_files):
+        chunk_df = pd.read_csv(os.path.join(chunk_dir, chunk_name))
+        chunk_df['_CHUNK'] = chunk_index
+        frames.append(chunk_df)
+    
+    combined_df = pd.concat(frames, ignore_index=True)
+    
+    # 每位球員只保留最新分塊中的數據
+    latest_chunk = combined_df.groupby('PLAYER_ID')['_CHUNK'].transform('max')
+    combined_df = combined_df[combined_df['_CHUNK'] == latest_chunk].drop(columns='_CHUNK')
+    
+    tmp_file = season_file + '.tmp'
+    combined_df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, season_file)
+    
+    for chunk_name in chunk_files:
+        os.remove(os.path.join(chunk_dir, chunk_name))
+    
+    logger.info(f"已合併 {len(chunk_files)} 個分塊到 {season_file}，共 {len(combined_df)} 條數據")
 
 def get_player_game_stats(player_id, player_name, team_id, team_name, season, season_type):
     """獲取球員在指定賽季和賽季類型的每場比賽數據"""
@@ -99,7 +218,8 @@ def get_player_game_stats(player_id, player_name, team_id, team_name, season, se
     
     for attempt in range(max_retries):
         try:
-            game_log = playergamelog.PlayerGameLog(
+            game_log = rate_limited_request(
+                playergamelog.PlayerGameLog,
                 player_id=player_id,
                 season=season,
                 season_type_all_star=season_type
@@ -120,7 +240,6 @@ def get_player_game_stats(player_id, player_name, team_id, team_name, season, se
             df_games['SEASON_TYPE'] = season_type
             
             logger.info(f"  成功抓取 {player_name} 的 {len(df_games)} 場比賽數據")
-            time.sleep(random.uniform(0.1, 0.5))
             return df_games
             
         except Exception as e:
@@ -135,17 +254,112 @@ def get_player_game_stats(player_id, player_name, team_id, team_name, season, se
     
     return None
 
+def get_season_player_game_logs(season, season_type):
+    """以一次 LeagueGameLog 請求獲取整個聯盟所有球員在指定賽季類型的每場比賽數據，
+    並轉換為與 get_player_game_stats 相同的欄位格式
+    
+    沒有比賽記錄時返回空的 DataFrame；重試後仍抓取失敗時返回 None"""
+    logger.info(f"正在批量抓取 {season} {season_type} 所有球員的比賽數據...")
+    
+    max_retries = 5
+    retry_delay = 0.5
+    
+    for attempt in range(max_retries):
+        try:
+            game_log = rate_limited_request(
+                leaguegamelog.LeagueGameLog,
+                season=season,
+                season_type_all_star=season_type,
+                player_or_team_abbreviation='P'
+            )
+            df_games = game_log.get_data_frames()[0]
+            break
+        except Exception as e:
+            if attempt < max_retries - 1:
+                current_delay = retry_delay * (1.5 ** attempt) + random.uniform(0.1, 0.5)
+                logger.warning(f"  批量抓取 {season} {season_type} 數據時出錯 (嘗試 {attempt+1}/{max_retries}): {e}")
+                logger.info(f"  等待 {current_delay:.2f} 秒後重試...")
+                time.sleep(current_delay)
+            else:
+                logger.error(f"  批量抓取 {season} {season_type} 數據失敗，已達最大重試次數: {e}")
+                return None
+    
+    if df_games.empty:
+        logger.info(f"  {season} {season_type} 沒有比賽記錄")
+        return pd.DataFrame(columns=player_game_columns)
+    
+    # 對齊 PlayerGameLog 的欄位名稱與日期格式 (例如: APR 14, 2024)
+    df_games['Player_ID'] = df_games['PLAYER_ID']
+    df_games['Game_ID'] = df_games['GAME_ID']
+    df_games['GAME_DATE'] = pd.to_datetime(df_games['GAME_DATE']).dt.strftime('%b %d, %Y').str.upper()
+    df_games['TEAM_NAME'] = df_games['TEAM_ID'].map(team_dict).fillna(df_games['TEAM_NAME'])
+    df_games['SEASON'] = season
+    df_games['SEASON_TYPE'] = season_type
+    
+    # 與逐球員輸出相同：同一球員的比賽按日期由近到遠排列
+    df_games = df_games.sort_values(
+        ['TEAM_ID', 'PLAYER_ID', 'GAME_ID'], ascending=[True, True, False]
+    )
+    
+    logger.info(f"  成功批量抓取 {df_games['PLAYER_ID'].nunique()} 名球員的 {len(df_games)} 條比賽數據")
+    return df_games.reindex(columns=player_game_columns)
+
+def process_season_bulk(season):
+    """以聯盟層級比賽記錄處理整個賽季，覆寫該賽季的數據文件並標記所有球隊與球員為已完成
+    
+    任一賽季類型抓取失敗時不寫入文件、不刪除分塊也不更新進度，保留現有數據以便重跑"""
+    logger.info(f"開始以批量模式處理 {season} 賽季")
+    
+    season_data = []
+    for season_type in season_types:
+        df_games = get_season_player_game_logs(season, season_type)
+        if df_games is None:
+            logger.error(f"  {season} {season_type} 抓取失敗，本次不更新 {season} 賽季的數據與進度")
+            return False
+        if df_games.empty:
+            continue
+        season_data.append(df_games)
+    
+    if not season_data:
+        logger.warning(f"  {season} 賽季沒有任何比賽數據")
+        return False
+    
+    combined_data = pd.concat(season_data, ignore_index=True)
+    season_file = os.path.join(base_dir, f"{season}_player_game_data.csv")
+    combined_data.to_csv(season_file, index=False)
+    
+    # 批量結果已涵蓋整個賽季，舊的逐球員分塊不再需要
+    chunk_dir = get_season_chunk_dir(season)
+    if os.path.isdir(chunk_dir):
+        for chunk_name in os.listdir(chunk_dir):
+            os.remove(os.path.join(chunk_dir, chunk_name))
+    logger.info(f"已將 {len(combined_data)} 條數據保存到 {season_file}")
+    
+    # 批量結果涵蓋整個賽季，更新進度以免逐球員模式重複抓取
+    with progress_lock:
+        season_progress = get_season_progress(season)
+        season_progress['completed_teams'] = sorted(int(t) for t in combined_data['TEAM_ID'].unique())
+        season_progress['completed_players'] = sorted(int(p) for p in combined_data['PLAYER_ID'].unique())
+        season_progress['player_count'] = len(season_progress['completed_players'])
+        season_progress['current_teams'] = []
+        save_progress()
+    
+    return True
+
 def process_team_for_season(team_id, team_name, season, start_player_index=0):
     """處理指定球隊在特定賽季的所有球員數據"""
     logger.info(f"開始處理 {team_name} ({team_id}) 在 {season} 賽季的球員數據...")
     
     # 更新進度
-    progress['seasons'][season]['current_team'] = team_id
-    save_progress()
+    with progress_lock:
+        season_progress = get_season_progress(season)
+        if team_id not in season_progress['current_teams']:
+            season_progress['current_teams'].append(team_id)
+        save_progress()
     
     try:
         # 獲取球隊陣容
-        roster = commonteamroster.CommonTeamRoster(team_id=team_id, season=season)
+        roster = rate_limited_request(commonteamroster.CommonTeamRoster, team_id=team_id, season=season)
         df_roster = roster.get_data_frames()[0]
         
         if df_roster.empty:
@@ -154,8 +368,10 @@ def process_team_for_season(team_id, team_name, season, start_player_index=0):
         
         logger.info(f"  {team_name} 在 {season} 賽季有 {len(df_roster)} 名球員")
         
-        # 用於累積球員數據
+        # 用於累積球員數據；球員在其數據寫入分塊後才標記為已完成，
+        # 中斷時未寫出的球員會在續跑時重新抓取
         accumulated_data = []
+        pending_players = []
         player_count = 0
         
         # 處理每位球員
@@ -167,7 +383,7 @@ def process_team_for_season(team_id, team_name, season, start_player_index=0):
             player_name = player['PLAYER']
             
             # 檢查是否已經處理過該球員
-            if player_id in progress['seasons'][season]['completed_players']:
+            if is_player_completed(season, player_id):
                 logger.info(f"  跳過已處理的球員: {player_name}")
                 continue
             
@@ -184,38 +400,35 @@ def process_team_for_season(team_id, team_name, season, start_player_index=0):
             if player_games_data:
                 player_all_games = pd.concat(player_games_data, ignore_index=True)
                 accumulated_data.append(player_all_games)
+                pending_players.append(player_id)
                 player_count += 1
                 
-                # 更新進度
-                progress['seasons'][season]['completed_players'].append(player_id)
-                progress['seasons'][season]['player_count'] += 1
-                save_progress()
-                
                 logger.info(f"  已處理 {player_name} 的數據，當前累積 {player_count} 名球員")
                 
                 # 每處理5個球員，保存一次數據
                 if player_count % 5 == 0 and accumulated_data:
                     combined_data = pd.concat(accumulated_data, ignore_index=True)
                     save_season_data(season, combined_data)
+                    mark_players_completed(season, pending_players)
                     accumulated_data = []
+                    pending_players = []
                     logger.info(f"  已保存 {player_count} 名球員的數據")
-            
-            # 每處理10名球員，添加較長的休息時間
-            if player_count > 0 and player_count % 10 == 0:
-                rest_time = random.uniform(0.5, 1.0)
-                logger.info(f"  已處理 {player_count} 名球員，休息 {rest_time:.2f} 秒...")
-                time.sleep(rest_time)
+
         
         # 處理剩餘的球員數據
         if accumulated_data:
             combined_data = pd.concat(accumulated_data, ignore_index=True)
             save_season_data(season, combined_data)
+            mark_players_completed(season, pending_players)
             logger.info(f"  已保存剩餘 {len(accumulated_data)} 名球員的數據")
         
         # 完成處理
-        progress['seasons'][season]['completed_teams'].append(team_id)
-        progress['seasons'][season]['current_team'] = None
-        save_progress()
+        with progress_lock:
+            season_progress = get_season_progress(season)
+            season_progress['completed_teams'].append(team_id)
+            if team_id in season_progress['current_teams']:
+                season_progress['current_teams'].remove(team_id)
+            save_progress()
         
         logger.info(f"完成處理 {team_name} 在 {season} 賽季的球員數據")
         
@@ -226,30 +439,42 @@ def main():
     """主函數"""
     logger.info(f"開始抓取 {', '.join(seasons)} 賽季的NBA球員比賽數據")
     
-    # 檢查是否有未完成的工作
-    for season in seasons:
-        current_team_id = progress['seasons'][season].get('current_team')
-        if current_team_id:
-            logger.info(f"從上次中斷的位置繼續: 賽季 {season}, 球隊 {team_dict.get(current_team_id, str(current_team_id))}")
-            process_team_for_season(current_team_id, team_dict.get(current_team_id, "未知球隊"), season)
+    if fetch_mode == 'bulk':
+        failed_seasons = [season for season in seasons if not process_season_bulk(season)]
+        if failed_seasons:
+            logger.warning(f"以下賽季未完成，請重新執行: {', '.join(failed_seasons)}")
+        else:
+            logger.info("所有賽季數據抓取完成")
+        return
     
-    # 處理每個賽季的所有球隊
+    # 處理每個賽季的所有球隊（中斷時未完成的球隊不在 completed_teams 中，會被重新處理）
     for season in seasons:
         logger.info(f"開始處理 {season} 賽季")
-        completed_teams = progress['seasons'][season]['completed_teams']
+        season_progress = get_season_progress(season)
+        for team_id in season_progress['current_teams']:
+            logger.info(f"從上次中斷的位置繼續: 賽季 {season}, 球隊 {team_dict.get(team_id, str(team_id))}")
         
-        for team_id, team_name in team_dict.items():
-            # 跳過已完成的球隊
-            if team_id in completed_teams:
-                logger.info(f"跳過已處理的球隊: {team_name} ({season})")
-                continue
-            
-            process_team_for_season(team_id, team_name, season)
-            
-            # 每處理完一支球隊，添加較長的休息時間
-            rest_time = random.uniform(1.0, 2.0)
-            logger.info(f"完成處理一支球隊，休息 {rest_time:.2f} 秒...")
-            time.sleep(rest_time)
+        pending_teams = [
+            (team_id, team_name) for team_id, team_name in team_dict.items()
+            if team_id not in season_progress['completed_teams']
+        ]
+        logger.info(f"{season} 賽季待處理 {len(pending_teams)} 支球隊，並行數 {max_team_workers}")
+        
+        # 多支球隊並行處理，請求速率由 rate_limited_request 統一控制
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_team_workers) as executor:
+            future_to_team = {
+                executor.submit(process_team_for_season, team_id, team_name, season): team_name
+                for team_id, team_name in pending_teams
+            }
+            for future in concurrent.futures.as_completed(future_to_team):
+                team_name = future_to_team[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"處理 {team_name} 在 {season} 賽季時出錯: {e}")
+        
+        # 賽季結束後將分塊合併為單一CSV
+        compact_season_data(season)
     
     logger.info("所有賽季數據抓取完成")
 
@@ -9,6 +9,7 @@ import random
 import sys
 import concurrent.futures
 import json
+import threading
 from datetime import datetime
 
 # 設置 NBA API 的 HTTP 頭部
@@ -45,6 +46,27 @@ PLAYERS_DIR = os.path.join(BASE_DIR, 'players')
 ACTIVE_PLAYERS_FILE = os.path.join(BASE_DIR, 'active_players.json')
 SEASONS = [f"20{i:02d}-{(i+1):02d}" for i in range(24, 25)]  
 
+# PlayerCareerStats 有而 LeagueDashPlayerStats 聯盟數據沒有的欄位，
+# 快速模式只在需要這些欄位時才逐球員抓取職業生涯數據
+CAREER_ONLY_COLUMNS = ['GS']
+CAREER_BATCH_SIZE = 25
+
+# LeagueDashPlayerStats 的數據類型及其重複欄位的後綴；Base 欄位保持原名
+PLAYER_MEASURE_SUFFIXES = {
+    'Base': '',
+    'Advanced': '_ADV',
+    'Misc': '_MISC',
+    'Scoring': '_SCORING',
+    'Usage': '_USAGE',
+    'Defense': '_DEF',
+}
+PLAYER_MEASURE_TYPES = list(PLAYER_MEASURE_SUFFIXES)
+
+# 全局鎖，用於控制並行請求的速率
+request_lock = threading.Lock()
+last_request_time = 0.0
+min_request_interval = 0.6  # 最小請求間隔時間（秒）
+
 # 創建必要的目錄
 for directory in [BASE_DIR, CACHE_DIR, SEASONS_DIR, PLAYERS_DIR]:
     os.makedirs(directory, exist_ok=True)
@@ -70,63 +92,110 @@ def get_active_players():
     
     return active_players
 
-def get_player_stats_for_season(season, season_type='Regular Season'):
-    """獲取指定賽季所有球員的統計數據"""
-    cache_file = os.path.join(CACHE_DIR, f"{season}_{season_type.replace(' ', '_')}.pkl")
+def rate_limited_request(func, *args, **kwargs):
+    """控制請求速率：所有線程共用同一個最小請求間隔"""
+    global last_request_time
+    
+    with request_lock:
+        elapsed = time.time() - last_request_time
+        if elapsed < min_request_interval:
+            time.sleep(min_request_interval - elapsed)
+        last_request_time = time.time()
+    
+    return func(*args, **kwargs)
+
+def get_player_measure_for_season(season, season_type, measure_type):
+    """獲取指定賽季單一數據類型的聯盟球員數據，每個數據類型獨立快取"""
+    cache_file = os.path.join(CACHE_DIR, f"{season}_{season_type.replace(' ', '_')}_{measure_type}.pkl")
     
     # 檢查快取
     if os.path.exists(cache_file):
         try:
-            logger.info(f"從快取中獲取 {season} {season_type} 數據...")
+            logger.info(f"從快取中獲取 {season} {season_type} {measure_type} 數據...")
             return pd.read_pickle(cache_file)
         except Exception as e:
             logger.error(f"讀取快取文件時出錯: {e}")
     
-    logger.info(f"正在獲取 {season} {season_type} 的所有球員數據...")
+    logger.info(f"正在獲取 {season} {season_type} 的 {measure_type} 球員數據...")
     
-    try:
-        # 基本數據
-        basic_stats = leaguedashplayerstats.LeagueDashPlayerStats(
-            season=season,
-            season_type_all_star=season_type,
-            per_mode_detailed='PerGame',
-            measure_type_detailed_defense='Base'
-        )
-        basic_df = basic_stats.get_data_frames()[0]
-        
-        # 進階數據
-        advanced_stats = leaguedashplayerstats.LeagueDashPlayerStats(
-            season=season,
-            season_type_all_star=season_type,
-            per_mode_detailed='PerGame',
-            measure_type_detailed_defense='Advanced'
-        )
-        advanced_df = advanced_stats.get_data_frames()[0]
-        
-        # 合併數據
-        if not basic_df.empty and not advanced_df.empty:
-            # 使用 PLAYER_ID 作為合併鍵
-            merged_df = pd.merge(basic_df, advanced_df, on='PLAYER_ID', suffixes=('', '_ADV'))
-            
-            # 添加賽季和賽季類型信息
-            merged_df['SEASON'] = season
-            merged_df['SEASON_TYPE'] = season_type
-            
-            # 保存到快取
+    stats = rate_limited_request(
+        leaguedashplayerstats.LeagueDashPlayerStats,
+        season=season,
+        season_type_all_star=season_type,
+        per_mode_detailed='PerGame',
+        measure_type_detailed_defense=measure_type
+    )
+    df = stats.get_data_frames()[0]
+    
+    # 保存到快取
+    if not df.empty:
+        try:
+            df.to_pickle(cache_file)
+        except Exception as e:
+            logger.error(f"保存快取文件時出錯: {e}")
+    
+    return df
+
+def join_player_measures(measure_frames):
+    """以 PLAYER_ID 為索引，一次 concat 合併多個數據類型
+
+    行集合以 Base 為準；與先前數據類型重複的欄位加上該數據類型的後綴
+    （見 PLAYER_MEASURE_SUFFIXES），Base 欄位保持原名。
+    """
+    seen_columns = set()
+    aligned = []
+    for measure_type, df in measure_frames.items():
+        df = df.drop_duplicates('PLAYER_ID').set_index('PLAYER_ID')
+        suffix = PLAYER_MEASURE_SUFFIXES.get(measure_type, f"_{measure_type.upper()}")
+        df = df.rename(columns={col: f"{col}{suffix}" for col in df.columns if col in seen_columns})
+        seen_columns.update(df.columns)
+        aligned.append(df)
+    
+    merged_df = pd.concat(aligned, axis=1, join='outer')
+    merged_df = merged_df.reindex(aligned[0].index)
+    return merged_df.reset_index()
+
+def get_player_stats_for_season(season, season_type='Regular Season', measure_types=None):
+    """獲取指定賽季所有球員的統計數據
+
+    各數據類型在共享的速率限制下並行請求，再以 PLAYER_ID 對齊合併為一張寬表。
+    Base 為必需數據，其他數據類型失敗時記錄錯誤並略過。
+    """
+    measure_types = measure_types or PLAYER_MEASURE_TYPES
+    if 'Base' not in measure_types:
+        measure_types = ['Base'] + list(measure_types)
+    
+    logger.info(f"正在獲取 {season} {season_type} 的所有球員數據 ({', '.join(measure_types)})...")
+    
+    measure_frames = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(measure_types)) as executor:
+        futures = {
+            executor.submit(get_player_measure_for_season, season, season_type, measure_type): measure_type
+            for measure_type in measure_types
+        }
+        for future in concurrent.futures.as_completed(futures):
+            measure_type = futures[future]
             try:
-                merged_df.to_pickle(cache_file)
-                logger.info(f"已將 {season} {season_type} 數據保存到快取")
+                df = future.result()
             except Exception as e:
-                logger.error(f"保存快取文件時出錯: {e}")
-            
-            return merged_df
-        else:
-            logger.warning(f"獲取 {season} {season_type} 數據失敗，返回空 DataFrame")
-            return pd.DataFrame()
+                logger.error(f"獲取 {season} {season_type} {measure_type} 數據時出錯: {e}")
+                continue
+            if not df.empty:
+                measure_frames[measure_type] = df
     
-    except Exception as e:
-        logger.error(f"獲取 {season} {season_type} 數據時出錯: {e}")
+    if 'Base' not in measure_frames:
+        logger.warning(f"獲取 {season} {season_type} 數據失敗，返回空 DataFrame")
         return pd.DataFrame()
+    
+    # 按指定順序合併，使後綴規則固定
+    ordered_frames = {m: measure_frames[m] for m in measure_types if m in measure_frames}
+    merged_df = join_player_measures(ordered_frames)
+    
+    # 添加賽季和賽季類型信息
+    merged_df['SEASON'] = season
+    merged_df['SEASON_TYPE'] = season_type
+    
+    return merged_df
 
 def get_player_career_stats(player_id, player_name):
     """獲取指定球員的職業生涯統計數據"""
@@ -144,7 +213,7 @@ def get_player_career_stats(player_id, player_name):
     
     try:
         # 獲取球員職業生涯統計數據
-        career_stats = playercareerstats.PlayerCareerStats(player_id=player_id, per_mode36="PerGame")
+        career_stats = rate_limited_request(playercareerstats.PlayerCareerStats, player_id=player_id, per_mode36="PerGame")
         
         # 獲取常規賽數據
         regular_season = career_stats.season_totals_regular_season.get_data_frame()
@@ -258,6 +327,105 @@ def process_player(player_info):
     
     return player_name
 
+def fetch_career_stats_batch(player_infos, batch_size=CAREER_BATCH_SIZE, max_workers=3):
+    """分批並行獲取多名球員的職業生涯數據，返回 {player_id: DataFrame}"""
+    results = {}
+    for i in range(0, len(player_infos), batch_size):
+        batch = player_infos[i:i+batch_size]
+        logger.info(f"獲取第 {i//batch_size + 1} 批球員職業生涯數據 ({i+1} 到 {i+len(batch)}，共 {len(player_infos)} 名)")
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(get_player_career_stats, player_id, player_name): player_id
+                for player_id, player_name in batch
+            }
+            for future in concurrent.futures.as_completed(futures):
+                player_id = futures[future]
+                try:
+                    results[player_id] = future.result()
+                except Exception as e:
+                    logger.error(f"獲取球員 {player_id} 的職業生涯數據時出錯: {e}")
+    
+    return results
+
+def get_career_only_fields(season, season_data, columns):
+    """為聯盟數據中的球員補充 columns 欄位（來自職業生涯數據），按 (PLAYER_ID, SEASON_TYPE) 對齊
+
+    被交易球員在職業生涯數據中有多行，取 TEAM_ABBREVIATION 為 TOT 的合計行，
+    與聯盟數據的整季合計一致。
+    """
+    player_infos = list(season_data[['PLAYER_ID', 'PLAYER_NAME']].drop_duplicates('PLAYER_ID').itertuples(index=False, name=None))
+    career_data = fetch_career_stats_batch(player_infos)
+    
+    rows = []
+    for player_id, career_df in career_data.items():
+        if career_df.empty:
+            continue
+        season_rows = career_df[career_df['SEASON_ID'] == season]
+        for season_type, type_rows in season_rows.groupby('SEASON_TYPE'):
+            total_rows = type_rows[type_rows['TEAM_ABBREVIATION'] == 'TOT']
+            row = (total_rows if not total_rows.empty else type_rows).iloc[0]
+            rows.append({'PLAYER_ID': player_id, 'SEASON_TYPE': season_type,
+                         **{col: row.get(col) for col in columns}})
+    
+    return pd.DataFrame(rows, columns=['PLAYER_ID', 'SEASON_TYPE'] + list(columns))
+
+def build_season_from_league_data(season, career_columns=None):
+    """只用聯盟層級數據建立賽季球員表，不逐球員抓取也不經過球員目錄
+
+    直接寫出 {season}_all_players.csv、{season}_regular_season.csv 與 {season}_playoffs.csv；
+    career_columns 指定需要從職業生涯數據補充的欄位（見 CAREER_ONLY_COLUMNS），
+    只有這些欄位會觸發分批的 PlayerCareerStats 請求。
+    """
+    logger.info(f"開始以聯盟數據建立 {season} 賽季球員表...")
+    
+    regular_season_data = get_player_stats_for_season(season, 'Regular Season')
+    playoffs_data = get_player_stats_for_season(season, 'Playoffs')
+    season_data = pd.concat([regular_season_data, playoffs_data], ignore_index=True)
+    
+    if season_data.empty:
+        logger.warning(f"{season} 賽季沒有獲取到任何數據")
+        return season
+    
+    missing_columns = [col for col in (career_columns or []) if col not in season_data.columns]
+    if missing_columns:
+        logger.info(f"聯盟數據缺少欄位 {missing_columns}，從職業生涯數據補充")
+        career_fields = get_career_only_fields(season, season_data, missing_columns)
+        season_data = season_data.merge(career_fields, on=['PLAYER_ID', 'SEASON_TYPE'], how='left')
+    
+    season_dir = os.path.join(SEASONS_DIR, season)
+    os.makedirs(season_dir, exist_ok=True)
+    
+    season_file = os.path.join(season_dir, f"{season}_all_players.csv")
+    season_data.to_csv(season_file, index=False)
+    logger.info(f"已將 {season} 賽季所有球員數據保存到 {season_file}")
+    
+    for season_type, file_suffix in [('Regular Season', 'regular_season'), ('Playoffs', 'playoffs')]:
+        type_data = season_data[season_data['SEASON_TYPE'] == season_type]
+        if type_data.empty:
+            logger.warning(f"沒有找到 {season} {season_type} 數據")
+            continue
+        type_file = os.path.join(season_dir, f"{season}_{file_suffix}.csv")
+        type_data.to_csv(type_file, index=False)
+        logger.info(f"已將 {season} {season_type} 所有球員數據保存到 {type_file}")
+    
+    return season
+
+def collect_data_by_league(career_columns=None):
+    """快速模式：按賽季以聯盟數據建立球員表"""
+    logger.info("開始以聯盟數據快速建立賽季球員表...")
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        futures = {executor.submit(build_season_from_league_data, season, career_columns): season for season in SEASONS}
+        
+        for future in concurrent.futures.as_completed(futures):
+            season = futures[future]
+            try:
+                future.result()
+                logger.info(f"完成處理 {season} 賽季")
+            except Exception as e:
+                logger.error(f"處理 {season} 賽季時出錯: {e}")
+
 def collect_data_by_seasons():
     """按賽季收集數據"""
     logger.info("開始按賽季收集數據...")
@@ -300,61 +468,95 @@ def collect_data_by_players(max_players=None):
             except Exception as e:
                 logger.error(f"處理 {player_name} 的數據時出錯: {e}")
 
-def merge_data_by_season():
-    """合併每個賽季的所有球員數據"""
+# 球員賽季文件的固定欄位類型，避免逐文件推斷類型；未列出的數值欄位由 pandas 解析為浮點數/整數
+# ID 使用可為空的 Int64，空白的 ID 不會導致整個文件讀取失敗
+PLAYER_SEASON_DTYPES = {
+    'PLAYER_ID': 'Int64',
+    'TEAM_ID': 'Int64',
+    'PLAYER_NAME': 'string',
+    'NICKNAME': 'string',
+    'TEAM_ABBREVIATION': 'string',
+    'SEASON': 'string',
+    'SEASON_ID': 'string',
+    'SEASON_TYPE': 'string',
+    'LEAGUE_ID': 'string',
+}
+
+def scan_player_season_files(seasons):
+    """只掃描一次球員目錄，返回 {season: [球員賽季文件路徑, ...]}"""
+    season_files = {season: [] for season in seasons}
+    wanted = {f"{season}.csv": season for season in seasons}
+    
+    with os.scandir(PLAYERS_DIR) as player_dirs:
+        for player_dir in player_dirs:
+            if not player_dir.is_dir():
+                continue
+            with os.scandir(player_dir.path) as entries:
+                for entry in entries:
+                    season = wanted.get(entry.name)
+                    if season is not None:
+                        season_files[season].append(entry.path)
+    
+    return season_files
+
+def read_player_season_file(path):
+    """以固定欄位類型讀取單個球員賽季文件；讀取失敗時拋出異常，不會靜默略過文件"""
+    try:
+        return pd.read_csv(path, dtype=PLAYER_SEASON_DTYPES)
+    except Exception as e:
+        logger.error(f"讀取 {path} 時出錯: {e}")
+        raise
+
+def merge_data_by_season(max_workers=8):
+    """合併每個賽季的所有球員數據
+
+    球員目錄只掃描一次，各賽季的文件以線程池並行讀取，
+    每個賽季只做一次 concat，再按賽季類型拆分寫出。
+    """
     logger.info("開始合併每個賽季的所有球員數據...")
     
-    for season in SEASONS:
-        logger.info(f"正在處理 {season} 賽季...")
-        
-        # 常規賽和季後賽數據文件
-        season_dir = os.path.join(SEASONS_DIR, season)
-        if not os.path.exists(season_dir):
+    scan_start = time.perf_counter()
+    season_files = scan_player_season_files(SEASONS)
+    logger.info(f"掃描球員目錄完成，共 {sum(len(f) for f in season_files.values())} 個文件，"
+                f"耗時 {time.perf_counter() - scan_start:.2f} 秒")
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for season in SEASONS:
+            logger.info(f"正在處理 {season} 賽季...")
+            season_start = time.perf_counter()
+            
+            # 常規賽和季後賽數據文件
+            season_dir = os.path.join(SEASONS_DIR, season)
             os.makedirs(season_dir, exist_ok=True)
-        
-        regular_season_file = os.path.join(season_dir, f"{season}_regular_season.csv")
-        playoffs_file = os.path.join(season_dir, f"{season}_playoffs.csv")
-        
-        # 收集所有球員在該賽季的數據
-        regular_season_data = []
-        playoffs_data = []
-        
-        # 遍歷所有球員目錄
-        for player_dir in os.listdir(PLAYERS_DIR):
-            player_season_file = os.path.join(PLAYERS_DIR, player_dir, f"{season}.csv")
             
-            if os.path.exists(player_season_file):
-                try:
-                    player_data = pd.read_csv(player_season_file)
-                    
-                    # 分離常規賽和季後賽數據
-                    if 'SEASON_TYPE' in player_data.columns:
-                        rs_data = player_data[player_data['SEASON_TYPE'] == 'Regular Season']
-                        po_data = player_data[player_data['SEASON_TYPE'] == 'Playoffs']
-                        
-                        if not rs_data.empty:
-                            regular_season_data.append(rs_data)
-                        
-                        if not po_data.empty:
-                            playoffs_data.append(po_data)
-                except Exception as e:
-                    logger.error(f"讀取 {player_season_file} 時出錯: {e}")
-        
-        # 合併所有球員的常規賽數據
-        if regular_season_data:
-            combined_rs = pd.concat(regular_season_data, ignore_index=True)
-            combined_rs.to_csv(regular_season_file, index=False)
-            logger.info(f"已將 {season} 常規賽所有球員數據保存到 {regular_season_file}")
-        else:
-            logger.warning(f"沒有找到 {season} 常規賽數據")
-        
-        # 合併所有球員的季後賽數據
-        if playoffs_data:
-            combined_po = pd.concat(playoffs_data, ignore_index=True)
-            combined_po.to_csv(playoffs_file, index=False)
-            logger.info(f"已將 {season} 季後賽所有球員數據保存到 {playoffs_file}")
-        else:
-            logger.warning(f"沒有找到 {season} 季後賽數據")
+            regular_season_file = os.path.join(season_dir, f"{season}_regular_season.csv")
+            playoffs_file = os.path.join(season_dir, f"{season}_playoffs.csv")
+            
+            frames = [df for df in executor.map(read_player_season_file, season_files[season])
+                      if 'SEASON_TYPE' in df.columns]
+            
+            if not frames:
+                logger.warning(f"沒有找到 {season} 常規賽數據")
+                logger.warning(f"沒有找到 {season} 季後賽數據")
+                continue
+            
+            combined = pd.concat(frames, ignore_index=True)
+            
+            # 分離常規賽和季後賽數據
+            for season_type, output_file, label in [
+                ('Regular Season', regular_season_file, '常規賽'),
+                ('Playoffs', playoffs_file, '季後賽'),
+            ]:
+                type_data = combined[combined['SEASON_TYPE'] == season_type]
+                if type_data.empty:
+                    logger.warning(f"沒有找到 {season} {label}數據")
+                    continue
+                type_data.to_csv(output_file, index=False)
+                logger.info(f"已將 {season} {label}所有球員數據保存到 {output_file}")
+            
+            elapsed = time.perf_counter() - season_start
+            logger.info(f"{season} 賽季合併完成: {len(frames)} 個文件、{len(combined)} 行，耗時 {elapsed:.2f} 秒 "
+                        f"({len(frames) / max(elapsed, 1e-9):.0f} 文件/秒，{len(combined) / max(elapsed, 1e-9):.0f} 行/秒)")
 
 def main():
     """主函數"""
@@ -362,8 +564,16 @@ def main():
     logger.info(f"NBA 數據收集程序開始運行，時間: {start_time}")
     
     try:
-        # 選擇收集方式: 1 = 按賽季, 2 = 按球員, 3 = 兩者都執行
-        collection_mode = 1
+        # 選擇收集方式: 1 = 按賽季, 2 = 按球員, 3 = 兩者都執行, 4 = 快速模式（只用聯盟數據）
+        collection_mode = 4
+        
+        if collection_mode == 4:
+            # 需要先發場次 (GS) 等聯盟數據沒有的欄位時，傳入 CAREER_ONLY_COLUMNS
+            collect_data_by_league(career_columns=None)
+            
+            end_time = datetime.now()
+            logger.info(f"NBA 數據收集程序完成，總耗時: {end_time - start_time}")
+            return
         
         if collection_mode in [1, 3]:
             collect_data_by_seasons()
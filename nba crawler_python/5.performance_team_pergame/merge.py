@@ -1,7 +1,15 @@
 import os
+import time
 import pandas as pd
 import logging
-from datetime import datetime
+import concurrent.futures
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
 
 # 設置日誌
 logging.basicConfig(
@@ -10,71 +18,180 @@ logging.basicConfig(
 )
 logger = logging.getLogger()
 
-def merge_all_seasons_data(seasons_dir='seasons', output_dir='output'):
+# 輸出文件名稱（1_passing network building.R 讀取的文件名）
+OUTPUT_CSV = "all_seasons_all_games_team_stats.csv"
+OUTPUT_PARQUET = "all_seasons_all_games_team_stats.parquet"
+
+# 欄位類型：ID為整數，球隊/賽季等文字欄位為類別，已知的統計欄位為浮點數；
+# 其他未知欄位不強制轉換（以文字讀取），避免因意外的欄位內容而讀取失敗
+INT_COLUMNS = ['GAME_ID', 'Game_ID', 'TEAM_ID']
+CATEGORY_COLUMNS = [
+    'TEAM_NAME', 'TEAM_ABBREVIATION', 'TEAM_CITY', 'SEASON', 'SEASON_TYPE',
+    'MIN', 'SEASON_YEAR', 'GAME_DATE', 'MATCHUP', 'WL'
+]
+FLOAT_COLUMNS = [
+    # 傳統數據
+    'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT',
+    'OREB', 'DREB', 'REB', 'AST', 'STL', 'BLK', 'BLKA', 'TO', 'TOV', 'PF', 'PFD',
+    'PTS', 'PLUS_MINUS', 'W', 'L', 'W_PCT', 'GP',
+    # 進階數據
+    'E_OFF_RATING', 'OFF_RATING', 'E_DEF_RATING', 'DEF_RATING', 'E_NET_RATING', 'NET_RATING',
+    'AST_PCT', 'AST_TOV', 'AST_TO', 'AST_RATIO', 'OREB_PCT', 'DREB_PCT', 'REB_PCT',
+    'E_TM_TOV_PCT', 'TM_TOV_PCT', 'EFG_PCT', 'TS_PCT', 'USG_PCT', 'E_USG_PCT',
+    'E_PACE', 'PACE', 'PACE_PER40', 'POSS', 'PIE'
+]
+FLOAT_SUFFIXES = ('_RANK',)  # TeamGameLogs 的排名欄位
+
+def find_partition_files(seasons_dir):
+    """
+    找出 seasons/{賽季}/{賽季類型}/*.csv 的所有分區文件
+    
+    參數:
+    seasons_dir (str): 賽季數據目錄
+    
+    返回:
+    list: 依路徑排序的 CSV 文件列表
+    """
+    partition_files = []
+    
+    # 遍歷所有賽季目錄，排除隱藏文件
+    for season in os.listdir(seasons_dir):
+        season_path = os.path.join(seasons_dir, season)
+        if not os.path.isdir(season_path) or season.startswith('.'):
+            continue
+        
+        # 遍歷賽季類型目錄
+        for season_type in os.listdir(season_path):
+            season_type_path = os.path.join(season_path, season_type)
+            if not os.path.isdir(season_type_path) or season_type.startswith('.'):
+                continue
+            
+            for filename in os.listdir(season_type_path):
+                if filename.endswith('.csv') and not filename.startswith('.'):
+                    partition_files.append(os.path.join(season_type_path, filename))
+    
+    return sorted(partition_files)
+
+def get_column_dtypes(columns):
+    """依欄位名稱返回宣告的欄位類型；未知欄位以文字 (object) 讀取"""
+    dtypes = {}
+    for col in columns:
+        if col in INT_COLUMNS:
+            dtypes[col] = 'int64'
+        elif col in CATEGORY_COLUMNS:
+            dtypes[col] = 'category'
+        elif col in FLOAT_COLUMNS or col.endswith(FLOAT_SUFFIXES):
+            dtypes[col] = 'float64'
+        else:
+            dtypes[col] = 'object'
+    return dtypes
+
+def read_partition(file_path):
+    """
+    以宣告的欄位類型讀取單個分區文件，不做類型推斷
+    
+    讀取失敗時拋出異常並中止合併，不會靜默略過分區
+    """
+    try:
+        columns = pd.read_csv(file_path, nrows=0).columns.tolist()
+        df = pd.read_csv(file_path, dtype=get_column_dtypes(columns))
+        if df.empty:
+            logger.warning(f"文件為空: {file_path}")
+            return None
+        logger.info(f"成功讀取: {file_path}")
+        return df
+    except Exception as e:
+        logger.error(f"讀取 {file_path} 時出錯: {e}")
+        raise
+
+def merge_all_seasons_data(seasons_dir='seasons', output_dir='output', max_workers=4):
     """
     合併所有賽季和賽季類型的數據
     
+    分區文件以線程池並行讀取，每次最多同時持有 max_workers * 2 個分區；
+    每個分區去重後立即追加寫入 CSV 與 Parquet（安裝 pyarrow 時），
+    記憶體用量與賽季數量無關。
+    
     參數:
     seasons_dir (str): 賽季數據目錄
     output_dir (str): 輸出目錄
+    max_workers (int): 並行讀取的線程數
     """
+    start_time = time.perf_counter()
+    
     # 確保輸出目錄存在
     os.makedirs(output_dir, exist_ok=True)
     
-    # 儲存所有數據的列表
-    all_seasons_data = []
+    partition_files = find_partition_files(seasons_dir)
+    if not partition_files:
+        logger.warning("未找到任何數據")
+        return
     
-    # 遍歷所有賽季目錄
-    for season in os.listdir(seasons_dir):
-        season_path = os.path.join(seasons_dir, season)
-        
-        # 確保是目錄，並排除隱藏文件
-        if os.path.isdir(season_path) and not season.startswith('.'):
-            # 遍歷賽季類型目錄
-            for season_type in os.listdir(season_path):
-                season_type_path = os.path.join(season_path, season_type)
-                
-                # 確保是目錄，並排除隱藏文件
-                if os.path.isdir(season_type_path) and not season_type.startswith('.'):
-                    # 遍歷該目錄下的所有 CSV 文件
-                    for filename in os.listdir(season_type_path):
-                        if filename.endswith('.csv') and not filename.startswith('.'):
-                            file_path = os.path.join(season_type_path, filename)
-                            
-                            try:
-                                # 讀取 CSV 文件
-                                df = pd.read_csv(file_path)
-                                
-                                # 如果 DataFrame 不為空
-                                if not df.empty:
-                                    logger.info(f"成功讀取: {file_path}")
-                                    all_seasons_data.append(df)
-                                else:
-                                    logger.warning(f"文件為空: {file_path}")
-                            
-                            except Exception as e:
-                                logger.error(f"讀取 {file_path} 時出錯: {e}")
-    
-    # 如果有數據，則合併
-    if all_seasons_data:
-        # 合併所有數據
-        combined_df = pd.concat(all_seasons_data, ignore_index=True)
-        
-        # 去除重複記錄
-        combined_df = combined_df.drop_duplicates(subset=['GAME_ID', 'TEAM_ID'])
-        
-        # 生成輸出文件名（包含當前日期）
-        output_filename = f"all_seasons_all_games_team_stats_{datetime.now().strftime('%Y%m%d')}.csv"
-        output_path = os.path.join(output_dir, output_filename)
-        
-        # 保存文件
-        combined_df.to_csv(output_path, index=False)
-        
-        logger.info(f"成功合併所有賽季數據，共 {len(combined_df)} 條記錄")
-        logger.info(f"已保存到: {output_path}")
+    # 先讀取各分區的表頭，確定統一的欄位順序
+    all_columns = []
+    for file_path in partition_files:
+        for col in pd.read_csv(file_path, nrows=0).columns:
+            if col not in all_columns:
+                all_columns.append(col)
+    column_dtypes = get_column_dtypes(all_columns)
+    text_columns = [col for col in all_columns if column_dtypes[col] in ('category', 'object')]
+    
+    csv_path = os.path.join(output_dir, OUTPUT_CSV)
+    parquet_path = os.path.join(output_dir, OUTPUT_PARQUET)
+    csv_tmp = csv_path + '.tmp'
+    parquet_tmp = parquet_path + '.tmp'
+    
+    if pq is None:
+        logger.warning("未安裝 pyarrow，只輸出 CSV")
     
-    else:
+    seen_keys = set()
+    parquet_writer = None
+    total_rows = 0
+    window = max_workers * 2
+    
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for i in range(0, len(partition_files), window):
+                for df in executor.map(read_partition, partition_files[i:i + window]):
+                    if df is None:
+                        continue
+                    
+                    # 去除重複記錄（跨分區以 GAME_ID + TEAM_ID 判斷）
+                    keys = list(zip(df['GAME_ID'], df['TEAM_ID']))
+                    keep = [key not in seen_keys for key in keys]
+                    df = df[keep].drop_duplicates(subset=['GAME_ID', 'TEAM_ID'])
+                    if df.empty:
+                        continue
+                    seen_keys.update(zip(df['GAME_ID'], df['TEAM_ID']))
+                    
+                    df = df.reindex(columns=all_columns)
+                    df[text_columns] = df[text_columns].astype('string')
+                    
+                    df.to_csv(csv_tmp, mode='w' if total_rows == 0 else 'a', header=total_rows == 0, index=False)
+                    
+                    if pq is not None:
+                        table = pa.Table.from_pandas(df, preserve_index=False)
+                        if parquet_writer is None:
+                            parquet_writer = pq.ParquetWriter(parquet_tmp, table.schema)
+                        parquet_writer.write_table(table.cast(parquet_writer.schema))
+                    
+                    total_rows += len(df)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+    
+    if total_rows == 0:
         logger.warning("未找到任何數據")
+        return
+    
+    os.replace(csv_tmp, csv_path)
+    logger.info(f"已保存到: {csv_path}")
+    if parquet_writer is not None:
+        os.replace(parquet_tmp, parquet_path)
+        logger.info(f"已保存到: {parquet_path}")
+    
+    elapsed = time.perf_counter() - start_time
+    logger.info(f"成功合併 {len(partition_files)} 個分區，共 {total_rows} 條記錄，耗時 {elapsed:.2f} 秒")
 
 def main():
     merge_all_seasons_data()
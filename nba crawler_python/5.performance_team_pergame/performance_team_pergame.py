@@ -1,4 +1,4 @@
-from nba_api.stats.endpoints import boxscoretraditionalv2, boxscoreadvancedv2, teamgamelog, leaguestandings
+from nba_api.stats.endpoints import boxscoretraditionalv2, boxscoreadvancedv2, teamgamelog, teamgamelogs, leaguestandings
 from nba_api.stats.static import teams
 import pandas as pd
 import numpy as np
@@ -7,8 +7,11 @@ import os
 import logging
 from datetime import datetime
 import concurrent.futures
+import threading
 import pickle
 import json
+import sqlite3
+from contextlib import closing
 from pathlib import Path
 import requests
 from requests.adapters import HTTPAdapter
@@ -25,6 +28,43 @@ SEASONS = [
 # 定義賽季類型 (移除 PlayIn)
 SEASON_TYPES = ['Regular Season', 'Playoffs']
 
+# 抓取模式
+# bulk: 以聯盟層級的 TeamGameLogs 每個數據類型一次請求取得整季所有球隊比賽數據
+# boxscore: 逐場請求 BoxScoreTraditionalV2 + BoxScoreAdvancedV2
+FETCH_MODE = 'bulk'
+
+# bulk 模式請求的 TeamGameLogs 數據類型（可加入 'Misc'、'Four Factors'、'Scoring' 等）
+BULK_MEASURE_TYPES = ['Base', 'Advanced']
+
+# bulk 模式下，bulk 數據缺少的欄位是否以逐場 boxscore 補齊
+BULK_BOXSCORE_FALLBACK = False
+
+# boxscore 球隊數據欄位（輸出文件的欄位順序）
+TRADITIONAL_TEAM_COLUMNS = [
+    'GAME_ID', 'TEAM_ID', 'TEAM_NAME', 'TEAM_ABBREVIATION', 'TEAM_CITY', 'MIN',
+    'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 'FG3_PCT', 'FTM', 'FTA', 'FT_PCT',
+    'OREB', 'DREB', 'REB', 'AST', 'STL', 'BLK', 'TO', 'PF', 'PTS', 'PLUS_MINUS'
+]
+ADVANCED_TEAM_COLUMNS = [
+    'E_OFF_RATING', 'OFF_RATING', 'E_DEF_RATING', 'DEF_RATING', 'E_NET_RATING', 'NET_RATING',
+    'AST_PCT', 'AST_TOV', 'AST_RATIO', 'OREB_PCT', 'DREB_PCT', 'REB_PCT', 'E_TM_TOV_PCT',
+    'TM_TOV_PCT', 'EFG_PCT', 'TS_PCT', 'USG_PCT', 'E_USG_PCT', 'E_PACE', 'PACE',
+    'PACE_PER40', 'POSS', 'PIE'
+]
+
+# TeamGameLogs 與 boxscore 欄位名稱不同之處
+BULK_COLUMN_RENAMES = {'TOV': 'TO', 'AST_TO': 'AST_TOV'}
+
+# 各數據類型共有的比賽識別欄位，只保留第一個數據類型中的版本
+BULK_SHARED_COLUMNS = ['SEASON_YEAR', 'TEAM_ABBREVIATION', 'TEAM_NAME', 'GAME_DATE', 'MATCHUP', 'WL', 'MIN']
+
+# 比賽任務狀態：pending（已從比賽日誌發現）→ written（已寫入存儲）
+# 取得的 boxscore 只在記憶體中，寫入存儲前中斷即須重新抓取，因此不另設中間狀態
+GAME_STATES = ('pending', 'written')
+
+# 保護比賽任務帳本的讀寫
+ledger_lock = threading.Lock()
+
 # 定義資料夾結構
 OUTPUT_DIR = "output"
 CACHE_DIR = "cache"
@@ -32,6 +72,17 @@ SEASONS_DIR = "seasons"
 LOG_DIR = "logs"
 PROGRESS_DIR = "progress"
 
+# 球隊比賽數據的鍵值存儲（SQLite），以 (SEASON, SEASON_TYPE, GAME_ID, TEAM_ID) 為主鍵逐行 upsert
+STORE_FILE = os.path.join(OUTPUT_DIR, "team_game_stats.sqlite")
+STORE_TABLE = "team_game_stats"
+STORE_KEY = ['SEASON', 'SEASON_TYPE', 'GAME_ID', 'TEAM_ID']
+
+# 程序結束時是否由存儲導出各賽季的 team_game_stats_{season}_{type}.csv
+EXPORT_CSV = True
+
+# 保護存儲的寫入
+store_lock = threading.Lock()
+
 # 設置日誌系統
 def setup_logging():
     """設置日誌系統"""
@@ -320,6 +371,299 @@ def get_game_boxscore_complete(game_id, max_retries=3, retry_delay=0.3):
                 logger.error(f"獲取比賽ID {game_id} 的詳細數據時出錯: {e}")
                 return pd.DataFrame()
 
+# 獲取聯盟所有球隊的比賽日誌（單一數據類型）
+def get_league_team_game_logs(season, season_type, measure_type, max_retries=3, retry_delay=0.5):
+    """
+    以一次 TeamGameLogs 請求獲取整個聯盟所有球隊在指定賽季類型的每場比賽數據
+    
+    參數:
+    season (str): 賽季，格式為 'YYYY-YY'
+    season_type (str): 賽季類型 ('Regular Season', 'Playoffs')
+    measure_type (str): 數據類型 ('Base', 'Advanced', ...)
+    max_retries (int): 最大重試次數
+    retry_delay (int): 重試間隔時間（秒）
+    
+    返回:
+    DataFrame: 每支球隊每場比賽一行的DataFrame
+    """
+    retries = 0
+    while retries < max_retries:
+        try:
+            game_logs = get_cached_api_response(
+                teamgamelogs.TeamGameLogs,
+                season_nullable=season,
+                season_type_nullable=season_type,
+                measure_type_player_game_logs_nullable=measure_type,
+                league_id_nullable='00',
+                timeout=60
+            )
+            df = game_logs.get_data_frames()[0]
+            logger.info(f"成功獲取 {season} 賽季 {season_type} 的 {measure_type} 球隊比賽數據，共 {len(df)} 條記錄")
+            return df
+        
+        except Exception as e:
+            retries += 1
+            if retries < max_retries:
+                logger.warning(f"獲取 {season} 賽季 {season_type} 的 {measure_type} 球隊比賽數據時出錯，第 {retries} 次重試，等待 {retry_delay} 秒...")
+                time.sleep(retry_delay)
+                # 每次重試增加延遲時間
+                retry_delay *= 1.5
+            else:
+                logger.error(f"獲取 {season} 賽季 {season_type} 的 {measure_type} 球隊比賽數據時出錯: {e}")
+                return pd.DataFrame()
+
+# 以聯盟比賽日誌組合球隊比賽數據
+def get_team_game_stats_bulk(season, season_type, teams_list, measure_types=None):
+    """
+    以 TeamGameLogs 聯盟數據組合與 get_game_boxscore_complete 相同欄位的球隊比賽數據
+    
+    各數據類型以 (GAME_ID, TEAM_ID) 對齊後一次合併；Base/Advanced 以外的數據類型
+    與已有欄位重名時加上數據類型後綴。TEAM_NAME/TEAM_CITY 依 boxscore 格式由球隊資訊補齊。
+    
+    參數:
+    season (str): 賽季
+    season_type (str): 賽季類型
+    teams_list (list): 球隊信息列表
+    measure_types (list): TeamGameLogs 數據類型列表，預設為 BULK_MEASURE_TYPES
+    
+    返回:
+    DataFrame: 包含整季所有球隊比賽數據的DataFrame
+    """
+    measure_types = measure_types or BULK_MEASURE_TYPES
+    
+    aligned = []
+    seen_columns = set()
+    for measure_type in measure_types:
+        df = get_league_team_game_logs(season, season_type, measure_type)
+        if df.empty:
+            if measure_type == 'Base':
+                return pd.DataFrame()
+            continue
+        
+        df = df.rename(columns=BULK_COLUMN_RENAMES)
+        df = df[[col for col in df.columns if not col.endswith('_RANK')]]
+        df = df.drop_duplicates(subset=['GAME_ID', 'TEAM_ID']).set_index(['GAME_ID', 'TEAM_ID'])
+        
+        if aligned:
+            df = df.drop(columns=[col for col in BULK_SHARED_COLUMNS if col in df.columns])
+            suffix = f"_{measure_type.upper().replace(' ', '_')}"
+            if measure_type == 'Advanced':
+                df = df.drop(columns=[col for col in df.columns if col in seen_columns])
+            else:
+                df = df.rename(columns={col: f"{col}{suffix}" for col in df.columns if col in seen_columns})
+        
+        seen_columns.update(df.columns)
+        aligned.append(df)
+    
+    if not aligned:
+        return pd.DataFrame()
+    
+    team_stats = pd.concat(aligned, axis=1, join='outer').reset_index()
+    
+    # boxscore 的 TEAM_NAME 為球隊暱稱，另有 TEAM_CITY 欄位
+    team_info = {team['id']: team for team in teams_list}
+    team_stats['TEAM_NAME'] = team_stats['TEAM_ID'].map(lambda tid: team_info.get(tid, {}).get('nickname'))
+    team_stats['TEAM_CITY'] = team_stats['TEAM_ID'].map(lambda tid: team_info.get(tid, {}).get('city'))
+    
+    # 按 boxscore 欄位順序排列，其他數據類型的欄位接在後面
+    schema_columns = TRADITIONAL_TEAM_COLUMNS + ADVANCED_TEAM_COLUMNS
+    extra_columns = [col for col in team_stats.columns if col not in schema_columns and col not in BULK_SHARED_COLUMNS]
+    team_stats = team_stats.reindex(columns=schema_columns + extra_columns)
+    
+    team_stats['Game_ID'] = team_stats['GAME_ID']
+    team_stats['SEASON'] = season
+    team_stats['SEASON_TYPE'] = season_type
+    
+    return team_stats
+
+# 以 boxscore 補齊 bulk 數據缺少的欄位
+def fill_missing_from_boxscore(team_stats, season, season_type, max_workers=5, batch_size=10):
+    """
+    bulk 數據中整欄缺失的 boxscore 欄位，才對相關比賽發出逐場 boxscore 請求補齊
+    
+    返回:
+    DataFrame: 補齊後的DataFrame
+    """
+    missing_columns = [col for col in TRADITIONAL_TEAM_COLUMNS + ADVANCED_TEAM_COLUMNS
+                       if team_stats[col].isna().all()]
+    if not missing_columns:
+        return team_stats
+    
+    logger.info(f"bulk 數據缺少欄位 {missing_columns}，以逐場 boxscore 補齊")
+    boxscore_stats = process_games_parallel(
+        team_stats['GAME_ID'].unique().tolist(), season, season_type,
+        batch_size=batch_size, max_workers=max_workers
+    )
+    if boxscore_stats.empty:
+        return team_stats
+    
+    boxscore_stats = boxscore_stats.drop_duplicates(subset=['GAME_ID', 'TEAM_ID']).set_index(['GAME_ID', 'TEAM_ID'])
+    team_stats = team_stats.set_index(['GAME_ID', 'TEAM_ID'])
+    available = [col for col in missing_columns if col in boxscore_stats.columns]
+    team_stats[available] = boxscore_stats[available].reindex(team_stats.index)
+    return team_stats.reset_index()
+
+# 以 bulk 模式處理單個賽季
+def process_season_bulk(season, season_type, teams_list, max_workers=5, batch_size=10):
+    """
+    以聯盟比賽日誌處理單個賽季，每個數據類型一次請求
+    
+    返回:
+    DataFrame: 包含該賽季所有球隊比賽數據的DataFrame
+    """
+    logger.info(f"開始以 bulk 模式處理 {season} 賽季的 {season_type} 數據")
+    
+    combined_stats = get_team_game_stats_bulk(season, season_type, teams_list)
+    if combined_stats.empty:
+        logger.warning(f"沒有獲取到 {season} 賽季的 {season_type} 數據")
+        return pd.DataFrame()
+    
+    if BULK_BOXSCORE_FALLBACK:
+        combined_stats = fill_missing_from_boxscore(
+            combined_stats, season, season_type, max_workers=max_workers, batch_size=batch_size
+        )
+    
+    saved_stats = save_team_game_stats(combined_stats, season, season_type)
+    
+    # bulk 結果已寫入，同步更新比賽任務帳本
+    ledger = load_game_ledger(season, season_type)
+    if transition_games(ledger, combined_stats['GAME_ID'].unique().tolist(), 'written'):
+        save_game_ledger(ledger, season, season_type)
+    
+    return saved_stats
+
+# 球隊比賽數據 CSV 路徑
+def get_team_game_stats_file(season, season_type):
+    """返回賽季球隊比賽數據的 CSV 導出路徑"""
+    season_type_dir = os.path.join(SEASONS_DIR, season, season_type.replace(' ', '_'))
+    return os.path.join(season_type_dir, f"team_game_stats_{season}_{season_type.replace(' ', '_')}.csv")
+
+# 連接存儲
+def connect_store():
+    """連接球隊比賽數據存儲"""
+    conn = sqlite3.connect(STORE_FILE, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+# 確保存儲表格包含所需欄位
+def ensure_store_columns(conn, columns):
+    """表格不存在時建立，新的欄位（例如新增的數據類型）以 ALTER TABLE 加入"""
+    existing = [row[1] for row in conn.execute(f'PRAGMA table_info("{STORE_TABLE}")')]
+    if not existing:
+        column_defs = ', '.join(f'"{col}"' for col in columns)
+        key_defs = ', '.join(f'"{col}"' for col in STORE_KEY)
+        conn.execute(f'CREATE TABLE "{STORE_TABLE}" ({column_defs}, PRIMARY KEY ({key_defs}))')
+        return
+    for col in columns:
+        if col not in existing:
+            conn.execute(f'ALTER TABLE "{STORE_TABLE}" ADD COLUMN "{col}"')
+
+# 保存球隊比賽數據
+def save_team_game_stats(combined_stats, season, season_type):
+    """
+    以 (SEASON, SEASON_TYPE, GAME_ID, TEAM_ID) 為鍵將新的球隊比賽數據 upsert 到存儲，
+    只寫入新數據，不讀取也不重寫已保存的數據；整批寫入在同一個交易中完成
+    
+    返回:
+    DataFrame: 本次寫入的數據
+    """
+    combined_stats = combined_stats.copy()
+    combined_stats['SEASON'] = season
+    combined_stats['SEASON_TYPE'] = season_type
+    combined_stats['GAME_ID'] = combined_stats['GAME_ID'].map(normalize_game_id)
+    if 'Game_ID' in combined_stats.columns:
+        combined_stats['Game_ID'] = combined_stats['GAME_ID']
+    
+    # 去除重複的比賽記錄（同一場比賽會在兩支球隊的記錄中出現）
+    combined_stats = combined_stats.drop_duplicates(subset=['GAME_ID', 'TEAM_ID'], keep='last')
+    
+    columns = combined_stats.columns.tolist()
+    rows = combined_stats.astype(object).where(combined_stats.notna(), None).values.tolist()
+    
+    column_sql = ', '.join(f'"{col}"' for col in columns)
+    placeholders = ', '.join('?' for _ in columns)
+    key_sql = ', '.join(f'"{col}"' for col in STORE_KEY)
+    update_sql = ', '.join(f'"{col}" = excluded."{col}"' for col in columns if col not in STORE_KEY)
+    upsert_sql = (f'INSERT INTO "{STORE_TABLE}" ({column_sql}) VALUES ({placeholders}) '
+                  f'ON CONFLICT ({key_sql}) DO UPDATE SET {update_sql}')
+    
+    with store_lock, closing(connect_store()) as conn:
+        with conn:
+            ensure_store_columns(conn, columns)
+            conn.executemany(upsert_sql, rows)
+    
+    logger.info(f"成功保存 {season} 賽季的 {season_type} 數據，寫入 {len(combined_stats)} 條記錄")
+    
+    return combined_stats
+
+# 讀取球隊比賽數據
+def load_team_game_stats(season, season_type):
+    """
+    由存儲讀取指定賽季類型的所有球隊比賽數據（去除此賽季完全沒有值的欄位）
+    
+    返回:
+    DataFrame: 球隊比賽數據
+    """
+    if not os.path.exists(STORE_FILE):
+        return pd.DataFrame()
+    
+    with closing(connect_store()) as conn:
+        try:
+            df = pd.read_sql_query(
+                f'SELECT * FROM "{STORE_TABLE}" WHERE "SEASON" = ? AND "SEASON_TYPE" = ? ORDER BY "GAME_ID", "TEAM_ID"',
+                conn, params=(season, season_type)
+            )
+        except Exception as e:
+            logger.error(f"讀取存儲時出錯: {e}")
+            return pd.DataFrame()
+    
+    return df.dropna(axis=1, how='all')
+
+# 導入舊版 CSV
+def import_legacy_team_game_stats(season, season_type):
+    """存儲中沒有該賽季類型的數據而舊版 CSV 存在時，將 CSV 導入存儲（只執行一次）"""
+    output_file = get_team_game_stats_file(season, season_type)
+    if not os.path.exists(output_file):
+        return
+    
+    if os.path.exists(STORE_FILE):
+        with closing(connect_store()) as conn:
+            try:
+                count = conn.execute(
+                    f'SELECT COUNT(*) FROM "{STORE_TABLE}" WHERE "SEASON" = ? AND "SEASON_TYPE" = ?',
+                    (season, season_type)
+                ).fetchone()[0]
+            except sqlite3.OperationalError:
+                count = 0
+        if count:
+            return
+    
+    try:
+        legacy_data = pd.read_csv(output_file)
+    except Exception as e:
+        logger.error(f"讀取已保存的數據時出錯: {e}")
+        return
+    
+    if not legacy_data.empty:
+        logger.info(f"將舊版 CSV {output_file} 導入存儲")
+        save_team_game_stats(legacy_data, season, season_type)
+
+# 導出 CSV
+def export_team_game_stats_csv(season, season_type):
+    """由存儲導出 team_game_stats_{season}_{type}.csv（先寫臨時文件再原子替換）"""
+    df = load_team_game_stats(season, season_type)
+    if df.empty:
+        logger.warning(f"存儲中沒有 {season} 賽季的 {season_type} 數據，略過導出")
+        return None
+    
+    output_file = get_team_game_stats_file(season, season_type)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    tmp_file = output_file + '.tmp'
+    df.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, output_file)
+    logger.info(f"已導出 {season} 賽季的 {season_type} 數據到 {output_file}，共 {len(df)} 條記錄")
+    return output_file
+
 # 批量處理比賽詳細數據
 def process_game_batch(game_ids, season, season_type):
     """
@@ -352,7 +696,7 @@ def process_game_batch(game_ids, season, season_type):
         return pd.DataFrame()
 
 # 並行處理多批次比賽
-def process_games_parallel(all_game_ids, season, season_type, batch_size=10, max_workers=5):
+def process_games_parallel(all_game_ids, season, season_type, batch_size=10, max_workers=5, on_batch=None):
     """
     並行處理多批次比賽
     
@@ -362,6 +706,7 @@ def process_games_parallel(all_game_ids, season, season_type, batch_size=10, max
     season_type (str): 賽季類型
     batch_size (int): 每批處理的比賽數量
     max_workers (int): 並行處理的最大工作線程數
+    on_batch (callable): 每批完成時在主線程中以該批數據調用（例如立即寫入存儲），可為 None
     
     返回:
     DataFrame: 包含所有批次比賽詳細數據的DataFrame
@@ -387,6 +732,8 @@ def process_games_parallel(all_game_ids, season, season_type, batch_size=10, max
             try:
                 result = future.result()
                 if not result.empty:
+                    if on_batch is not None:
+                        result = on_batch(result)
                     all_results.append(result)
                     logger.info(f"完成第 {batch_index+1}/{len(game_batches)} 批比賽處理，獲取了 {len(result)} 條記錄")
                 else:
@@ -400,6 +747,134 @@ def process_games_parallel(all_game_ids, season, season_type, batch_size=10, max
     else:
         return pd.DataFrame()
 
+# 統一比賽ID格式
+def normalize_game_id(game_id):
+    """將比賽ID統一為10位字串（CSV讀回時可能變為整數並失去前導零）"""
+    return str(int(game_id)).zfill(10)
+
+# 比賽任務帳本文件路徑
+def get_ledger_file(season, season_type):
+    """返回賽季比賽任務帳本的文件路徑"""
+    return os.path.join(PROGRESS_DIR, f"ledger_{season}_{season_type.replace(' ', '_')}.json")
+
+# 讀取比賽任務帳本
+def load_game_ledger(season, season_type):
+    """
+    讀取比賽任務帳本，不存在時由舊版進度文件初始化
+    
+    舊版 processed_games 只代表「已從比賽日誌發現」，不代表已寫入，
+    因此一律以 pending 載入，再由 verify_game_ledger 依存儲修正。
+    舊帳本中不再使用的狀態（如 fetched）同樣退回 pending。
+    
+    返回:
+    dict: {'processed_teams': [...], 'games': {game_id: state}}
+    """
+    ledger_file = get_ledger_file(season, season_type)
+    if os.path.exists(ledger_file):
+        try:
+            with open(ledger_file, 'r') as f:
+                ledger = json.load(f)
+            ledger['games'] = {gid: state if state in GAME_STATES else 'pending'
+                               for gid, state in ledger['games'].items()}
+            return ledger
+        except Exception as e:
+            logger.error(f"讀取比賽任務帳本時出錯: {e}")
+    
+    ledger = {'processed_teams': [], 'games': {}}
+    
+    progress_file = os.path.join(PROGRESS_DIR, f"progress_{season}_{season_type.replace(' ', '_')}.json")
+    if os.path.exists(progress_file):
+        try:
+            with open(progress_file, 'r') as f:
+                progress = json.load(f)
+            ledger['processed_teams'] = progress.get('processed_teams', [])
+            ledger['games'] = {normalize_game_id(gid): 'pending' for gid in progress.get('processed_games', [])}
+            logger.info(f"由舊版進度文件初始化比賽任務帳本，共 {len(ledger['games'])} 場比賽")
+        except Exception as e:
+            logger.error(f"讀取進度文件時出錯: {e}")
+    
+    return ledger
+
+# 保存比賽任務帳本
+def save_game_ledger(ledger, season, season_type):
+    """以臨時文件加原子替換的方式保存帳本，中斷時不會留下半寫的文件"""
+    ledger_file = get_ledger_file(season, season_type)
+    tmp_file = ledger_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(ledger, f)
+    os.replace(tmp_file, ledger_file)
+
+# 比賽狀態轉換
+def transition_games(ledger, game_ids, state):
+    """
+    在記憶體中將比賽轉換到指定狀態，由調用方在整批轉換後調用 save_game_ledger 持久化
+    
+    只允許向前轉換（pending → written），新發現的比賽以 pending 加入；
+    狀態回退只由 verify_game_ledger 進行。
+    
+    返回:
+    int: 實際轉換的比賽數量
+    """
+    target = GAME_STATES.index(state)
+    changed = 0
+    with ledger_lock:
+        for game_id in game_ids:
+            game_id = normalize_game_id(game_id)
+            current = ledger['games'].get(game_id)
+            if current is None or GAME_STATES.index(current) < target:
+                ledger['games'][game_id] = state
+                changed += 1
+    return changed
+
+# 讀取存儲中已寫入的比賽
+def get_written_game_ids(season, season_type):
+    """返回存儲中兩支球隊數據都已存在的比賽ID集合"""
+    if not os.path.exists(STORE_FILE):
+        return set()
+    
+    with closing(connect_store()) as conn:
+        try:
+            rows = conn.execute(
+                f'SELECT "GAME_ID" FROM "{STORE_TABLE}" WHERE "SEASON" = ? AND "SEASON_TYPE" = ? '
+                f'GROUP BY "GAME_ID" HAVING COUNT(DISTINCT "TEAM_ID") >= 2',
+                (season, season_type)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return set()
+    
+    return {normalize_game_id(row[0]) for row in rows}
+
+# 核對帳本與存儲
+def verify_game_ledger(ledger, season, season_type):
+    """
+    以存儲核對帳本：帳本標記為 written 但存儲中缺少的比賽退回 pending，
+    存儲中已有但帳本未標記的比賽補記為 written
+    
+    返回:
+    dict: {'missing': 退回 pending 的比賽, 'untracked': 補記為 written 的比賽}
+    """
+    written_in_store = get_written_game_ids(season, season_type)
+    
+    with ledger_lock:
+        missing = [gid for gid, state in ledger['games'].items()
+                   if state == 'written' and gid not in written_in_store]
+        untracked = [gid for gid in written_in_store if ledger['games'].get(gid) != 'written']
+        
+        for gid in missing:
+            ledger['games'][gid] = 'pending'
+        for gid in untracked:
+            ledger['games'][gid] = 'written'
+        
+        if missing or untracked:
+            save_game_ledger(ledger, season, season_type)
+    
+    if missing:
+        logger.warning(f"{season} {season_type}: {len(missing)} 場比賽在帳本中為 written 但存儲缺少，已退回 pending")
+    if untracked:
+        logger.info(f"{season} {season_type}: {len(untracked)} 場比賽已在存儲中，補記為 written")
+    
+    return {'missing': missing, 'untracked': untracked}
+
 # 處理單個賽季
 def process_season(season, season_type, teams_list, max_workers=5, batch_size=10):
     """
@@ -415,30 +890,20 @@ def process_season(season, season_type, teams_list, max_workers=5, batch_size=10
     返回:
     DataFrame: 包含該賽季所有球隊比賽數據的DataFrame
     """
-    logger.info(f"開始處理 {season} 賽季的 {season_type} 數據")
-    
-    # 檢查進度文件
-    progress_file = os.path.join(PROGRESS_DIR, f"progress_{season}_{season_type.replace(' ', '_')}.json")
-    
-    # 已處理的球隊和比賽
-    processed_teams = set()
-    processed_games = set()
+    if FETCH_MODE == 'bulk':
+        return process_season_bulk(season, season_type, teams_list, max_workers=max_workers, batch_size=batch_size)
     
-    # 讀取進度
-    if os.path.exists(progress_file):
-        try:
-            with open(progress_file, 'r') as f:
-                progress = json.load(f)
-                processed_teams = set(progress.get('processed_teams', []))
-                processed_games = set(progress.get('processed_games', []))
-            logger.info(f"從進度文件中恢復，已處理 {len(processed_teams)} 支球隊和 {len(processed_games)} 場比賽")
-        except Exception as e:
-            logger.error(f"讀取進度文件時出錯: {e}")
+    logger.info(f"開始處理 {season} 賽季的 {season_type} 數據")
     
-    # 收集所有球隊的比賽ID
-    all_game_ids = []
+    # 讀取比賽任務帳本，並以存儲核對
+    import_legacy_team_game_stats(season, season_type)
+    ledger = load_game_ledger(season, season_type)
+    verify_game_ledger(ledger, season, season_type)
+    processed_teams = set(ledger['processed_teams'])
+    logger.info(f"從帳本恢復，已處理 {len(processed_teams)} 支球隊，已寫入 "
+                f"{sum(1 for state in ledger['games'].values() if state == 'written')}/{len(ledger['games'])} 場比賽")
     
-    # 並行收集所有球隊的比賽日誌
+    # 並行收集所有球隊的比賽日誌，新發現的比賽以 pending 記入帳本
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
         future_to_team = {
             executor.submit(get_team_game_log, team['id'], season, season_type): team
@@ -450,82 +915,51 @@ def process_season(season, season_type, teams_list, max_workers=5, batch_size=10
             try:
                 game_log_df = future.result()
                 if not game_log_df.empty:
-                    # 獲取比賽ID
-                    game_ids = game_log_df['Game_ID'].unique().tolist()
-                    # 只添加未處理過的比賽ID
-                    new_game_ids = [gid for gid in game_ids if gid not in processed_games]
-                    all_game_ids.extend(new_game_ids)
-                    processed_games.update(new_game_ids)
+                    transition_games(ledger, game_log_df['Game_ID'].unique().tolist(), 'pending')
                 
-                # 更新已處理的球隊
-                processed_teams.add(str(team['id']))
-                
-                # 保存進度
-                progress = {
-                    'processed_teams': list(processed_teams),
-                    'processed_games': list(processed_games)
-                }
-                
-                with open(progress_file, 'w') as f:
-                    json.dump(progress, f)
+                # 更新已處理的球隊，與新發現的比賽一起寫入帳本（比賽已記入帳本後才標記）
+                with ledger_lock:
+                    ledger['processed_teams'].append(str(team['id']))
+                    save_game_ledger(ledger, season, season_type)
                 
             except Exception as e:
                 logger.error(f"處理球隊 {team['full_name']} 的比賽日誌時出錯: {e}")
     
-    # 去除重複的比賽ID
-    all_game_ids = list(set(all_game_ids))
-    logger.info(f"收集了 {len(all_game_ids)} 場未處理的比賽")
+    # 所有尚未寫入的比賽（包括先前中斷或失敗的比賽）
+    all_game_ids = sorted(gid for gid, state in ledger['games'].items() if state != 'written')
+    logger.info(f"收集了 {len(all_game_ids)} 場未寫入的比賽")
     
     # 如果沒有新的比賽需要處理
     if not all_game_ids:
         logger.info(f"{season} 賽季的 {season_type} 沒有新的比賽需要處理")
         
-        # 檢查是否有已保存的數據
-        season_type_dir = os.path.join(SEASONS_DIR, season, season_type.replace(' ', '_'))
-        output_file = os.path.join(season_type_dir, f"team_game_stats_{season}_{season_type.replace(' ', '_')}.csv")
-        
-        if os.path.exists(output_file):
-            try:
-                return pd.read_csv(output_file)
-            except Exception as e:
-                logger.error(f"讀取已保存的數據時出錯: {e}")
-                return pd.DataFrame()
-        else:
-            return pd.DataFrame()
+        # 返回已保存的數據
+        return load_team_game_stats(season, season_type)
+    
+    # 每批比賽完成後立即寫入存儲並標記為 written，中斷時只需重新抓取未完成的批次
+    def save_batch(batch_stats):
+        saved_batch = save_team_game_stats(batch_stats, season, season_type)
+        if transition_games(ledger, saved_batch['GAME_ID'].unique().tolist(), 'written'):
+            with ledger_lock:
+                save_game_ledger(ledger, season, season_type)
+        return saved_batch
     
     # 並行處理所有比賽
-    combined_stats = process_games_parallel(
+    saved_stats = process_games_parallel(
         all_game_ids, 
         season, 
         season_type, 
         batch_size=batch_size,
-        max_workers=max_workers
+        max_workers=max_workers,
+        on_batch=save_batch
     )
     
-    if not combined_stats.empty:
-        # 去除重複的比賽記錄（同一場比賽會在兩支球隊的記錄中出現）
-        combined_stats = combined_stats.drop_duplicates(subset=['GAME_ID', 'TEAM_ID'])
-        
-        # 保存到文件
-        season_type_dir = os.path.join(SEASONS_DIR, season, season_type.replace(' ', '_'))
-        output_file = os.path.join(season_type_dir, f"team_game_stats_{season}_{season_type.replace(' ', '_')}.csv")
+    if not saved_stats.empty:
+        pending_count = sum(1 for state in ledger['games'].values() if state != 'written')
+        if pending_count:
+            logger.warning(f"{season} 賽季的 {season_type} 仍有 {pending_count} 場比賽未寫入，將於下次執行時重試")
         
-        # 檢查是否有已保存的數據
-        if os.path.exists(output_file):
-            try:
-                existing_data = pd.read_csv(output_file)
-                # 合併新舊數據
-                combined_stats = pd.concat([existing_data, combined_stats], ignore_index=True)
-                # 去除重複的記錄
-                combined_stats = combined_stats.drop_duplicates(subset=['GAME_ID', 'TEAM_ID'])
-                logger.info(f"合併了已存在的數據，總記錄數: {len(combined_stats)}")
-            except Exception as e:
-                logger.error(f"讀取已保存的數據時出錯: {e}")
-        
-        combined_stats.to_csv(output_file, index=False)
-        logger.info(f"成功保存 {season} 賽季的 {season_type} 數據，共 {len(combined_stats)} 條記錄")
-        
-        return combined_stats
+        return saved_stats
     else:
         logger.warning(f"沒有獲取到 {season} 賽季的 {season_type} 數據")
         return pd.DataFrame()
@@ -630,6 +1064,12 @@ def main():
             max_workers=2
         )
         
+        # 由存儲導出各賽季的 CSV
+        if EXPORT_CSV:
+            for season in SEASONS:
+                for season_type in SEASON_TYPES:
+                    export_team_game_stats_csv(season, season_type)
+        
         # 生成欄位說明文件
         generate_field_description()
         
@@ -1,8 +1,12 @@
-from nba_api.stats.endpoints import leaguedashteamstats, leaguestandings, teamgamelog
+from nba_api.stats.endpoints import leaguedashteamstats, leaguestandings, leaguegamelog
 from nba_api.stats.static import teams
 import pandas as pd
 import time
+import random
 import os
+import argparse
+import threading
+import concurrent.futures
 
 # 定義要抓取的賽季
 seasons = [
@@ -28,8 +32,45 @@ measure_types = [
     'Defense'
 ]
 
-# 創建資料夾用於存儲臨時數據
-os.makedirs('temp_data', exist_ok=True)
+# 基礎欄位（來自 Base 測量類型）
+BASE_COLUMNS = ['TEAM_ID', 'TEAM_NAME', 'GP', 'W', 'L', 'W_PCT',
+                'MIN', 'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A',
+                'FG3_PCT', 'FTM', 'FTA', 'FT_PCT', 'OREB', 'DREB',
+                'REB', 'AST', 'TOV', 'STL', 'BLK', 'BLKA', 'PF',
+                'PFD', 'PTS', 'PLUS_MINUS', 'SEASON', 'SEASON_TYPE']
+
+# 其他測量類型中不重複加入的欄位
+MEASURE_EXCLUDED_COLUMNS = ['TEAM_ID', 'TEAM_NAME', 'GP', 'W', 'L', 'W_PCT', 'SEASON', 'SEASON_TYPE', 'MEASURE_TYPE']
+
+# 對齊各測量類型的索引
+MEASURE_INDEX = ['TEAM_ID', 'SEASON', 'SEASON_TYPE']
+
+# 團隊統計數據的輸出文件
+STATS_OUTPUT_FILES = {
+    'Regular Season': 'nba_regular_season_stats_2015_to_2024.csv',
+    'Playoffs': 'nba_playoff_stats_2015_to_2024.csv',
+}
+
+# 資料夾：臨時數據與 API 回應快取
+TEMP_DIR = 'temp_data'
+CACHE_DIR = 'cache'
+
+# 全局鎖，用於控制並行請求的速率
+request_lock = threading.Lock()
+last_request_time = 0.0
+min_request_interval = 0.6  # 最小請求間隔時間（秒）
+
+def rate_limited_request(func, *args, **kwargs):
+    """控制請求速率：所有線程共用同一個最小請求間隔"""
+    global last_request_time
+    
+    with request_lock:
+        elapsed = time.time() - last_request_time
+        if elapsed < min_request_interval:
+            time.sleep(min_request_interval - elapsed)
+        last_request_time = time.time()
+    
+    return func(*args, **kwargs)
 
 def determine_playoff_round(wins, season):
     """
@@ -67,15 +108,12 @@ def determine_playoff_round(wins, season):
         else:
             return "總決賽"
 
-
-# 為每個賽季處理數據
-for season in seasons:
-    print(f"\n正在處理 {season} 賽季的數據...")
-    
-    # 抓取聯盟排名數據
+def fetch_standings(season):
+    """抓取聯盟排名數據並保存到臨時資料夾"""
     print(f"正在抓取 {season} 的聯盟排名數據...")
     try:
-        standings = leaguestandings.LeagueStandings(
+        standings = rate_limited_request(
+            leaguestandings.LeagueStandings,
             league_id='00',
             season=season,
             season_type='Regular Season'
@@ -85,225 +123,379 @@ for season in seasons:
         df_standings['SEASON'] = season
         
         # 保存當前賽季的排名數據
-        df_standings.to_csv(f'temp_data/standings_{season}.csv', index=False)
+        df_standings.to_csv(f'{TEMP_DIR}/standings_{season}.csv', index=False)
         print(f"  {season} 聯盟排名數據已保存")
-        
-        time.sleep(0.1)
+        return df_standings
     except Exception as e:
         print(f"抓取 {season} 的聯盟排名數據時出錯: {e}")
-    
-    # 抓取每支球隊的季後賽進程數據
-    playoff_progress_data = []
+        return pd.DataFrame()
 
-    for team_id, team_name in team_dict.items():
-        print(f"  正在抓取 {team_name} 的季後賽進程數據...")
-        
+def fetch_league_team_game_log(season, season_type):
+    """
+    以一次 LeagueGameLog 請求獲取聯盟所有球隊在指定賽季類型的比賽記錄
+
+    返回:
+    DataFrame: 每支球隊每場比賽一行，依日期由近到遠排列；
+    GAME_DATE 轉為與 TeamGameLog 相同的格式 (例如: APR 28, 2016)
+    重試後仍失敗時拋出最後一次的異常
+    """
+    max_retries = 5
+    retry_delay = 0.5
+    
+    for attempt in range(max_retries):
         try:
-            game_log = teamgamelog.TeamGameLog(
-                team_id=team_id,
+            game_log = rate_limited_request(
+                leaguegamelog.LeagueGameLog,
                 season=season,
-                season_type_all_star='Playoffs'
+                season_type_all_star=season_type,
+                player_or_team_abbreviation='T'
             )
-            
             df_games = game_log.get_data_frames()[0]
+            break
+        except Exception as e:
+            if attempt < max_retries - 1:
+                current_delay = retry_delay * (1.5 ** attempt) + random.uniform(0.1, 0.5)
+                print(f"  抓取 {season} {season_type} 比賽記錄時出錯 (嘗試 {attempt+1}/{max_retries}): {e}，{current_delay:.2f} 秒後重試")
+                time.sleep(current_delay)
+            else:
+                raise
+    
+    if df_games.empty:
+        return df_games
+    
+    game_dates = pd.to_datetime(df_games['GAME_DATE'])
+    df_games = df_games.assign(_GAME_DATE=game_dates).sort_values(['_GAME_DATE', 'GAME_ID'], ascending=False)
+    df_games['GAME_DATE'] = df_games['_GAME_DATE'].dt.strftime('%b %d, %Y').str.upper()
+    return df_games.drop(columns='_GAME_DATE')
+
+def fetch_playoff_progress(season):
+    """
+    由聯盟季後賽與附加賽比賽記錄（每個賽季各一次請求）推導每支球隊的季後賽進程，
+    並保存到臨時資料夾
+    """
+    print(f"正在抓取 {season} 的季後賽與附加賽比賽記錄...")
+    
+    try:
+        playoff_games = fetch_league_team_game_log(season, 'Playoffs')
+    except Exception as e:
+        print(f"  抓取 {season} 的季後賽進程數據時出錯: {e}")
+        playoff_progress_df = pd.DataFrame([{
+            'SEASON': season,
+            'TEAM_ID': team_id,
+            'TEAM_NAME': team_name,
+            'PLAYOFF_GAMES': None,
+            'PLAYOFF_ROUND': "抓取出錯",
+            'WINS': None,
+            'LOSSES': None,
+            'LAST_GAME_DATE': None,
+            'IS_CHAMPION': False
+        } for team_id, team_name in team_dict.items()])
+        playoff_progress_df.to_csv(f'{TEMP_DIR}/playoff_progress_{season}.csv', index=False)
+        return playoff_progress_df
+    
+    # 附加賽僅適用於2020-21賽季之後；附加賽記錄失敗時仍以季後賽記錄推導各隊進程，
+    # 只有未進入季後賽的球隊無法判斷是否參加附加賽
+    play_in_failed = False
+    play_in_games = pd.DataFrame()
+    if season >= '2020-21':
+        try:
+            play_in_games = fetch_league_team_game_log(season, 'PlayIn')
+        except Exception as e:
+            print(f"  抓取 {season} 的附加賽比賽記錄時出錯: {e}")
+            play_in_failed = True
+    
+    playoff_by_team = {team_id: games for team_id, games in playoff_games.groupby('TEAM_ID')} if not playoff_games.empty else {}
+    play_in_by_team = {team_id: games for team_id, games in play_in_games.groupby('TEAM_ID')} if not play_in_games.empty else {}
+    
+    playoff_progress_data = []
+    
+    for team_id, team_name in team_dict.items():
+        df_games = playoff_by_team.get(team_id)
+        
+        if df_games is None:
+            play_in_team_games = play_in_by_team.get(team_id)
             
-            if df_games.empty:
-                # 檢查是否有附加賽數據（僅適用於2020-21賽季之後）
-                if season >= '2020-21':
-                    play_in_game_log = teamgamelog.TeamGameLog(
-                        team_id=team_id,
-                        season=season,
-                        season_type_all_star='PlayIn'  # 附加賽類型
-                    )
-                    play_in_games = play_in_game_log.get_data_frames()[0]
-                    
-                    if not play_in_games.empty:
-                        play_in_wins = sum(play_in_games['WL'] == 'W')
-                        play_in_losses = sum(play_in_games['WL'] == 'L')
-                        last_game_date = play_in_games['GAME_DATE'].iloc[0]
-                        
-                        playoff_progress_data.append({
-                            'SEASON': season,
-                            'TEAM_ID': team_id,
-                            'TEAM_NAME': team_name,
-                            'PLAYOFF_GAMES': len(play_in_games),
-                            'PLAYOFF_ROUND': "附加賽",
-                            'WINS': play_in_wins,
-                            'LOSSES': play_in_losses,
-                            'LAST_GAME_DATE': last_game_date,
-                            'ADVANCED_TO_PLAYOFFS': play_in_wins > 0 and play_in_losses == 0
-                        })
-                        continue
+            if play_in_team_games is not None:
+                play_in_wins = sum(play_in_team_games['WL'] == 'W')
+                play_in_losses = sum(play_in_team_games['WL'] == 'L')
+                last_game_date = play_in_team_games['GAME_DATE'].iloc[0]
                 
-                # 如果沒有季後賽或附加賽數據
                 playoff_progress_data.append({
                     'SEASON': season,
                     'TEAM_ID': team_id,
                     'TEAM_NAME': team_name,
-                    'PLAYOFF_GAMES': 0,
-                    'PLAYOFF_ROUND': "未進入季後賽",
-                    'WINS': 0,
-                    'LOSSES': 0,
-                    'LAST_GAME_DATE': None,
-                    'ADVANCED_TO_PLAYOFFS': False
+                    'PLAYOFF_GAMES': len(play_in_team_games),
+                    'PLAYOFF_ROUND': "附加賽",
+                    'WINS': play_in_wins,
+                    'LOSSES': play_in_losses,
+                    'LAST_GAME_DATE': last_game_date,
+                    'ADVANCED_TO_PLAYOFFS': play_in_wins > 0 and play_in_losses == 0
                 })
-            else:
-                num_playoff_games = len(df_games)
-                wins = sum(df_games['WL'] == 'W')
-                losses = sum(df_games['WL'] == 'L')
-                last_game_date = df_games['GAME_DATE'].iloc[0]
-                playoff_round = determine_playoff_round(wins, season)
-                
-                # 檢查是否為總冠軍
-                is_champion = False
-                if playoff_round == "總決賽" and wins >= 16:  # 4+4+4+4=16場勝利代表贏得總冠軍
-                    # 檢查最後一場比賽是否獲勝
-                    last_game = df_games.iloc[0]  # 最近的比賽
-                    if last_game['WL'] == 'W':
-                        is_champion = True
-                
+                continue
+            
+            if play_in_failed:
                 playoff_progress_data.append({
                     'SEASON': season,
                     'TEAM_ID': team_id,
                     'TEAM_NAME': team_name,
-                    'PLAYOFF_GAMES': num_playoff_games,
-                    'PLAYOFF_ROUND': playoff_round,
-                    'WINS': wins,
-                    'LOSSES': losses,
-                    'LAST_GAME_DATE': last_game_date,
-                    'IS_CHAMPION': is_champion
+                    'PLAYOFF_GAMES': None,
+                    'PLAYOFF_ROUND': "抓取出錯",
+                    'WINS': None,
+                    'LOSSES': None,
+                    'LAST_GAME_DATE': None,
+                    'ADVANCED_TO_PLAYOFFS': False
                 })
+                continue
             
-            time.sleep(1)
-        except Exception as e:
-            print(f"  抓取 {team_name} 的季後賽進程數據時出錯: {e}")
+            # 如果沒有季後賽或附加賽數據
             playoff_progress_data.append({
                 'SEASON': season,
                 'TEAM_ID': team_id,
                 'TEAM_NAME': team_name,
-                'PLAYOFF_GAMES': None,
-                'PLAYOFF_ROUND': "抓取出錯",
-                'WINS': None,
-                'LOSSES': None,
+                'PLAYOFF_GAMES': 0,
+                'PLAYOFF_ROUND': "未進入季後賽",
+                'WINS': 0,
+                'LOSSES': 0,
                 'LAST_GAME_DATE': None,
-                'IS_CHAMPION': False
+                'ADVANCED_TO_PLAYOFFS': False
+            })
+        else:
+            num_playoff_games = len(df_games)
+            wins = sum(df_games['WL'] == 'W')
+            losses = sum(df_games['WL'] == 'L')
+            last_game_date = df_games['GAME_DATE'].iloc[0]
+            playoff_round = determine_playoff_round(wins, season)
+            
+            # 檢查是否為總冠軍
+            is_champion = False
+            if playoff_round == "總決賽" and wins >= 16:  # 4+4+4+4=16場勝利代表贏得總冠軍
+                # 檢查最後一場比賽是否獲勝
+                last_game = df_games.iloc[0]  # 最近的比賽
+                if last_game['WL'] == 'W':
+                    is_champion = True
+            
+            playoff_progress_data.append({
+                'SEASON': season,
+                'TEAM_ID': team_id,
+                'TEAM_NAME': team_name,
+                'PLAYOFF_GAMES': num_playoff_games,
+                'PLAYOFF_ROUND': playoff_round,
+                'WINS': wins,
+                'LOSSES': losses,
+                'LAST_GAME_DATE': last_game_date,
+                'IS_CHAMPION': is_champion
             })
-
     
     # 保存當前賽季的季後賽進程數據
     playoff_progress_df = pd.DataFrame(playoff_progress_data)
-    playoff_progress_df.to_csv(f'temp_data/playoff_progress_{season}.csv', index=False)
+    playoff_progress_df.to_csv(f'{TEMP_DIR}/playoff_progress_{season}.csv', index=False)
     print(f"  {season} 季後賽進程數據已保存")
+    return playoff_progress_df
+
+def fetch_team_measure(season, season_type, measure_type, refresh=False):
+    """
+    抓取單一 (賽季, 賽季類型, 測量類型) 的團隊統計數據，按三者快取
     
-    # 抓取每種賽季類型的團隊統計數據
-    for season_type in season_types:
-        print(f"正在抓取 {season} {season_type} 的團隊統計數據...")
+    返回:
+    DataFrame: 團隊統計數據，失敗時為空 DataFrame
+    """
+    cache_file = os.path.join(CACHE_DIR, f"{season}_{season_type.replace(' ', '_')}_{measure_type.replace(' ', '_')}.pkl")
+    if not refresh and os.path.exists(cache_file):
+        try:
+            return pd.read_pickle(cache_file)
+        except Exception as e:
+            print(f"  讀取快取 {cache_file} 時出錯: {e}")
+    
+    print(f"  正在抓取 {season} {season_type} 的 {measure_type} 數據...")
+    
+    try:
+        team_stats = rate_limited_request(
+            leaguedashteamstats.LeagueDashTeamStats,
+            season=season,
+            season_type_all_star=season_type,
+            measure_type_detailed_defense=measure_type,
+            per_mode_detailed='PerGame',  # 使用每場平均數據
+            plus_minus='Y',
+            rank='Y',
+            pace_adjust='N',
+            league_id_nullable='00'
+        )
         
-        # 為每個測量類型創建字典
-        measure_type_dfs = {}
+        df = team_stats.get_data_frames()[0]
+    except Exception as e:
+        print(f"抓取 {season} {season_type} 的 {measure_type} 數據時出錯: {e}")
+        return pd.DataFrame()
+    
+    # 確保數據不為空
+    if not df.empty:
+        # 添加元數據
+        df['SEASON'] = season
+        df['SEASON_TYPE'] = season_type
+        df['MEASURE_TYPE'] = measure_type
+        df.to_pickle(cache_file)
+    
+    return df
+
+def fetch_all_team_measures(seasons_to_fetch, max_workers=8, refresh=False):
+    """
+    以線程池並行抓取所有 (賽季, 賽季類型, 測量類型) 的團隊統計數據，
+    請求速率由 rate_limited_request 統一控制
+    
+    返回:
+    dict: {(season, season_type): {measure_type: DataFrame}}
+    """
+    tasks = [(season, season_type, measure_type)
+             for season in seasons_to_fetch
+             for season_type in season_types
+             for measure_type in measure_types]
+    print(f"正在並行抓取 {len(tasks)} 組團隊統計數據（並行數 {max_workers}）...")
+    
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_task = {
+            executor.submit(fetch_team_measure, season, season_type, measure_type, refresh): (season, season_type, measure_type)
+            for season, season_type, measure_type in tasks
+        }
+        for future in concurrent.futures.as_completed(future_to_task):
+            season, season_type, measure_type = future_to_task[future]
+            df = future.result()
+            if not df.empty:
+                results.setdefault((season, season_type), {})[measure_type] = df
+    
+    return results
+
+def merge_measure_types(all_measures):
+    """
+    一次合併所有賽季、賽季類型的不同測量類型數據
+    
+    每個測量類型先跨賽季串接，以 (TEAM_ID, SEASON, SEASON_TYPE) 為索引，
+    依 measure_types 的順序保留尚未出現的欄位（先出現者優先），
+    最後以單次 concat(axis=1) 對齊到 Base 的索引上。
+    
+    參數:
+    all_measures (dict): {(season, season_type): {measure_type: DataFrame}}
+    
+    返回:
+    DataFrame: 所有賽季、賽季類型的團隊統計數據
+    """
+    frames_by_measure = {}
+    for (season, season_type), measure_type_dfs in all_measures.items():
+        if 'Base' not in measure_type_dfs:
+            print(f"  {season} {season_type} 缺少基礎(Base)測量類型數據，無法合併")
+            continue
+        for measure_type, df in measure_type_dfs.items():
+            frames_by_measure.setdefault(measure_type, []).append(df)
+    
+    if 'Base' not in frames_by_measure:
+        return pd.DataFrame()
+    
+    base_df = pd.concat(frames_by_measure['Base'], ignore_index=True)[BASE_COLUMNS].set_index(MEASURE_INDEX)
+    aligned = [base_df]
+    taken_columns = set(BASE_COLUMNS)
+    
+    for measure_type in measure_types:
+        if measure_type == 'Base' or measure_type not in frames_by_measure:
+            continue
         
-        for measure_type in measure_types:
-            print(f"  正在抓取 {measure_type} 數據...")
-            
-            try:
-                team_stats = leaguedashteamstats.LeagueDashTeamStats(
-                    season=season,
-                    season_type_all_star=season_type,
-                    measure_type_detailed_defense=measure_type,
-                    per_mode_detailed='PerGame',  # 使用每場平均數據
-                    plus_minus='Y',
-                    rank='Y',
-                    pace_adjust='N',
-                    league_id_nullable='00'
-                )
-                
-                df = team_stats.get_data_frames()[0]
-                
-                # 確保數據不為空
-                if not df.empty:
-                    # 添加元數據
-                    df['SEASON'] = season
-                    df['SEASON_TYPE'] = season_type
-                    df['MEASURE_TYPE'] = measure_type
-                    
-                    # 存儲到字典中
-                    measure_type_dfs[measure_type] = df
-                
-                time.sleep(0.1)
-            except Exception as e:
-                print(f"抓取 {season} {season_type} 的 {measure_type} 數據時出錯: {e}")
-                continue
+        df = pd.concat(frames_by_measure[measure_type], ignore_index=True)
+        new_columns = [col for col in df.columns
+                       if col not in taken_columns and col not in MEASURE_EXCLUDED_COLUMNS]
+        if not new_columns:
+            continue
         
-        # 合併不同測量類型的數據
-        if measure_type_dfs:
-            # 首先使用 Base 測量類型作為基礎
-            if 'Base' in measure_type_dfs:
-                base_df = measure_type_dfs['Base']
-                
-                # 定義要保留的基礎欄位
-                base_columns = ['TEAM_ID', 'TEAM_NAME', 'GP', 'W', 'L', 'W_PCT', 
-                               'MIN', 'FGM', 'FGA', 'FG_PCT', 'FG3M', 'FG3A', 
-                               'FG3_PCT', 'FTM', 'FTA', 'FT_PCT', 'OREB', 'DREB', 
-                               'REB', 'AST', 'TOV', 'STL', 'BLK', 'BLKA', 'PF', 
-                               'PFD', 'PTS', 'PLUS_MINUS', 'SEASON', 'SEASON_TYPE']
-                
-                # 創建最終的DataFrame
-                final_df = base_df[base_columns].copy()
-                
-                # 添加其他測量類型的欄位
-                for measure_type, df in measure_type_dfs.items():
-                    if measure_type != 'Base':
-                        # 排除已經在final_df中的欄位
-                        existing_columns = final_df.columns.tolist()
-                        new_columns = [col for col in df.columns if col not in existing_columns 
-                                      and col not in ['TEAM_ID', 'TEAM_NAME', 'GP', 'W', 'L', 'W_PCT', 'SEASON', 'SEASON_TYPE', 'MEASURE_TYPE']]
-                        
-                        # 合併新欄位
-                        if new_columns:
-                            # 以TEAM_ID和SEASON作為合併鍵
-                            merge_df = df[['TEAM_ID', 'SEASON'] + new_columns]
-                            final_df = pd.merge(final_df, merge_df, on=['TEAM_ID', 'SEASON'], how='left')
-                
-                # 保存合併後的數據
-                output_filename = f'temp_data/{season_type.lower().replace(" ", "_")}_{season}.csv'
-                final_df.to_csv(output_filename, index=False)
-                print(f"  {season} {season_type} 數據已保存到 {output_filename}")
-            else:
-                print(f"  {season} {season_type} 缺少基礎(Base)測量類型數據，無法合併")
+        taken_columns.update(new_columns)
+        aligned.append(df.drop_duplicates(MEASURE_INDEX).set_index(MEASURE_INDEX)[new_columns])
+    
+    final_df = pd.concat(aligned, axis=1, join='outer').reindex(base_df.index).reset_index()
+    extra_columns = [col for col in final_df.columns if col not in BASE_COLUMNS]
+    return final_df[BASE_COLUMNS + extra_columns]
 
-# 合併所有賽季的數據
-print("\n正在合併所有賽季的數據...")
+def save_team_stats(final_df, seasons_fetched):
+    """
+    按賽季類型保存團隊統計數據；輸出文件中不在本次抓取範圍內的賽季保留原有數據
+    """
+    for season_type, output_file in STATS_OUTPUT_FILES.items():
+        type_df = final_df[final_df['SEASON_TYPE'] == season_type]
+        
+        if os.path.exists(output_file):
+            existing_df = pd.read_csv(output_file)
+            existing_df = existing_df[~existing_df['SEASON'].isin(seasons_fetched)]
+            type_df = pd.concat([existing_df, type_df], ignore_index=True)
+        
+        if type_df.empty:
+            continue
+        
+        type_df.sort_values(['SEASON', 'TEAM_ID']).to_csv(output_file, index=False)
+        print(f"  {season_type} 團隊統計數據已保存到 {output_file}")
 
-# 合併例行賽數據
-regular_season_files = [f for f in os.listdir('temp_data') if f.startswith('regular_season_')]
-if regular_season_files:
-    regular_season_dfs = [pd.read_csv(f'temp_data/{file}') for file in regular_season_files]
-    all_regular_season_df = pd.concat(regular_season_dfs, ignore_index=True)
-    all_regular_season_df.to_csv('nba_regular_season_stats_2015_to_2024.csv', index=False)
-    print("所有例行賽數據已合併保存")
+def combine_temp_files():
+    """合併臨時資料夾中所有賽季的聯盟排名與季後賽進程數據"""
+    print("\n正在合併所有賽季的數據...")
+    
+    outputs = [
+        ('standings_', 'nba_league_standings_2015_to_2024.csv', "所有聯盟排名數據已合併保存"),
+        ('playoff_progress_', 'nba_playoff_progress_2015_to_2024.csv', "所有季後賽進程數據已合併保存"),
+    ]
+    
+    for prefix, output_file, message in outputs:
+        files = [f for f in os.listdir(TEMP_DIR) if f.startswith(prefix)]
+        if files:
+            dfs = [pd.read_csv(f'{TEMP_DIR}/{file}') for file in files]
+            pd.concat(dfs, ignore_index=True).to_csv(output_file, index=False)
+            print(message)
 
-# 合併季後賽數據
-playoff_files = [f for f in os.listdir('temp_data') if f.startswith('playoffs_')]
-if playoff_files:
-    playoff_dfs = [pd.read_csv(f'temp_data/{file}') for file in playoff_files]
-    all_playoff_df = pd.concat(playoff_dfs, ignore_index=True)
-    all_playoff_df.to_csv('nba_playoff_stats_2015_to_2024.csv', index=False)
-    print("所有季後賽數據已合併保存")
+def run(seasons_to_fetch=None, max_workers=8, refresh=False, fetch_standings_data=True, fetch_playoff_data=True):
+    """
+    執行完整的抓取流程：聯盟排名、季後賽進程、團隊統計數據，最後合併所有賽季
+    
+    參數:
+    seasons_to_fetch (list): 要抓取的賽季，預設為 seasons
+    max_workers (int): 團隊統計數據的並行請求數
+    refresh (bool): 忽略快取重新抓取團隊統計數據
+    fetch_standings_data (bool): 是否抓取聯盟排名
+    fetch_playoff_data (bool): 是否抓取季後賽進程
+    """
+    seasons_to_fetch = seasons_to_fetch or seasons
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    
+    for season in seasons_to_fetch:
+        print(f"\n正在處理 {season} 賽季的數據...")
+        if fetch_standings_data:
+            fetch_standings(season)
+        if fetch_playoff_data:
+            fetch_playoff_progress(season)
+    
+    # 抓取每種賽季類型的團隊統計數據
+    all_measures = fetch_all_team_measures(seasons_to_fetch, max_workers=max_workers, refresh=refresh)
+    final_df = merge_measure_types(all_measures)
+    if not final_df.empty:
+        save_team_stats(final_df, seasons_to_fetch)
+    
+    # 合併所有賽季的數據
+    combine_temp_files()
+    
+    print("\n數據抓取和合併完成!")
 
-# 合併排名數據
-standings_files = [f for f in os.listdir('temp_data') if f.startswith('standings_')]
-if standings_files:
-    standings_dfs = [pd.read_csv(f'temp_data/{file}') for file in standings_files]
-    all_standings_df = pd.concat(standings_dfs, ignore_index=True)
-    all_standings_df.to_csv('nba_league_standings_2015_to_2024.csv', index=False)
-    print("所有聯盟排名數據已合併保存")
+def parse_args():
+    """解析命令列參數"""
+    parser = argparse.ArgumentParser(description="抓取NBA球隊賽季表現、聯盟排名與季後賽進程")
+    parser.add_argument('--seasons', nargs='+', default=seasons, help="要抓取的賽季，例如 2023-24 2024-25")
+    parser.add_argument('--workers', type=int, default=8, help="團隊統計數據的並行請求數")
+    parser.add_argument('--refresh', action='store_true', help="忽略快取重新抓取團隊統計數據")
+    parser.add_argument('--skip-standings', action='store_true', help="不抓取聯盟排名")
+    parser.add_argument('--skip-playoffs', action='store_true', help="不抓取季後賽進程")
+    return parser.parse_args()
 
-# 合併季後賽進程數據
-playoff_progress_files = [f for f in os.listdir('temp_data') if f.startswith('playoff_progress_')]
-if playoff_progress_files:
-    playoff_progress_dfs = [pd.read_csv(f'temp_data/{file}') for file in playoff_progress_files]
-    all_playoff_progress_df = pd.concat(playoff_progress_dfs, ignore_index=True)
-    all_playoff_progress_df.to_csv('nba_playoff_progress_2015_to_2024.csv', index=False)
-    print("所有季後賽進程數據已合併保存")
+def main():
+    args = parse_args()
+    run(
+        seasons_to_fetch=args.seasons,
+        max_workers=args.workers,
+        refresh=args.refresh,
+        fetch_standings_data=not args.skip_standings,
+        fetch_playoff_data=not args.skip_playoffs
+    )
 
-print("\n數據抓取和合併完成!")
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,46 @@
+import argparse
 import requests
+import gzip
+import hashlib
+import threading
+import concurrent.futures
+import sqlite3
 from bs4 import BeautifulSoup, Comment
 import pandas as pd
+import numpy as np
 import json
 import os
 import re
 import time
-import random
 import logging
 import traceback
+import unicodedata
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+try:
+    from nba_api.stats.static import players as nba_static_players
+except ImportError:
+    nba_static_players = None
+
+# 姓名後綴：比對時忽略
+NAME_SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv', 'v'}
+
+# BR與NBA常用名不同的球員（標準化後的名稱 -> 統一名稱）
+NAME_ALIASES = {
+    'moe harkless': 'maurice harkless',
+    'taurean waller prince': 'taurean prince',
+    'wes iwundu': 'wesley iwundu',
+    'juancho hernangomez': 'juan hernangomez',
+    'willy hernangomez': 'guillermo hernangomez',
+    'svi mykhailiuk': 'sviatoslav mykhailiuk',
+    'mo bamba': 'mohamed bamba',
+    'nic claxton': 'nicolas claxton',
+    'patty mills': 'patrick mills',
+    'lou williams': 'louis williams',
+    'nene hilario': 'nene',
+}
 
 def setup_logging():
     """設定日誌系統"""
@@ -101,126 +133,612 @@ def get_br_team_code(nba_team_code, team_mapping):
             return br_code
     return nba_team_code  # 如果找不到對應，返回原始縮寫
 
-def get_team_players_from_br(br_team, year):
-    """從Basketball Reference取得特定球隊和年份的球員資料"""
-    logging.info(f"正在獲取 {br_team} 隊 {year} 賽季的球員資料...")
+def normalize_player_name(name):
+    """
+    標準化球員姓名：去除重音符號、標點與後綴 (Jr./III 等)，並套用常用名對照
     
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Referer': 'https://www.basketball-reference.com/'
+    例如 "Luka Dončić" -> "luka doncic"，"Kelly Oubre Jr." -> "kelly oubre"
+    """
+    if not name:
+        return ''
+    
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+    name = re.sub(r"[.'`’]", '', name)
+    name = re.sub(r'[^a-z0-9]+', ' ', name)
+    
+    tokens = name.split()
+    while len(tokens) > 1 and tokens[-1] in NAME_SUFFIXES:
+        tokens.pop()
+    
+    name = ' '.join(tokens)
+    return NAME_ALIASES.get(name, name)
+
+def build_nba_player_indexes(nba_players_data):
+    """
+    為NBA球員資料建立雜湊索引，所有查詢皆為 O(1)
+    
+    返回:
+    dict: {
+        'by_id': NBA ID -> 球員記錄列表（交易球員可能有多筆）,
+        'by_name': 標準化姓名 -> 球員記錄列表,
+        'by_season_team': (賽季, NBA球隊縮寫) -> 球員記錄列表,
+        'name_by_id': NBA ID -> 球員全名
     }
+    """
+    indexes = {'by_id': {}, 'by_name': {}, 'by_season_team': {}}
     
-    url = f"https://www.basketball-reference.com/teams/{br_team}/{year}.html"
+    for nba_player in nba_players_data or []:
+        indexes['by_id'].setdefault(str(nba_player.get('id')), []).append(nba_player)
+        indexes['by_name'].setdefault(normalize_player_name(nba_player.get('full_name')), []).append(nba_player)
+        season_team = (nba_player.get('season'), nba_player.get('team_abbreviation'))
+        indexes['by_season_team'].setdefault(season_team, []).append(nba_player)
     
+    indexes['name_by_id'] = build_id_name_index(nba_players_data)
+    return indexes
+
+def build_id_name_index(nba_players_data):
+    """
+    建立 NBA ID -> 球員全名 的索引
+    
+    以 nba_api 內建的靜態球員列表為基礎（不需網路請求），
+    再以本地 players_detailed 資料覆蓋，確保名稱與本地資料一致。
+    """
+    id_name_index = {}
+    
+    if nba_static_players is not None:
+        for static_player in nba_static_players.get_players():
+            id_name_index[str(static_player['id'])] = static_player['full_name']
+    else:
+        logging.warning("未安裝 nba_api，NBA ID 名稱索引只使用本地資料")
+    
+    for nba_player in nba_players_data or []:
+        if nba_player.get('id') is not None and nba_player.get('full_name'):
+            id_name_index[str(nba_player['id'])] = nba_player['full_name']
+    
+    return id_name_index
+
+def get_player_name(player_id, id_name_index):
+    """由索引取得NBA球員全名，索引中沒有時才請求NBA.com"""
+    name = id_name_index.get(str(player_id))
+    if name:
+        return name
+    
+    logging.info(f"索引中沒有NBA ID {player_id}，改為請求NBA.com")
+    name = get_player_name_from_nba(player_id)
+    if name:
+        id_name_index[str(player_id)] = name
+    return name
+
+def resolve_player_locally(player_name, nba_team, season, indexes):
+    """
+    以本地 players_detailed 資料解析BR球員的NBA ID
+    
+    先以標準化姓名比對；同名多人時再以賽季和球隊篩選。
+    只有在結果唯一時才返回，否則返回 (None, None)，交由BR球員頁面處理。
+    
+    返回:
+    tuple: (NBA ID, NBA全名)
+    """
+    candidates = indexes['by_name'].get(normalize_player_name(player_name), [])
+    
+    player_ids = {str(c.get('id')) for c in candidates}
+    if len(player_ids) > 1:
+        team_ids = {str(c.get('id')) for c in indexes['by_season_team'].get((season, nba_team), [])}
+        player_ids &= team_ids
+        candidates = [c for c in candidates if str(c.get('id')) in player_ids]
+    
+    if len(player_ids) != 1:
+        return None, None
+    
+    return player_ids.pop(), candidates[0].get('full_name')
+
+def resolve_nba_id(player, nba_team, season, indexes):
+    """
+    解析BR球員的NBA ID：優先使用本地資料，無法唯一確定時才請求BR球員頁面
+    
+    返回:
+    tuple: (NBA ID, NBA全名)
+    """
+    nba_id, nba_name = resolve_player_locally(player['full_name_in_br'], nba_team, season, indexes)
+    if nba_id:
+        logging.info(f"本地解析: {player['full_name_in_br']} -> {nba_name} (NBA ID: {nba_id})")
+        return nba_id, nba_name
+    
+    return get_nba_id_from_br_page(player['br_url'], indexes['name_by_id'])
+
+def get_html_parser():
+    """優先使用 lxml 解析器，未安裝時退回 html.parser"""
     try:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            logging.error(f"請求失敗，狀態碼: {response.status_code}, URL: {url}")
-            return []
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+HTML_PARSER = get_html_parser()
+
+# 薪資表格片段（表格可能在HTML註釋中，原始文字相同，直接擷取）
+SALARY_TABLE_PATTERN = re.compile(r'<table[^>]*\bid="salaries2".*?</table>', re.S)
+
+# 球員頁面中的NBA.com連結
+NBA_PLAYER_LINK_PATTERN = re.compile(r'href="[^"]*nba\.com/stats/player/(\d+)')
+
+# 賽季場均數據表格（聯盟頁面，列出該賽季所有球員的BR ID與球隊）
+SEASON_INDEX_TABLE_PATTERN = re.compile(r'<table[^>]*\bid="per_game_stats".*?</table>', re.S)
+
+def parse_salary_rows(salary_table, br_team):
+    """解析薪資表格中的球員列"""
+    players_data = []
+    for row in salary_table.find_all('tr')[1:]:  # 跳過表頭行
+        try:
+            player_cell = row.find('td', {'data-stat': 'player'})
+            if not player_cell or not player_cell.find('a'): continue
+            
+            player_link = player_cell.find('a')
+            player_name = player_link.text.strip()
+            player_url = player_link['href']
+            
+            br_id_match = re.search(r'/players/[a-z]/([a-z0-9]+)\.html', player_url)
+            if not br_id_match: continue
+            
+            br_id = br_id_match.group(1)
+            
+            # 提取薪資
+            salary_cell = row.find('td', {'data-stat': 'salary'})
+            salary = None
+            if salary_cell:
+                salary_text = re.sub(r'[$,]', '', salary_cell.text.strip())
+                try:
+                    salary = int(salary_text) if salary_text else None
+                except ValueError:
+                    pass
+            
+            players_data.append({
+                'full_name_in_br': player_name,
+                'id_in_br': br_id,
+                'br_url': f"https://www.basketball-reference.com{player_url}",
+                'salary': salary,
+                'br_team': br_team  # 保存BR的球隊縮寫
+            })
+        except Exception as e:
+            logging.error(f"處理球員行時出錯: {e}")
+    
+    return players_data
+
+def parse_team_salary_page_full(html, br_team):
+    """完整解析球隊頁面並尋找薪資表格（較慢，作為快速路徑失敗時的備援）"""
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # 尋找薪資表格（可能在HTML註釋中）
+    salary_table = None
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        if 'salaries2' in comment and 'table' in comment:
+            salary_table = BeautifulSoup(comment, 'html.parser').find('table', {'id': 'salaries2'})
+            if salary_table: break
+    
+    if not salary_table:
+        salary_table = soup.find('table', {'id': 'salaries2'})
+        if not salary_table:
+            return None
+    
+    return parse_salary_rows(salary_table, br_team)
+
+def parse_team_salary_page(html, br_team):
+    """
+    從球隊頁面擷取薪資表格
+    
+    只以正則擷取 salaries2 表格的片段再交給解析器，不解析整個頁面與所有註釋；
+    擷取失敗時退回完整解析。
+    
+    返回:
+    list: 球員資料列表；找不到薪資表格時返回 None
+    """
+    match = SALARY_TABLE_PATTERN.search(html)
+    if match:
+        salary_table = BeautifulSoup(match.group(0), HTML_PARSER).find('table')
+        if salary_table:
+            return parse_salary_rows(salary_table, br_team)
+    
+    return parse_team_salary_page_full(html, br_team)
+
+def parse_nba_id_full(html):
+    """完整解析球員頁面並尋找NBA.com連結（較慢，作為快速路徑失敗時的備援）"""
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # 尋找NBA.com連結
+    nba_link = soup.find('a', string=lambda text: text and 'Player Front' in text)
+    
+    if not nba_link:
+        # 嘗試另一種方式查找
+        for link in soup.find_all('a'):
+            if link.get('href') and 'nba.com/stats/player/' in link.get('href'):
+                nba_link = link
+                break
+    
+    if not nba_link:
+        return None
+    
+    nba_id_match = re.search(r'/player/(\d+)', nba_link.get('href'))
+    return nba_id_match.group(1) if nba_id_match else None
+
+def parse_nba_id_from_br_html(html):
+    """從球員頁面擷取NBA ID：直接以正則搜尋NBA.com連結，找不到時退回完整解析"""
+    match = NBA_PLAYER_LINK_PATTERN.search(html)
+    if match:
+        return match.group(1)
+    return parse_nba_id_full(html)
+
+def benchmark_br_parsing(pages_dir, repeat=3):
+    """
+    以已保存的BR頁面比較完整解析與快速擷取的耗時，並檢查兩者結果一致
+    
+    參數:
+    pages_dir (str): 存放 .html 或 .html.gz 頁面的目錄（例如 HTML_CACHE_DIR）
+    repeat (int): 每個頁面重複解析的次數
+    """
+    pages = []
+    for filename in sorted(os.listdir(pages_dir)):
+        if filename.endswith('.html'):
+            with open(os.path.join(pages_dir, filename), 'r', encoding='utf-8') as f:
+                pages.append((filename, f.read()))
+        elif filename.endswith('.html.gz'):
+            with gzip.open(os.path.join(pages_dir, filename), 'rt', encoding='utf-8') as f:
+                pages.append((filename, f.read()))
+    
+    if not pages:
+        logging.warning(f"{pages_dir} 中沒有可用的頁面")
+        return
+    
+    timings = {'full': 0.0, 'fast': 0.0}
+    mismatches = 0
+    for filename, html in pages:
+        if 'salaries2' in html:
+            parsers = {'full': lambda h: parse_team_salary_page_full(h, 'BEN'),
+                       'fast': lambda h: parse_team_salary_page(h, 'BEN')}
+        else:
+            parsers = {'full': parse_nba_id_full, 'fast': parse_nba_id_from_br_html}
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        results = {}
+        for name, parser in parsers.items():
+            start_time = time.perf_counter()
+            for _ in range(repeat):
+                results[name] = parser(html)
+            timings[name] += time.perf_counter() - start_time
         
-        # 尋找薪資表格（可能在HTML註釋中）
-        salary_table = None
-        for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
-            if 'salaries2' in comment and 'table' in comment:
-                salary_table = BeautifulSoup(comment, 'html.parser').find('table', {'id': 'salaries2'})
-                if salary_table: break
+        if results['full'] != results['fast']:
+            mismatches += 1
+            logging.warning(f"解析結果不一致: {filename}")
+    
+    count = len(pages) * repeat
+    full_ms = timings['full'] / count * 1000
+    fast_ms = timings['fast'] / count * 1000
+    logging.info(f"解析 {len(pages)} 個頁面 (解析器: {HTML_PARSER})：完整解析 {full_ms:.2f} ms/頁，"
+                 f"快速擷取 {fast_ms:.2f} ms/頁，加速 {full_ms / max(fast_ms, 1e-9):.1f} 倍，結果不一致 {mismatches} 頁")
+
+# BR頁面的原始HTML快取（gzip壓縮，以URL雜湊為鍵）
+HTML_CACHE_DIR = 'html_cache'
+HTML_CACHE_MAX_AGE = 7 * 24 * 3600  # 快取在此秒數內直接使用，超過後以 ETag/Last-Modified 重新驗證
+HTML_CACHE_OFFLINE = False  # 離線模式：只讀取快取，不發出任何請求
+REPARSE_FROM_CACHE = False  # 重新解析模式：離線讀取快取，並忽略已完成與多次失敗的標記
+
+class PageNotCachedError(Exception):
+    """離線模式下頁面沒有快取；呼叫端不應將對應的球隊或球員標記為已完成或失敗"""
+
+BR_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://www.basketball-reference.com/'
+}
+
+def get_html_cache_paths(url):
+    """返回URL對應的快取文件路徑：(壓縮HTML, 中繼資料)"""
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return (os.path.join(HTML_CACHE_DIR, f"{key}.html.gz"),
+            os.path.join(HTML_CACHE_DIR, f"{key}.json"))
+
+def load_cached_page(url):
+    """讀取快取的頁面，返回 (html, 中繼資料)；沒有快取時返回 (None, None)"""
+    html_path, meta_path = get_html_cache_paths(url)
+    if not os.path.exists(html_path) or not os.path.exists(meta_path):
+        return None, None
+    
+    try:
+        with gzip.open(html_path, 'rt', encoding='utf-8') as f:
+            html = f.read()
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return html, meta
+    except Exception as e:
+        logging.warning(f"讀取 {url} 的快取時出錯: {e}")
+        return None, None
+
+def save_cached_page(url, html, response):
+    """以原子方式保存頁面與 ETag/Last-Modified 中繼資料"""
+    os.makedirs(HTML_CACHE_DIR, exist_ok=True)
+    html_path, meta_path = get_html_cache_paths(url)
+    meta = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'fetched_at': time.time()
+    }
+    
+    try:
+        with gzip.open(html_path + '.tmp', 'wt', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(html_path + '.tmp', html_path)
         
-        if not salary_table:
-            salary_table = soup.find('table', {'id': 'salaries2'})
-            if not salary_table:
-                logging.warning(f"未找到{br_team}隊{year}賽季的薪資表格")
-                return []
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+    except Exception as e:
+        logging.warning(f"保存 {url} 的快取時出錯: {e}")
+
+def touch_cached_page(url, meta):
+    """伺服器回應 304 時更新快取的驗證時間"""
+    _, meta_path = get_html_cache_paths(url)
+    meta['fetched_at'] = time.time()
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+# 各主機的請求速率（每分鐘請求數）；BR 官方上限為每分鐘 20 次
+HOST_REQUESTS_PER_MINUTE = {
+    'www.basketball-reference.com': 20,
+}
+DEFAULT_REQUESTS_PER_MINUTE = 30
+BR_MAX_IN_FLIGHT = 2  # 每個主機同時進行中的請求上限
+MAX_RATE_LIMIT_RETRIES = 3  # 收到 429 後的最大重試次數
+DEFAULT_RETRY_AFTER = 60  # 429 沒有 Retry-After 時的等待秒數
+
+# 全局鎖，用於控制各主機的請求速率
+host_lock = threading.Lock()
+host_next_request_time = {}
+host_semaphores = {}
+
+def get_host_semaphore(host):
+    """取得主機的同時請求數限制"""
+    with host_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.Semaphore(BR_MAX_IN_FLIGHT)
+        return host_semaphores[host]
+
+def wait_for_host_slot(host):
+    """等待主機的下一個請求時段：所有線程共用同一主機的最小請求間隔"""
+    interval = 60.0 / HOST_REQUESTS_PER_MINUTE.get(host, DEFAULT_REQUESTS_PER_MINUTE)
+    with host_lock:
+        now = time.time()
+        slot = max(now, host_next_request_time.get(host, 0.0))
+        host_next_request_time[host] = slot + interval
+    if slot > now:
+        time.sleep(slot - now)
+
+def defer_host(host, delay):
+    """將主機的下一個請求時段延後 delay 秒（用於 Retry-After）"""
+    with host_lock:
+        host_next_request_time[host] = max(host_next_request_time.get(host, 0.0), time.time() + delay)
+
+def parse_retry_after(value):
+    """解析 Retry-After 標頭（秒數或 HTTP 日期），返回等待秒數"""
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    if value.strip().isdigit():
+        return int(value.strip())
+    try:
+        retry_time = parsedate_to_datetime(value)
+        return max(0.0, retry_time.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+def polite_get(url, headers):
+    """
+    按主機限速的 GET 請求
+    
+    每個主機依 HOST_REQUESTS_PER_MINUTE 間隔發出請求，同時最多 BR_MAX_IN_FLIGHT 個；
+    收到 429 時依 Retry-After 延後該主機的所有請求後重試。
+    """
+    host = urlparse(url).netloc
+    with get_host_semaphore(host):
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            wait_for_host_slot(host)
+            response = requests.get(url, headers=headers, timeout=30)
+            if response.status_code != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                return response
+            
+            delay = parse_retry_after(response.headers.get('Retry-After'))
+            logging.warning(f"{host} 回應 429，{delay:.0f} 秒後重試: {url}")
+            defer_host(host, delay)
+
+def fetch_br_page(url):
+    """
+    獲取BR頁面，優先使用本地快取
+    
+    - 快取在 HTML_CACHE_MAX_AGE 內：直接返回，不發出請求
+    - 快取過期：帶 If-None-Match / If-Modified-Since 重新驗證，304 時沿用快取
+    - 離線模式：只返回快取，沒有快取時拋出 PageNotCachedError
+    
+    返回:
+    tuple: (狀態碼, HTML)；請求失敗時 HTML 為 None
+    """
+    html, meta = load_cached_page(url)
+    
+    if HTML_CACHE_OFFLINE:
+        if html is None:
+            raise PageNotCachedError(url)
+        return 200, html
+    
+    if html is not None and time.time() - meta.get('fetched_at', 0) < HTML_CACHE_MAX_AGE:
+        return 200, html
+    
+    headers = dict(BR_HEADERS)
+    if html is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    
+    response = polite_get(url, headers)
+    
+    if response.status_code == 304 and html is not None:
+        touch_cached_page(url, meta)
+        return 200, html
+    
+    if response.status_code != 200:
+        return response.status_code, None
+    
+    save_cached_page(url, response.text, response)
+    return 200, response.text
+
+def get_team_players_from_br(br_team, year):
+    """從Basketball Reference取得特定球隊和年份的球員資料"""
+    logging.info(f"正在獲取 {br_team} 隊 {year} 賽季的球員資料...")
+    
+    url = f"https://www.basketball-reference.com/teams/{br_team}/{year}.html"
+    
+    try:
+        status_code, html = fetch_br_page(url)
+        if html is None:
+            logging.error(f"請求失敗，狀態碼: {status_code}, URL: {url}")
+            return []
         
-        players_data = []
-        for row in salary_table.find_all('tr')[1:]:  # 跳過表頭行
-            try:
-                player_cell = row.find('td', {'data-stat': 'player'})
-                if not player_cell or not player_cell.find('a'): continue
-                
-                player_link = player_cell.find('a')
-                player_name = player_link.text.strip()
-                player_url = player_link['href']
-                
-                br_id_match = re.search(r'/players/[a-z]/([a-z0-9]+)\.html', player_url)
-                if not br_id_match: continue
-                
-                br_id = br_id_match.group(1)
-                
-                # 提取薪資
-                salary_cell = row.find('td', {'data-stat': 'salary'})
-                salary = None
-                if salary_cell:
-                    salary_text = re.sub(r'[$,]', '', salary_cell.text.strip())
-                    try:
-                        salary = int(salary_text) if salary_text else None
-                    except ValueError:
-                        pass
-                
-                players_data.append({
-                    'full_name_in_br': player_name,
-                    'id_in_br': br_id,
-                    'br_url': f"https://www.basketball-reference.com{player_url}",
-                    'salary': salary,
-                    'br_team': br_team  # 保存BR的球隊縮寫
-                })
-            except Exception as e:
-                logging.error(f"處理球員行時出錯: {e}")
+        players_data = parse_team_salary_page(html, br_team)
+        if players_data is None:
+            logging.warning(f"未找到{br_team}隊{year}賽季的薪資表格")
+            return []
         
         logging.info(f"成功獲取 {br_team} 隊 {year} 賽季的 {len(players_data)} 名球員資料")
         return players_data
     
+    except PageNotCachedError:
+        raise
+    
     except Exception as e:
         logging.error(f"獲取 {br_team} 隊 {year} 賽季的球員資料時出錯: {e}")
         return []
 
-def get_nba_id_from_br_page(br_url):
-    """從Basketball Reference球員頁面獲取NBA ID"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Referer': 'https://www.basketball-reference.com/'
-    }
+def parse_season_index_page(html):
+    """
+    從BR賽季場均數據頁面擷取所有球員的 (BR ID, 姓名, 球隊)
+    
+    交易球員的合計列 (TOT / 2TM / 3TM ...) 會被略過，只保留各球隊的分列。
+    
+    返回:
+    list: 球員資料列表（salary 為 None）；找不到表格時返回 None
+    """
+    match = SEASON_INDEX_TABLE_PATTERN.search(html)
+    if not match:
+        return None
+    
+    table = BeautifulSoup(match.group(0), HTML_PARSER).find('table')
+    if not table:
+        return None
+    
+    players_data = []
+    seen = set()
+    for row in table.find_all('tr'):
+        player_cell = row.find('td', {'data-stat': ['player', 'name_display']})
+        team_cell = row.find('td', {'data-stat': ['team_id', 'team_name_abbr']})
+        if not player_cell or not team_cell or not player_cell.find('a'):
+            continue
+        
+        br_team = team_cell.text.strip()
+        if br_team == 'TOT' or re.fullmatch(r'\d+TM', br_team):
+            continue
+        
+        player_url = player_cell.find('a')['href']
+        br_id_match = re.search(r'/players/[a-z]/([a-z0-9]+)\.html', player_url)
+        if not br_id_match or (br_id_match.group(1), br_team) in seen:
+            continue
+        
+        seen.add((br_id_match.group(1), br_team))
+        players_data.append({
+            'full_name_in_br': player_cell.find('a').text.strip(),
+            'id_in_br': br_id_match.group(1),
+            'br_url': f"https://www.basketball-reference.com{player_url}",
+            'salary': None,
+            'br_team': br_team
+        })
+    
+    return players_data
+
+def get_season_players_from_br_index(year):
+    """
+    以一次請求從BR賽季場均數據頁面取得整個聯盟的球員名單
+    
+    返回:
+    dict: BR球隊縮寫 -> 球員資料列表
+    """
+    url = f"https://www.basketball-reference.com/leagues/NBA_{year}_per_game.html"
+    logging.info(f"正在從聯盟頁面獲取 {year} 賽季的球員名單...")
     
     try:
-        response = requests.get(br_url, headers=headers)
-        if response.status_code != 200:
-            logging.error(f"請求失敗，狀態碼: {response.status_code}, URL: {br_url}")
-            return None, None
+        status_code, html = fetch_br_page(url)
+        if html is None:
+            logging.error(f"請求失敗，狀態碼: {status_code}, URL: {url}")
+            return {}
         
-        soup = BeautifulSoup(response.text, 'html.parser')
+        players_data = parse_season_index_page(html)
+        if players_data is None:
+            logging.warning(f"未找到 {year} 賽季的聯盟球員表格")
+            return {}
         
-        # 尋找NBA.com連結
-        nba_link = soup.find('a', string=lambda text: text and 'Player Front' in text)
+        players_by_team = {}
+        for player in players_data:
+            players_by_team.setdefault(player['br_team'], []).append(player)
         
-        if not nba_link:
-            # 嘗試另一種方式查找
-            for link in soup.find_all('a'):
-                if link.get('href') and 'nba.com/stats/player/' in link.get('href'):
-                    nba_link = link
-                    break
+        logging.info(f"成功獲取 {year} 賽季 {len(players_by_team)} 支球隊共 {len(players_data)} 筆球員資料")
+        return players_by_team
+    
+    except PageNotCachedError:
+        raise
+    
+    except Exception as e:
+        logging.error(f"獲取 {year} 賽季的聯盟球員名單時出錯: {e}")
+        return {}
+
+def merge_team_salaries(index_players, br_team, year):
+    """
+    以球隊薪資頁面補上聯盟名單中球員的薪資；
+    只出現在薪資表格中的球員（例如未出賽）也一併加入
+    
+    返回:
+    tuple: (球員資料列表, 是否取得薪資表格)；薪資頁面請求失敗時球員的 salary 為 None
+    """
+    salary_players = get_team_players_from_br(br_team, year)
+    salaries = {player['id_in_br']: player for player in salary_players}
+    
+    players = []
+    for player in index_players:
+        salary_player = salaries.pop(player['id_in_br'], None)
+        players.append({**player, 'salary': salary_player['salary'] if salary_player else None})
+    
+    players.extend(salaries.values())
+    return players, bool(salary_players)
+
+def get_nba_id_from_br_page(br_url, id_name_index):
+    """從Basketball Reference球員頁面獲取NBA ID"""
+    try:
+        status_code, html = fetch_br_page(br_url)
+        if html is None:
+            logging.error(f"請求失敗，狀態碼: {status_code}, URL: {br_url}")
+            return None, None
         
-        if not nba_link:
+        nba_id = parse_nba_id_from_br_html(html)
+        if not nba_id:
             logging.warning(f"在{br_url}中未找到NBA.com連結")
             return None, None
         
-        nba_url = nba_link.get('href')
-        nba_id_match = re.search(r'/player/(\d+)', nba_url)
-        
-        if nba_id_match:
-            nba_id = nba_id_match.group(1)
-            nba_full_name = get_player_name_from_nba(nba_id)
-            return nba_id, nba_full_name
-        else:
-            logging.warning(f"無法從{nba_url}提取NBA ID")
-            return None, None
+        nba_full_name = get_player_name(nba_id, id_name_index)
+        return nba_id, nba_full_name
+    
+    except PageNotCachedError:
+        raise
     
     except Exception as e:
         logging.error(f"處理{br_url}時出錯: {e}")
         return None, None
 
 def get_player_name_from_nba(player_id):
-    """從NBA.com獲取球員全名"""
+    """從NBA.com獲取球員全名（僅在本地索引找不到時使用）"""
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
         'Referer': 'https://www.nba.com/'
@@ -229,7 +747,7 @@ def get_player_name_from_nba(player_id):
     url = f"https://www.nba.com/stats/player/{player_id}"
     
     try:
-        response = requests.get(url, headers=headers)
+        response = polite_get(url, headers)
         if response.status_code != 200:
             logging.warning(f"請求NBA.com失敗，狀態碼: {response.status_code}, URL: {url}")
             return None
@@ -253,60 +771,202 @@ def get_player_name_from_nba(player_id):
         logging.error(f"從NBA.com獲取球員{player_id}名稱時出錯: {e}")
         return None
 
-def find_nba_team_for_player(player_name, nba_players_data, season):
+def find_nba_team_for_player(player_name, indexes, season):
     """在NBA球員資料中尋找特定球員的隊伍資訊"""
     teams_info = []
     
-    if not nba_players_data:
-        return teams_info
+    for nba_player in indexes['by_name'].get(normalize_player_name(player_name), []):
+        # 檢查球員的球隊資訊
+        team_abbr = nba_player.get('team_abbreviation')
+        if team_abbr:
+            # 檢查這個球隊是否已經添加過
+            if not any(team['team'] == team_abbr for team in teams_info):
+                teams_info.append({
+                    'team': team_abbr,
+                    'player_id': nba_player.get('id')
+                })
+    
+    return teams_info
+
+def find_nba_teams_info(nba_id, nba_name, player_name, season, indexes):
+    """
+    查找球員在NBA資料中的隊伍資訊：有NBA ID時以ID索引查找，否則以姓名索引查找
     
-    # 標準化球員名稱以便比較
-    player_name_normalized = player_name.lower().strip()
+    返回:
+    tuple: (隊伍資訊列表, NBA全名)
+    """
+    nba_teams_info = []
     
-    for nba_player in nba_players_data:
-        nba_player_name = nba_player.get('full_name', '').lower().strip()
-        
-        # 如果找到匹配的球員
-        if nba_player_name == player_name_normalized:
-            # 檢查球員的球隊資訊
+    if nba_id:
+        # 如果有NBA ID，優先使用ID查找
+        for nba_player in indexes['by_id'].get(str(nba_id), []):
             team_abbr = nba_player.get('team_abbreviation')
-            if team_abbr:
-                # 檢查這個球隊是否已經添加過
-                if not any(team['team'] == team_abbr for team in teams_info):
-                    teams_info.append({
-                        'team': team_abbr,
-                        'player_id': nba_player.get('id')
-                    })
+            if team_abbr and not any(info['team'] == team_abbr for info in nba_teams_info):
+                nba_teams_info.append({
+                    'team': team_abbr,
+                    'player_id': nba_id
+                })
+            nba_name = nba_player.get('full_name')
     
-    return teams_info
+    # 如果沒有找到隊伍資訊，嘗試通過名稱匹配
+    if not nba_teams_info:
+        nba_teams_info = find_nba_team_for_player(player_name, indexes, season)
+    
+    return nba_teams_info, nba_name
+
+# 球員名單來源：'team' 逐隊讀取薪資頁面；'league' 每賽季只讀取一次聯盟頁面
+DISCOVERY_MODE = 'team'
+LEAGUE_INDEX_SALARIES = True  # 'league' 模式下是否仍以球隊薪資頁面補上薪資
+
+# 映射存儲：映射記錄、完成標記與失敗記錄（取代 mapping_progress.json）
+MAPPING_STORE_FILE = "mapping_store.sqlite"
+LEGACY_PROGRESS_FILE = "mapping_progress.json"
+MAPPING_COLUMNS = ['id', 'full_name', 'id_in_br', 'full_name_in_br', 'team', 'br_team', 'season', 'salary']
+EXPORT_CSV = True  # 執行結束時由存儲匯出各賽季與全部賽季的映射CSV
+
+def connect_mapping_store():
+    """連接映射存儲；首次建立時匯入舊的 mapping_progress.json"""
+    conn = sqlite3.connect(MAPPING_STORE_FILE, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute('''CREATE TABLE IF NOT EXISTS mappings (
+        id TEXT, full_name TEXT, id_in_br TEXT, full_name_in_br TEXT,
+        team TEXT, br_team TEXT, season TEXT, salary INTEGER,
+        PRIMARY KEY (season, id_in_br, br_team, team))''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mappings_id ON mappings (id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS completed_teams (year TEXT, team TEXT, PRIMARY KEY (year, team))")
+    conn.execute("CREATE TABLE IF NOT EXISTS completed_players (player_key TEXT PRIMARY KEY)")
+    conn.execute('''CREATE TABLE IF NOT EXISTS failed_players (
+        player_key TEXT PRIMARY KEY, player TEXT, error TEXT, retry_count INTEGER)''')
+    
+    if os.path.exists(LEGACY_PROGRESS_FILE) and conn.execute("SELECT COUNT(*) FROM mappings").fetchone()[0] == 0:
+        import_legacy_progress(conn)
+    
+    conn.commit()
+    return conn
+
+def import_legacy_progress(conn):
+    """將舊的 mapping_progress.json 匯入存儲"""
+    progress = load_file(LEGACY_PROGRESS_FILE, {})
+    
+    for year_mappings in progress.get("mappings", {}).values():
+        for mapping in year_mappings:
+            save_mapping(conn, mapping)
+    for year_str, teams in progress.get("completed_teams", {}).items():
+        for team in teams:
+            mark_team_completed(conn, year_str, team)
+    for player_key in progress.get("completed_players", {}):
+        mark_player_completed(conn, player_key)
+    for player_key, failure in progress.get("failed_players", {}).items():
+        record_failure(conn, player_key, failure.get("player"), failure.get("error"), failure.get("retry_count", 0))
+    
+    logging.info(f"已將 {LEGACY_PROGRESS_FILE} 匯入 {MAPPING_STORE_FILE}")
+
+def save_mapping(conn, mapping):
+    """以 (season, id_in_br, br_team, team) 為鍵 upsert 一筆映射記錄"""
+    values = [mapping.get(col) for col in MAPPING_COLUMNS]
+    values[0] = str(values[0]) if values[0] is not None else None
+    conn.execute(f'''INSERT INTO mappings ({', '.join(MAPPING_COLUMNS)})
+        VALUES ({', '.join('?' for _ in MAPPING_COLUMNS)})
+        ON CONFLICT (season, id_in_br, br_team, team) DO UPDATE SET
+        id = excluded.id, full_name = excluded.full_name,
+        full_name_in_br = excluded.full_name_in_br, salary = excluded.salary''', values)
+
+def delete_player_mappings(conn, season, id_in_br, br_team):
+    """刪除球員在某賽季某BR球隊下的所有映射記錄"""
+    conn.execute("DELETE FROM mappings WHERE season = ? AND id_in_br = ? AND br_team = ?", (season, id_in_br, br_team))
+
+def mark_team_completed(conn, year_str, team):
+    conn.execute("INSERT OR IGNORE INTO completed_teams VALUES (?, ?)", (year_str, team))
+
+def is_team_completed(conn, year_str, team):
+    return conn.execute("SELECT 1 FROM completed_teams WHERE year = ? AND team = ?", (year_str, team)).fetchone() is not None
+
+def mark_player_completed(conn, player_key):
+    """標記球員已完成，並清除其失敗記錄"""
+    conn.execute("INSERT OR IGNORE INTO completed_players VALUES (?)", (player_key,))
+    conn.execute("DELETE FROM failed_players WHERE player_key = ?", (player_key,))
+
+def is_player_completed(conn, player_key):
+    return conn.execute("SELECT 1 FROM completed_players WHERE player_key = ?", (player_key,)).fetchone() is not None
+
+def record_failure(conn, player_key, player, error, retry_count):
+    conn.execute('''INSERT INTO failed_players VALUES (?, ?, ?, ?)
+        ON CONFLICT (player_key) DO UPDATE SET
+        player = excluded.player, error = excluded.error, retry_count = excluded.retry_count''',
+        (player_key, json.dumps(player), error, retry_count))
+
+def get_retry_count(conn, player_key):
+    """返回球員的失敗次數；沒有失敗記錄時返回 None"""
+    row = conn.execute("SELECT retry_count FROM failed_players WHERE player_key = ?", (player_key,)).fetchone()
+    return row[0] if row else None
+
+def set_retry_count(conn, player_key, retry_count):
+    conn.execute("UPDATE failed_players SET retry_count = ? WHERE player_key = ?", (retry_count, player_key))
+
+def load_failed_players(conn):
+    """返回 {player_key: {"player": ..., "error": ..., "retry_count": ...}}"""
+    return {
+        player_key: {"player": json.loads(player) if player else None, "error": error, "retry_count": retry_count}
+        for player_key, player, error, retry_count in conn.execute("SELECT * FROM failed_players")
+    }
+
+def load_mappings(conn, season=None):
+    """按寫入順序讀取映射記錄（可指定賽季）"""
+    query = f"SELECT {', '.join(MAPPING_COLUMNS)} FROM mappings"
+    params = ()
+    if season:
+        query += " WHERE season = ?"
+        params = (season,)
+    rows = conn.execute(query + " ORDER BY rowid", params).fetchall()
+    return [dict(zip(MAPPING_COLUMNS, row)) for row in rows]
+
+def get_mapped_nba_ids(conn):
+    return {row[0] for row in conn.execute("SELECT DISTINCT id FROM mappings WHERE id IS NOT NULL")}
+
+def export_mapping_csvs(conn, seasons=None):
+    """由存儲匯出各賽季的映射CSV，以及所有賽季的 nba_br_player_mapping_all.csv"""
+    if seasons is None:
+        seasons = [row[0] for row in conn.execute("SELECT DISTINCT season FROM mappings ORDER BY season")]
+    
+    for season in seasons:
+        save_csv(load_mappings(conn, season), f"nba_br_player_mapping_{season}.csv")
+    
+    all_mappings = load_mappings(conn)
+    save_csv(all_mappings, "nba_br_player_mapping_all.csv")
+    return all_mappings
 
 def create_player_mapping(nba_teams, years, nba_players_data, save_interval=5):
-    """創建NBA和Basketball Reference球員ID對照表"""
-    # 載入進度
-    progress_file = "mapping_progress.json"
-    progress = load_file(progress_file, {
-        "completed_teams": {},
-        "completed_players": {},
-        "failed_players": {},
-        "mappings": {}
-    })
-    
-    # 初始化每個年份的映射
-    for year in years:
-        year_str = str(year)
-        if year_str not in progress["mappings"]:
-            progress["mappings"][year_str] = []
-        if year_str not in progress["completed_teams"]:
-            progress["completed_teams"][year_str] = []
+    """
+    創建NBA和Basketball Reference球員ID對照表
+    
+    每筆映射、完成標記與失敗記錄都以單行 upsert 寫入映射存儲，
+    每 save_interval 名球員提交一次交易，提交成本與已累積的映射數量無關。
+    """
+    conn = connect_mapping_store()
     
     # 獲取球隊縮寫對照表
     team_mapping = get_team_abbreviation_mapping()
     
+    # 建立本地索引，用於跳過BR球員頁面與NBA.com頁面請求
+    indexes = build_nba_player_indexes(nba_players_data)
+    
     try:
         for year in years:
             year_str = str(year)
             season_str = f"{year-1}-{str(year)[-2:]}"
-            csv_path = f"nba_br_player_mapping_{season_str}.csv"
+            
+            # 'league' 模式：一次請求取得整個聯盟的名單；
+            # 聯盟頁面取得失敗時，本賽季改用球隊薪資頁面
+            discovery_mode = DISCOVERY_MODE
+            if discovery_mode == 'league':
+                try:
+                    index_players_by_team = get_season_players_from_br_index(year)
+                except PageNotCachedError as e:
+                    logging.warning(f"離線模式下沒有 {year} 賽季聯盟頁面的快取: {e}")
+                    index_players_by_team = {}
+                if not index_players_by_team:
+                    logging.warning(f"無法從聯盟頁面取得 {year} 賽季的名單，改用球隊薪資頁面")
+                    discovery_mode = 'team'
             
             # 將NBA縮寫轉換為BR縮寫
             br_teams = []
@@ -318,158 +978,157 @@ def create_player_mapping(nba_teams, years, nba_players_data, save_interval=5):
             for br_team in br_teams:
                 nba_team = team_mapping.get(br_team, br_team)  # 獲取對應的NBA縮寫
                 
-                if nba_team in progress["completed_teams"].get(year_str, []):
+                if is_team_completed(conn, year_str, nba_team) and not REPARSE_FROM_CACHE:
                     logging.info(f"跳過已處理的隊伍: {nba_team} ({br_team}) {year}賽季")
                     continue
                 
                 logging.info(f"處理{nba_team}隊({br_team}) {year}賽季的數據...")
-                br_players = get_team_players_from_br(br_team, year)
+                salary_missing = False
+                try:
+                    if discovery_mode == 'league':
+                        br_players = index_players_by_team.get(br_team, [])
+                        if LEAGUE_INDEX_SALARIES:
+                            br_players, salaries_found = merge_team_salaries(br_players, br_team, year)
+                            salary_missing = not salaries_found
+                    else:
+                        br_players = get_team_players_from_br(br_team, year)
+                except PageNotCachedError as e:
+                    logging.warning(f"離線模式下沒有 {nba_team} 隊 {year} 賽季頁面的快取，跳過且不標記完成: {e}")
+                    continue
                 
-                player_count = 0
+                # 沒有取得任何球員時不標記完成，留待下次執行重新取得
+                if not br_players:
+                    logging.warning(f"未取得 {nba_team} 隊 ({br_team}) {year} 賽季的任何球員，跳過且不標記完成")
+                    continue
+                
+                # 薪資頁面失敗時仍寫入映射，但球員與隊伍都不標記完成，下次執行重新取得薪資
+                if salary_missing:
+                    logging.warning(f"未取得 {nba_team} 隊 ({br_team}) {year} 賽季的薪資，映射的薪資留空且不標記完成")
+                
+                # 篩選需要處理的球員
+                pending_players = []
                 for player in br_players:
                     player_key = f"{player['id_in_br']}_{br_team}_{year}"
                     
-                    # 檢查是否已處理
-                    if player_key in progress["completed_players"]:
+                    # 檢查是否已處理（重新解析模式下忽略）
+                    if is_player_completed(conn, player_key) and not REPARSE_FROM_CACHE:
                         logging.info(f"跳過已處理的球員: {player['full_name_in_br']} ({br_team})")
                         continue
                     
                     # 檢查是否多次失敗
-                    if player_key in progress["failed_players"]:
-                        retry_count = progress["failed_players"][player_key].get("retry_count", 0)
-                        if retry_count >= 3:  # 最多重試3次
+                    retry_count = get_retry_count(conn, player_key)
+                    if retry_count is not None:
+                        if retry_count >= 3 and not REPARSE_FROM_CACHE:  # 最多重試3次
                             logging.warning(f"跳過多次失敗的球員: {player['full_name_in_br']} ({br_team})")
                             continue
                         logging.info(f"重試之前失敗的球員: {player['full_name_in_br']} ({br_team}), 重試次數: {retry_count + 1}")
-                        progress["failed_players"][player_key]["retry_count"] = retry_count + 1
+                        set_retry_count(conn, player_key, retry_count + 1)
                     
-                    # 添加隨機延遲
-                    time.sleep(random.uniform(1, 3))
-                    logging.info(f"處理球員: {player['full_name_in_br']} (BR ID: {player['id_in_br']}, 球隊: {br_team})")
+                    pending_players.append((player, player_key, retry_count))
+                
+                # 並行解析NBA ID：請求速率與同時請求數由 polite_get 控制，
+                # 下載與解析在工作線程中重疊進行；存儲只在主線程中更新
+                player_count = 0
+                with concurrent.futures.ThreadPoolExecutor(max_workers=BR_MAX_IN_FLIGHT) as executor:
+                    future_to_player = {
+                        executor.submit(resolve_nba_id, player, nba_team, season_str, indexes): (player, player_key, retry_count)
+                        for player, player_key, retry_count in pending_players
+                    }
                     
-                    try:
-                        # 從BR頁面獲取NBA ID
-                        nba_id, nba_name = get_nba_id_from_br_page(player['br_url'])
+                    team_has_cache_miss = False
+                    for future in concurrent.futures.as_completed(future_to_player):
+                        player, player_key, previous_retry_count = future_to_player[future]
+                        logging.info(f"處理球員: {player['full_name_in_br']} (BR ID: {player['id_in_br']}, 球隊: {br_team})")
                         
-                        # 查找球員在NBA資料中的隊伍資訊
-                        nba_teams_info = []
-                        if nba_players_data:
-                            if nba_id:
-                                # 如果有NBA ID，優先使用ID查找
-                                for nba_player in nba_players_data:
-                                    if str(nba_player.get('id')) == str(nba_id):
-                                        team_abbr = nba_player.get('team_abbreviation')
-                                        if team_abbr and not any(info['team'] == team_abbr for info in nba_teams_info):
-                                            nba_teams_info.append({
-                                                'team': team_abbr,
-                                                'player_id': nba_id
-                                            })
-                                        nba_name = nba_player.get('full_name')
+                        try:
+                            # 獲取NBA ID（本地資料無法唯一確定時才請求BR頁面）
+                            try:
+                                nba_id, nba_name = future.result()
+                            except PageNotCachedError as e:
+                                # 快取缺失不是失敗：還原重試次數，不寫入映射也不標記完成
+                                logging.warning(f"離線模式下沒有 {player['full_name_in_br']} 球員頁面的快取，跳過: {e}")
+                                if previous_retry_count is not None:
+                                    set_retry_count(conn, player_key, previous_retry_count)
+                                team_has_cache_miss = True
+                                continue
                             
-                            # 如果沒有找到隊伍資訊，嘗試通過名稱匹配
+                            # 查找球員在NBA資料中的隊伍資訊
+                            nba_teams_info, nba_name = find_nba_teams_info(
+                                nba_id, nba_name, player['full_name_in_br'], season_str, indexes
+                            )
+                            
+                            # 如果沒有找到隊伍資訊，使用BR的隊伍資訊
                             if not nba_teams_info:
-                                nba_teams_info = find_nba_team_for_player(
-                                    player['full_name_in_br'], 
-                                    nba_players_data, 
-                                    season_str
-                                )
-                        
-                        # 如果沒有找到隊伍資訊，使用BR的隊伍資訊
-                        if not nba_teams_info:
-                            nba_teams_info = [{
-                                'team': nba_team,  # 使用NBA縮寫
-                                'player_id': nba_id
-                            }]
-                        
-                        # 為每個隊伍創建一個映射記錄
-                        for team_info in nba_teams_info:
-                            mapping = {
-                                'id': nba_id,
-                                'full_name': nba_name if nba_name else "未知",
-                                'id_in_br': player['id_in_br'],
-                                'full_name_in_br': player['full_name_in_br'],
-                                'team': team_info['team'],  # 使用NBA縮寫
-                                'br_team': br_team,  # 保存BR縮寫以便參考
-                                'season': season_str,
-                                'salary': player.get('salary')
-                            }
+                                nba_teams_info = [{
+                                    'team': nba_team,  # 使用NBA縮寫
+                                    'player_id': nba_id
+                                }]
                             
-                            progress["mappings"][year_str].append(mapping)
-                        
-                        progress["completed_players"][player_key] = True
-                        if player_key in progress["failed_players"]:
-                            del progress["failed_players"][player_key]
-                        
-                        logging.info(f"映射成功: {player['full_name_in_br']} -> {nba_name} (NBA ID: {nba_id}), 隊伍: {[info['team'] for info in nba_teams_info]}")
-                        
-                        player_count += 1
+                            # 為每個隊伍創建一個映射記錄（先清除該球員舊的映射，重新解析時不留下過時的記錄）
+                            delete_player_mappings(conn, season_str, player['id_in_br'], br_team)
+                            for team_info in nba_teams_info:
+                                mapping = {
+                                    'id': nba_id,
+                                    'full_name': nba_name if nba_name else "未知",
+                                    'id_in_br': player['id_in_br'],
+                                    'full_name_in_br': player['full_name_in_br'],
+                                    'team': team_info['team'],  # 使用NBA縮寫
+                                    'br_team': br_team,  # 保存BR縮寫以便參考
+                                    'season': season_str,
+                                    'salary': player.get('salary')
+                                }
+                                
+                                save_mapping(conn, mapping)
+                            
+                            if not salary_missing:
+                                mark_player_completed(conn, player_key)
+                            
+                            logging.info(f"映射成功: {player['full_name_in_br']} -> {nba_name} (NBA ID: {nba_id}), 隊伍: {[info['team'] for info in nba_teams_info]}")
+                            
+                            player_count += 1
+                            
+                            # 每處理一定數量的球員，提交一次
+                            if player_count % save_interval == 0:
+                                conn.commit()
+                                logging.info(f"已處理 {player_count} 名球員，保存進度")
                         
-                        # 每處理一定數量的球員，保存進度和當前年份的CSV
-                        if player_count % save_interval == 0:
-                            save_file(progress, progress_file)
-                            save_csv(progress["mappings"][year_str], csv_path)
-                            logging.info(f"已處理 {player_count} 名球員，保存進度和CSV")
-                    
-                    except Exception as e:
-                        logging.error(f"處理球員 {player['full_name_in_br']} ({br_team}) 時出錯: {e}")
-                        progress["failed_players"][player_key] = {
-                            "player": player,
-                            "error": str(e),
-                            "retry_count": progress["failed_players"].get(player_key, {}).get("retry_count", 0) + 1
-                        }
-                
-                # 標記該隊伍為已完成
-                progress["completed_teams"].setdefault(year_str, []).append(nba_team)
+                        except Exception as e:
+                            logging.error(f"處理球員 {player['full_name_in_br']} ({br_team}) 時出錯: {e}")
+                            retry_count = get_retry_count(conn, player_key)
+                            record_failure(conn, player_key, player, str(e), (retry_count or 0) + 1)
                 
-                # 保存進度和當前年份的CSV
-                save_file(progress, progress_file)
-                save_csv(progress["mappings"][year_str], csv_path)
+                # 標記該隊伍為已完成（有球員頁面快取缺失或薪資頁面失敗時不標記，留待下次執行補齊）
+                if not team_has_cache_miss and not salary_missing:
+                    mark_team_completed(conn, year_str, nba_team)
+                conn.commit()
                 
                 logging.info(f"完成處理 {nba_team} 隊 ({br_team}) {year} 賽季的 {player_count} 名球員")
-                time.sleep(random.uniform(3, 5))
-            
-            # 年份處理完成後，確保保存該年份的CSV
-            save_csv(progress["mappings"][year_str], csv_path)
-            logging.info(f"已將{season_str}賽季的球員映射保存至{csv_path}")
     
     except Exception as e:
         logging.error(f"創建球員映射時出錯: {e}")
     
     finally:
         # 保存最終進度
-        save_file(progress, progress_file)
-        
-        # 合併所有年份的映射並保存
-        all_mappings = []
-        for year_mappings in progress["mappings"].values():
-            all_mappings.extend(year_mappings)
-        
-        save_csv(all_mappings, "nba_br_player_mapping_all.csv")
-        logging.info(f"已將所有賽季的球員映射保存至nba_br_player_mapping_all.csv")
-    
-    return all_mappings
+        conn.commit()
+        conn.close()
 
 def retry_failed_players(nba_players_data):
     """重試之前失敗的球員"""
-    progress_file = "mapping_progress.json"
-    progress = load_file(progress_file, {
-        "completed_teams": {},
-        "completed_players": {},
-        "failed_players": {},
-        "mappings": {}
-    })
+    conn = connect_mapping_store()
     
     team_mapping = get_team_abbreviation_mapping()
-    failed_players = progress["failed_players"]
+    indexes = build_nba_player_indexes(nba_players_data)
+    failed_players = load_failed_players(conn)
     
     if not failed_players:
         logging.info("沒有失敗的球員需要重試")
+        conn.close()
         return
     
     logging.info(f"開始重試 {len(failed_players)} 個失敗的球員")
     
     retry_count = 0
-    for player_key, player_data in list(failed_players.items()):
+    for player_key, player_data in failed_players.items():
         player = player_data.get("player")
         if not player:
             continue
@@ -481,7 +1140,6 @@ def retry_failed_players(nba_players_data):
         
         br_team = parts[1]
         year = int(parts[2])
-        year_str = str(year)
         season_str = f"{year-1}-{str(year)[-2:]}"
         
         # 獲取NBA隊伍縮寫
@@ -490,33 +1148,17 @@ def retry_failed_players(nba_players_data):
         logging.info(f"重試球員: {player['full_name_in_br']} (BR ID: {player['id_in_br']}, 球隊: {br_team})")
         
         try:
-            time.sleep(random.uniform(1, 3))
-            
-            # 從BR頁面獲取NBA ID
-            nba_id, nba_name = get_nba_id_from_br_page(player['br_url'])
+            # 獲取NBA ID（本地資料無法唯一確定時才請求BR頁面）
+            try:
+                nba_id, nba_name = resolve_nba_id(player, nba_team, season_str, indexes)
+            except PageNotCachedError as e:
+                logging.warning(f"離線模式下沒有 {player['full_name_in_br']} 球員頁面的快取，跳過: {e}")
+                continue
             
             # 查找球員在NBA資料中的隊伍資訊
-            nba_teams_info = []
-            if nba_players_data:
-                if nba_id:
-                    # 如果有NBA ID，優先使用ID查找
-                    for nba_player in nba_players_data:
-                        if str(nba_player.get('id')) == str(nba_id):
-                            team_abbr = nba_player.get('team_abbreviation')
-                            if team_abbr and not any(info['team'] == team_abbr for info in nba_teams_info):
-                                nba_teams_info.append({
-                                    'team': team_abbr,
-                                    'player_id': nba_id
-                                })
-                            nba_name = nba_player.get('full_name')
-                
-                # 如果沒有找到隊伍資訊，嘗試通過名稱匹配
-                if not nba_teams_info:
-                    nba_teams_info = find_nba_team_for_player(
-                        player['full_name_in_br'], 
-                        nba_players_data, 
-                        season_str
-                    )
+            nba_teams_info, nba_name = find_nba_teams_info(
+                nba_id, nba_name, player['full_name_in_br'], season_str, indexes
+            )
             
             # 如果沒有找到隊伍資訊，使用BR的隊伍資訊
             if not nba_teams_info:
@@ -526,6 +1168,7 @@ def retry_failed_players(nba_players_data):
                 }]
             
             # 為每個隊伍創建一個映射記錄
+            delete_player_mappings(conn, season_str, player['id_in_br'], br_team)
             for team_info in nba_teams_info:
                 mapping = {
                     'id': nba_id,
@@ -538,34 +1181,25 @@ def retry_failed_players(nba_players_data):
                     'salary': player.get('salary')
                 }
                 
-                if year_str in progress["mappings"]:
-                    progress["mappings"][year_str].append(mapping)
-                else:
-                    progress["mappings"][year_str] = [mapping]
+                save_mapping(conn, mapping)
             
-            progress["completed_players"][player_key] = True
-            del failed_players[player_key]
+            mark_player_completed(conn, player_key)
             
             logging.info(f"重試成功: {player['full_name_in_br']} -> {nba_name} (NBA ID: {nba_id}), 隊伍: {[info['team'] for info in nba_teams_info]}")
             
             retry_count += 1
             
-            # 每重試5個球員，保存進度和CSV
+            # 每重試5個球員，提交一次
             if retry_count % 5 == 0:
-                save_file(progress, progress_file)
-                for year in progress["mappings"]:
-                    season = f"{int(year)-1}-{year[-2:]}"
-                    save_csv(progress["mappings"][year], f"nba_br_player_mapping_{season}.csv")
+                conn.commit()
                 logging.info(f"已重試 {retry_count} 名球員，保存進度")
         
         except Exception as e:
             logging.error(f"重試球員 {player['full_name_in_br']} ({br_team}) 時出錯: {e}")
     
-    # 保存最終進度和CSV
-    save_file(progress, progress_file)
-    for year in progress["mappings"]:
-        season = f"{int(year)-1}-{year[-2:]}"
-        save_csv(progress["mappings"][year], f"nba_br_player_mapping_{season}.csv")
+    # 保存最終進度
+    conn.commit()
+    conn.close()
     
     logging.info(f"完成重試 {retry_count} 名球員")
 
@@ -575,17 +1209,12 @@ def check_missing_players(nba_players_data):
         logging.warning("沒有NBA球員資料可供比對")
         return
     
-    progress_file = "mapping_progress.json"
-    progress = load_file(progress_file, {"mappings": {}})
-    
     # 獲取已映射的NBA ID
-    mapped_nba_ids = set()
-    for year_mappings in progress["mappings"].values():
-        for mapping in year_mappings:
-            if mapping.get('id'):
-                mapped_nba_ids.add(str(mapping['id']))
+    conn = connect_mapping_store()
+    mapped_nba_ids = get_mapped_nba_ids(conn)
+    conn.close()
     
-    # 檢查缺失的球員
+    # 檢查缺失的球員：依原始資料順序，以已映射ID集合判斷，輸出順序固定
     missing_players = []
     for nba_player in nba_players_data:
         if str(nba_player.get('id')) not in mapped_nba_ids:
@@ -604,16 +1233,147 @@ def check_missing_players(nba_players_data):
     else:
         logging.info("沒有發現缺失的NBA球員")
 
+# 模糊比對：候選分數下限與每名球員保留的候選數
+FUZZY_MIN_SCORE = 0.5
+FUZZY_TOP_K = 3
+
+def name_ngrams(name, n=3):
+    """返回姓名（前後加空格）的字元 n-gram 集合"""
+    padded = f" {name} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+def build_ngram_matrix(names, vocab):
+    """以 n-gram 詞彙表將姓名轉為 0/1 矩陣（每列一個姓名）"""
+    matrix = np.zeros((len(names), len(vocab)), dtype=np.float32)
+    for row, name in enumerate(names):
+        matrix[row, [vocab[gram] for gram in name_ngrams(name)]] = 1.0
+    return matrix
+
+def fuzzy_match_players(br_records, nba_records, top_k=FUZZY_TOP_K, min_score=FUZZY_MIN_SCORE):
+    """
+    批次模糊比對BR球員與NBA球員
+    
+    以 (賽季, 球隊, 姓氏首字母) 分區，每個分區內以矩陣運算一次計算所有配對的
+    三字元 Dice 相似度；同隊分區內沒有候選的球員，再於 (賽季, 姓氏首字母) 分區中比對
+    （處理交易球員）。
+    
+    參數:
+    br_records (list): 含 full_name_in_br, season, team 的BR球員記錄
+    nba_records (list): 含 id, full_name, season, team_abbreviation 的NBA球員記錄
+    
+    返回:
+    list: 候選列表，每名BR球員最多 top_k 筆，依分數由高到低排名
+    """
+    if not br_records or not nba_records:
+        return []
+    
+    br_names = [normalize_player_name(r.get('full_name_in_br')) for r in br_records]
+    nba_names = [normalize_player_name(r.get('full_name')) for r in nba_records]
+    
+    vocab = {}
+    for name in br_names + nba_names:
+        for gram in name_ngrams(name):
+            vocab.setdefault(gram, len(vocab))
+    
+    br_matrix = build_ngram_matrix(br_names, vocab)
+    nba_matrix = build_ngram_matrix(nba_names, vocab)
+    br_sizes = br_matrix.sum(axis=1)
+    nba_sizes = nba_matrix.sum(axis=1)
+    
+    def initial(name):
+        tokens = name.split()
+        return tokens[-1][0] if tokens else ''
+    
+    # 建立NBA球員的分區
+    team_blocks, season_blocks = {}, {}
+    for col, (record, name) in enumerate(zip(nba_records, nba_names)):
+        team_blocks.setdefault((record.get('season'), record.get('team_abbreviation'), initial(name)), []).append(col)
+        season_blocks.setdefault((record.get('season'), initial(name)), []).append(col)
+    
+    # BR球員依同隊分區分組
+    br_groups = {}
+    for row, (record, name) in enumerate(zip(br_records, br_names)):
+        br_groups.setdefault((record.get('season'), record.get('team'), initial(name)), []).append(row)
+    
+    candidates = []
+    
+    def rank_block(rows, cols, block):
+        """在一個分區內計算相似度並輸出候選，返回有候選的BR球員列"""
+        rows, cols = np.array(rows), np.array(cols)
+        overlap = br_matrix[rows] @ nba_matrix[cols].T
+        scores = 2 * overlap / np.maximum(br_sizes[rows][:, None] + nba_sizes[cols][None, :], 1)
+        
+        matched = set()
+        order = np.argsort(-scores, axis=1)[:, :top_k]
+        for i, row in enumerate(rows):
+            rank = 0
+            for j in order[i]:
+                if scores[i, j] < min_score:
+                    break
+                rank += 1
+                nba_record = nba_records[cols[j]]
+                candidates.append({
+                    'id_in_br': br_records[row].get('id_in_br'),
+                    'full_name_in_br': br_records[row].get('full_name_in_br'),
+                    'season': br_records[row].get('season'),
+                    'team': br_records[row].get('team'),
+                    'rank': rank,
+                    'candidate_id': nba_record.get('id'),
+                    'candidate_full_name': nba_record.get('full_name'),
+                    'candidate_team': nba_record.get('team_abbreviation'),
+                    'confidence': round(float(scores[i, j]), 4),
+                    'block': block
+                })
+            if rank:
+                matched.add(int(row))
+        return matched
+    
+    for (season, team, name_initial), rows in br_groups.items():
+        cols = team_blocks.get((season, team, name_initial), [])
+        matched = rank_block(rows, cols, 'team') if cols else set()
+        
+        # 同隊沒有候選時，放寬到同賽季的所有球隊
+        remaining = [row for row in rows if row not in matched]
+        cols = season_blocks.get((season, name_initial), [])
+        if remaining and cols:
+            rank_block(remaining, cols, 'season')
+    
+    return candidates
+
+def match_unmatched_players(nba_players_data, season_str):
+    """
+    對映射中沒有NBA ID的BR球員，與尚未映射的NBA球員進行模糊比對，
+    候選結果保存到 fuzzy_match_candidates_{賽季}.csv，不發出任何請求
+    """
+    conn = connect_mapping_store()
+    unmatched = [m for m in load_mappings(conn, season_str) if m.get('id') is None]
+    mapped_nba_ids = get_mapped_nba_ids(conn)
+    conn.close()
+    
+    if not unmatched:
+        logging.info(f"{season_str} 賽季沒有需要模糊比對的球員")
+        return []
+    
+    unmapped_nba = [record for record in nba_players_data if str(record.get('id')) not in mapped_nba_ids]
+    
+    start_time = time.perf_counter()
+    candidates = fuzzy_match_players(unmatched, unmapped_nba)
+    elapsed = time.perf_counter() - start_time
+    
+    matched_count = len({(c['id_in_br'], c['team']) for c in candidates})
+    logging.info(f"模糊比對 {len(unmatched)} 名BR球員與 {len(unmapped_nba)} 名NBA球員，"
+                 f"{matched_count} 名有候選，耗時 {elapsed:.3f} 秒")
+    
+    if candidates:
+        save_csv(candidates, f"fuzzy_match_candidates_{season_str}.csv")
+    return candidates
+
 def generate_final_report():
     """生成最終報告，包括統計信息"""
     try:
-        progress_file = "mapping_progress.json"
-        progress = load_file(progress_file, {"mappings": {}})
-        
-        # 合併所有年份的映射
-        all_mappings = []
-        for year_mappings in progress["mappings"].values():
-            all_mappings.extend(year_mappings)
+        conn = connect_mapping_store()
+        all_mappings = load_mappings(conn)
+        conn.close()
         
         # 計算統計數據
         total_mappings = len(all_mappings)
@@ -661,11 +1421,50 @@ def generate_final_report():
     except Exception as e:
         logging.error(f"生成最終報告時出錯: {e}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='建立NBA與Basketball Reference球員ID對照表')
+    parser.add_argument('--benchmark-pages', metavar='DIR',
+                        help='只比較已保存BR頁面的解析耗時，不執行映射')
+    parser.add_argument('--offline', action='store_true',
+                        help='只使用本地HTML快取，不發出任何BR請求；沒有快取的頁面跳過且不標記完成')
+    parser.add_argument('--reparse', action='store_true',
+                        help='以本地HTML快取重新解析所有球隊與球員（隱含 --offline，忽略已完成標記）')
+    parser.add_argument('--rate', type=float, default=HOST_REQUESTS_PER_MINUTE['www.basketball-reference.com'],
+                        help='BR每分鐘請求數上限')
+    parser.add_argument('--max-in-flight', type=int, default=BR_MAX_IN_FLIGHT,
+                        help='每個主機同時進行中的請求上限')
+    parser.add_argument('--discovery', choices=['team', 'league'], default=DISCOVERY_MODE,
+                        help="球員名單來源：team 逐隊讀取薪資頁面；league 每賽季讀取一次聯盟頁面")
+    parser.add_argument('--no-salaries', action='store_true',
+                        help="league 模式下不讀取球隊薪資頁面（salary 欄位留空）")
+    parser.add_argument('--export-only', action='store_true',
+                        help='只由映射存儲匯出CSV，不執行映射')
+    return parser.parse_args()
+
 def main():
+    global HTML_CACHE_OFFLINE, REPARSE_FROM_CACHE, BR_MAX_IN_FLIGHT, DISCOVERY_MODE, LEAGUE_INDEX_SALARIES
+    args = parse_args()
+    REPARSE_FROM_CACHE = args.reparse
+    DISCOVERY_MODE = args.discovery
+    LEAGUE_INDEX_SALARIES = not args.no_salaries
+    HTML_CACHE_OFFLINE = args.offline or args.reparse
+    BR_MAX_IN_FLIGHT = args.max_in_flight
+    HOST_REQUESTS_PER_MINUTE['www.basketball-reference.com'] = args.rate
+    
     # 設定日誌
     log_file = setup_logging()
     logging.info(f"開始執行，日誌保存在 {log_file}")
     
+    if args.benchmark_pages:
+        benchmark_br_parsing(args.benchmark_pages)
+        return
+    
+    if args.export_only:
+        conn = connect_mapping_store()
+        export_mapping_csvs(conn)
+        conn.close()
+        return
+    
     # NBA球隊縮寫列表 (使用NBA官方縮寫)
     nba_teams = [
         'ATL', 'BOS', 'BKN', 'CHA', 'CHI', 'CLE', 'DAL', 'DEN', 'DET', 'GSW',
@@ -706,6 +1505,16 @@ def main():
         
         # 檢查該賽季缺失的球員
         check_missing_players(nba_players_data)
+        
+        # 模糊比對仍未匹配的球員
+        match_unmatched_players(nba_players_data, season_str)
+    
+    # 由映射存儲匯出CSV
+    if EXPORT_CSV:
+        conn = connect_mapping_store()
+        export_mapping_csvs(conn)
+        conn.close()
+        logging.info("已將所有賽季的球員映射保存至nba_br_player_mapping_all.csv")
     
     # 生成最終報告
     generate_final_report()